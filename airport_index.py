@@ -0,0 +1,164 @@
+"""
+In-memory airport lookup index
+
+The AIRPORT table is small and rarely changes, so it is loaded once into
+memory and refreshed every AIRPORT_INDEX_REFRESH_SECONDS. Flight search
+resolves the user's text ("newark", "EWR", "york") to a set of airport codes
+here and then filters FLIGHT with an indexable IN (...) predicate instead of
+LIKE '%...%' scans joined to AIRPORT. The same index backs the autocomplete
+endpoint of the search form.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from db_config import env_int
+
+logger = logging.getLogger(__name__)
+
+# Oracle rejects IN lists longer than this
+IN_LIST_LIMIT = 1000
+
+# Ranks used to order autocomplete suggestions (lower is better)
+EXACT_CODE, CODE_PREFIX, CITY_PREFIX, WORD_PREFIX, SUBSTRING = range(5)
+
+
+class AirportIndex:
+    """Code/city lookup over the AIRPORT table; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.refresh_seconds = 300
+        self.loaded_at = None
+        self._airports = {}       # code -> {'code', 'city', 'country'}
+        self._keys = []           # sorted (key, rank, code) for prefix lookups
+        self._haystack = []       # (code_lower, city_lower, code) for substring lookups
+        self._match_cache = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AIRPORT_INDEX_REFRESH_SECONDS',
+                              env_int('AIRPORT_INDEX_REFRESH_SECONDS', 300))
+        self.app = app
+        self.refresh_seconds = app.config['AIRPORT_INDEX_REFRESH_SECONDS']
+
+    # -- Loading -----------------------------------------------------------
+
+    def load(self, airports):
+        """Build the index from Airport rows (or anything with code/city/country)"""
+        by_code = {}
+        keys = []
+        haystack = []
+        for airport in airports:
+            code = airport.airport_code.upper()
+            city = airport.city or ''
+            by_code[code] = {'code': code, 'city': city, 'country': airport.country}
+
+            city_lower = city.lower()
+            keys.append((code.lower(), CODE_PREFIX, code))
+            keys.append((city_lower, CITY_PREFIX, code))
+            for word in city_lower.split()[1:]:
+                keys.append((word, WORD_PREFIX, code))
+            haystack.append((code.lower(), city_lower, code))
+        keys.sort()
+
+        with self._lock:
+            self._airports = by_code
+            self._keys = keys
+            self._haystack = haystack
+            self._match_cache = {}
+            self.loaded_at = time.monotonic()
+        logger.info('Airport index loaded: %d airports', len(by_code))
+
+    def refresh(self):
+        """Reload the index from the AIRPORT table"""
+        from models import Airport
+        with self.app.app_context():
+            self.load(Airport.query.all())
+
+    def ensure_fresh(self):
+        """Load on first use and reload once the refresh interval has passed"""
+        if self.loaded_at is None:
+            with self._refresh_lock:
+                if self.loaded_at is None:
+                    self.refresh()
+        elif time.monotonic() - self.loaded_at > self.refresh_seconds:
+            # One thread reloads; the others keep using the current index meanwhile
+            if self._refresh_lock.acquire(blocking=False):
+                try:
+                    self.refresh()
+                finally:
+                    self._refresh_lock.release()
+
+    def warm_up(self):
+        """Load at startup; a database that is not reachable yet is retried on first use"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning('Airport index not loaded at startup: %s', e)
+
+    # -- Lookups -----------------------------------------------------------
+
+    def _ranked(self, text):
+        """{code: best rank} for every airport whose code or city matches text"""
+        text = text.strip().lower()
+        ranks = {}
+
+        # Prefix matches on code, city and city words via binary search
+        keys = self._keys
+        i = bisect.bisect_left(keys, (text,))
+        while i < len(keys) and keys[i][0].startswith(text):
+            key, rank, code = keys[i]
+            if rank == CODE_PREFIX and key == text:
+                rank = EXACT_CODE
+            if rank < ranks.get(code, SUBSTRING + 1):
+                ranks[code] = rank
+            i += 1
+
+        # Substring matches anywhere in the code or city (same semantics as the old ILIKE)
+        for code_lower, city_lower, code in self._haystack:
+            if code not in ranks and (text in code_lower or text in city_lower):
+                ranks[code] = SUBSTRING
+        return ranks
+
+    def match(self, text):
+        """Set of airport codes matching text by code or city"""
+        self.ensure_fresh()
+        key = text.strip().lower()
+        codes = self._match_cache.get(key)
+        if codes is None:
+            codes = frozenset(self._ranked(key))
+            if len(self._match_cache) >= 1024:
+                self._match_cache.clear()
+            self._match_cache[key] = codes
+        return codes
+
+    def suggest(self, text, limit=10):
+        """Best matches for autocomplete: exact code, then code/city prefixes, then substrings"""
+        self.ensure_fresh()
+        if not text.strip():
+            return []
+        ranks = self._ranked(text)
+        best = sorted(ranks, key=lambda code: (ranks[code], code))[:limit]
+        return [self._airports[code] for code in best]
+
+    def get(self, code):
+        self.ensure_fresh()
+        return self._airports.get(code.upper())
+
+
+def codes_filter(column, codes):
+    """column IN (codes), split into chunks of IN_LIST_LIMIT for Oracle"""
+    from sqlalchemy import or_
+    codes = sorted(codes)
+    if len(codes) <= IN_LIST_LIMIT:
+        return column.in_(codes)
+    return or_(*(column.in_(codes[i:i + IN_LIST_LIMIT])
+                 for i in range(0, len(codes), IN_LIST_LIMIT)))
+
+
+airport_index = AirportIndex()
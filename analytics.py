@@ -0,0 +1,217 @@
+"""
+Sales analytics
+
+FLIGHT_STATS keeps one summary row per flight: capacity, seats sold (ACTIVE
+tickets), seats cancelled, booked revenue and paid revenue. reserve() and
+cancel_ticket() update the flight's row in the same transaction as the ticket
+change, with relative UPDATEs (SEATS_SOLD = SEATS_SOLD + :n), so reports
+never aggregate TICKET, PAYMENT or TICKETCHANGE. Route and airline figures
+are rolled up from FLIGHT_STATS at report time; it has one row per flight, so
+that stays cheap, and bookings of different flights never contend for a
+shared per-airline row.
+
+A plain table is used on both backends: an Oracle fast-refresh materialized
+view over TICKET would need materialized view logs and a refresh after every
+booking, while this row is updated in the booking transaction anyway.
+
+    flask --app app analytics rebuild     # recompute every row (e.g. after a bulk load)
+"""
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Aircraft, Airline, Flight, FlightStats, Payment, Ticket
+
+
+def stats_rows(flight_numbers=None):
+    """FlightStats rows computed from FLIGHT, AIRCRAFT, TICKET and PAYMENT"""
+    tickets = db.session.query(
+        Ticket.flight_number.label('flight_number'),
+        db.func.sum(db.case((Ticket.status == 'ACTIVE', 1), else_=0)).label('sold'),
+        db.func.sum(db.case((Ticket.status == 'CANCELED', 1), else_=0)).label('canceled'),
+        db.func.sum(db.case((Ticket.status == 'ACTIVE', Ticket.price), else_=0)).label('revenue'),
+    ).group_by(Ticket.flight_number)
+    payments = db.session.query(
+        Ticket.flight_number.label('flight_number'),
+        db.func.sum(Payment.amount).label('paid'),
+    ).join(Payment, Payment.ticket_number == Ticket.ticket_number).group_by(Ticket.flight_number)
+    if flight_numbers is not None:
+        tickets = tickets.filter(Ticket.flight_number.in_(flight_numbers))
+        payments = payments.filter(Ticket.flight_number.in_(flight_numbers))
+    tickets = tickets.subquery()
+    payments = payments.subquery()
+
+    query = db.session.query(
+        Flight.flight_number, Flight.airline_id, Flight.departure_airport, Flight.arrival_airport,
+        Flight.departure_time, Aircraft.capacity,
+        tickets.c.sold, tickets.c.canceled, tickets.c.revenue, payments.c.paid,
+    ).join(
+        Aircraft, Flight.aircraft_id == Aircraft.aircraft_id
+    ).outerjoin(
+        tickets, tickets.c.flight_number == Flight.flight_number
+    ).outerjoin(
+        payments, payments.c.flight_number == Flight.flight_number
+    )
+    if flight_numbers is not None:
+        query = query.filter(Flight.flight_number.in_(flight_numbers))
+
+    now = datetime.now()
+    return [
+        FlightStats(flight_number=number, airline_id=airline_id, departure_airport=origin,
+                    arrival_airport=destination, departure_time=departure, capacity=capacity,
+                    seats_sold=sold or 0, seats_canceled=canceled or 0, revenue=revenue or 0,
+                    paid_revenue=paid or 0, updated_at=now)
+        for number, airline_id, origin, destination, departure, capacity, sold, canceled, revenue, paid
+        in query.all()
+    ]
+
+
+def ensure_flight_stats(flight):
+    """
+    Create the flight's FLIGHT_STATS row from TICKET if it does not exist yet.
+    Commits; call it before starting the booking transaction.
+    """
+    if db.session.get(FlightStats, flight.flight_number) is not None:
+        return
+    db.session.add_all(stats_rows([flight.flight_number]))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request created it first
+        db.session.rollback()
+
+
+def record_booking(flight_number, seats, revenue):
+    """Count booked seats and their price, in the caller's transaction"""
+    db.session.execute(
+        db.update(FlightStats).where(FlightStats.flight_number == flight_number).values(
+            seats_sold=FlightStats.seats_sold + seats,
+            revenue=FlightStats.revenue + revenue,
+            updated_at=datetime.now(),
+        )
+    )
+
+
+def record_cancellation(flight_number, price, was_active=True, count=1):
+    """
+    Move cancelled tickets (count of them, price in total) from sold to
+    cancelled, in the caller's transaction
+    """
+    values = {'seats_canceled': FlightStats.seats_canceled + count, 'updated_at': datetime.now()}
+    if was_active:
+        values.update(seats_sold=FlightStats.seats_sold - count, revenue=FlightStats.revenue - price)
+    db.session.execute(
+        db.update(FlightStats).where(FlightStats.flight_number == flight_number).values(**values)
+    )
+
+
+def record_payment(flight_number, amount):
+    """Add a payment to the flight's paid revenue, in the caller's transaction"""
+    db.session.execute(
+        db.update(FlightStats).where(FlightStats.flight_number == flight_number).values(
+            paid_revenue=FlightStats.paid_revenue + amount,
+            updated_at=datetime.now(),
+        )
+    )
+
+
+def rebuild_flight_stats(batch_size=1000):
+    """Recompute every FLIGHT_STATS row, in batches of flights; returns the number of flights"""
+    numbers = [number for (number,) in db.session.query(Flight.flight_number).order_by(Flight.flight_number)]
+    for start in range(0, len(numbers), batch_size):
+        batch = numbers[start:start + batch_size]
+        rows = stats_rows(batch)
+        db.session.execute(db.delete(FlightStats).where(FlightStats.flight_number.in_(batch)))
+        db.session.add_all(rows)
+        db.session.commit()
+    # Rows of flights that no longer exist
+    db.session.execute(db.delete(FlightStats).where(~FlightStats.flight_number.in_(
+        db.select(Flight.flight_number)
+    )))
+    db.session.commit()
+    return len(numbers)
+
+
+# -- Reports (read FLIGHT_STATS only) ---------------------------------------
+
+# Level -> names of the columns identifying a report row
+REPORT_KEYS = {
+    'flights': ('flight_number', 'departure_airport', 'arrival_airport', 'departure_time'),
+    'routes': ('departure_airport', 'arrival_airport'),
+    'airlines': ('airline_id', 'airline_name'),
+}
+REPORT_LEVELS = tuple(REPORT_KEYS)
+
+
+def ratio(part, whole):
+    return round(float(part) / float(whole), 4) if whole else None
+
+
+def report(level, start=None, end=None, airline_id=None, origin=None, limit=100):
+    """
+    Load factor, revenue and cancellation rate per flight, route or airline,
+    for flights departing in [start, end), highest revenue first.
+    """
+    capacity = db.func.sum(FlightStats.capacity)
+    sold = db.func.sum(FlightStats.seats_sold)
+    canceled = db.func.sum(FlightStats.seats_canceled)
+    revenue = db.func.sum(FlightStats.revenue)
+    paid = db.func.sum(FlightStats.paid_revenue)
+    flights = db.func.count(FlightStats.flight_number)
+
+    if level == 'flights':
+        keys = (FlightStats.flight_number, FlightStats.departure_airport, FlightStats.arrival_airport,
+                FlightStats.departure_time)
+        query = db.session.query(*keys, FlightStats.capacity, FlightStats.seats_sold,
+                                 FlightStats.seats_canceled, FlightStats.revenue,
+                                 FlightStats.paid_revenue, db.literal(1)).order_by(
+            FlightStats.revenue.desc(), FlightStats.flight_number)
+    elif level == 'routes':
+        keys = (FlightStats.departure_airport, FlightStats.arrival_airport)
+        query = db.session.query(*keys, capacity, sold, canceled, revenue, paid, flights).group_by(
+            *keys).order_by(revenue.desc(), *keys)
+    elif level == 'airlines':
+        keys = (FlightStats.airline_id, Airline.name)
+        query = db.session.query(*keys, capacity, sold, canceled, revenue, paid, flights).outerjoin(
+            Airline, Airline.airline_id == FlightStats.airline_id
+        ).group_by(*keys).order_by(revenue.desc(), FlightStats.airline_id)
+    else:
+        raise ValueError(f'Unknown report level {level}')
+
+    if start is not None:
+        query = query.filter(FlightStats.departure_time >= start)
+    if end is not None:
+        query = query.filter(FlightStats.departure_time < end)
+    if airline_id is not None:
+        query = query.filter(FlightStats.airline_id == airline_id)
+    if origin is not None:
+        query = query.filter(FlightStats.departure_airport == origin)
+
+    names = REPORT_KEYS[level]
+    rows = []
+    for row in query.limit(limit):
+        values = dict(zip(names, row[:len(keys)]))
+        capacity_, sold_, canceled_, revenue_, paid_, flights_ = row[len(keys):]
+        if isinstance(values.get('departure_time'), datetime):
+            values['departure_time'] = values['departure_time'].isoformat()
+        values.update(
+            flights=int(flights_), capacity=int(capacity_ or 0), seats_sold=int(sold_ or 0),
+            seats_canceled=int(canceled_ or 0), revenue=float(revenue_ or 0),
+            paid_revenue=float(paid_ or 0), load_factor=ratio(sold_ or 0, capacity_),
+            cancellation_rate=ratio(canceled_ or 0, (sold_ or 0) + (canceled_ or 0)),
+        )
+        rows.append(values)
+    return rows
+
+
+analytics_cli = AppGroup('analytics', help='Maintain the FLIGHT_STATS summary table.')
+
+
+@analytics_cli.command('rebuild')
+@click.option('--batch-size', default=1000, show_default=True, help='Flights per transaction.')
+def rebuild_command(batch_size):
+    """Recompute FLIGHT_STATS from TICKET and PAYMENT."""
+    count = rebuild_flight_stats(batch_size)
+    click.echo(f'Rebuilt flight stats for {count} flight(s).')
@@ -0,0 +1,380 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context, current_app, abort
+from flask_login import login_required
+from werkzeug.exceptions import HTTPException
+from models import db, Flight, Airline, Aircraft
+from datetime import datetime, timedelta
+import time
+import json
+import hmac
+import os
+from functools import wraps
+from db_config import env_bool, env_int
+from airport_index import airport_index
+from user_routes import flight_search_filters
+from route_graph import route_graph, itinerary_json, RANKINGS
+from analytics import REPORT_LEVELS, report
+from http_cache import http_cache
+from replicas import replicas
+from pricing import pricing
+from fare_calendar import CALENDAR_MAX_DAYS, fare_calendar
+from operations import OperationError, cancel_flights, reschedule_flights
+
+# Create blueprint for the JSON API (integration clients)
+api_bp = Blueprint('api', __name__)
+
+# Itinerary and report responses are plain JSON; the streamed search is left uncompressed
+http_cache.compress(api_bp, mimetypes=('application/json',))
+
+API_FETCH_SIZE = env_int('API_FETCH_SIZE', 500)
+API_MAX_FETCH_SIZE = env_int('API_MAX_FETCH_SIZE', 5000)
+MAX_ITINERARIES = 50
+MAX_REPORT_ROWS = 1000
+OPS_BATCH_SIZE = 500
+
+# sort parameter -> ORDER BY; flight_number last so the order is total
+SORTS = {
+    'departure': (Flight.departure_time, Flight.flight_number),
+    '-departure': (Flight.departure_time.desc(), Flight.flight_number.desc()),
+    'arrival': (Flight.arrival_time, Flight.flight_number),
+    'duration': (Flight.duration_minutes, Flight.departure_time, Flight.flight_number),
+    'flight_number': (Flight.flight_number,),
+}
+
+FLIGHT_COLUMNS = ('flight_number', 'airline_name', 'departure_airport', 'arrival_airport',
+                  'departure_time', 'arrival_time', 'duration_minutes', 'available_seats')
+# Row positions read by the pricing pass; capacity is selected after FLIGHT_COLUMNS and not sent
+DEPARTURE, DURATION, SEATS = (FLIGHT_COLUMNS.index(name) for name in
+                              ('departure_time', 'duration_minutes', 'available_seats'))
+CAPACITY = len(FLIGHT_COLUMNS)
+
+
+def bad_request(message):
+    response = jsonify({'error': message})
+    response.status_code = 400
+    return response
+
+
+@api_bp.errorhandler(HTTPException)
+def api_error(e):
+    """Errors of the API as JSON instead of HTML pages"""
+    response = jsonify({'error': e.description})
+    response.status_code = e.code
+    return response
+
+
+def flight_search_statement(origin_codes, destination_codes, day, sort, limit):
+    """Plain-column SELECT of flights with seats: no ORM objects are built per row"""
+    booked = Flight.booked_seats_subquery()
+    seats = Aircraft.capacity - db.func.coalesce(booked.c.booked, 0)
+    statement = db.select(
+        Flight.flight_number, Airline.name.label('airline_name'),
+        Flight.departure_airport, Flight.arrival_airport,
+        Flight.departure_time, Flight.arrival_time, Flight.duration_minutes,
+        seats.label('available_seats'), Aircraft.capacity
+    ).join(
+        Aircraft, Flight.aircraft_id == Aircraft.aircraft_id
+    ).outerjoin(
+        Airline, Flight.airline_id == Airline.airline_id
+    ).outerjoin(
+        booked, booked.c.flight_number == Flight.flight_number
+    ).where(
+        seats > 0, *flight_search_filters(origin_codes, destination_codes, day)
+    ).order_by(*SORTS[sort])
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def encode_row(row, price):
+    fields = {
+        name: value.isoformat() if isinstance(value, datetime) else value
+        for name, value in zip(FLIGHT_COLUMNS, row)
+    }
+    fields['price'] = price
+    return json.dumps(fields, separators=(',', ':'))
+
+
+def price_rows(rows):
+    """Economy fares of a partition of rows, in one pass (pricing.fare_column)"""
+    return pricing.fare_column(
+        [row[CAPACITY] for row in rows], [row[SEATS] for row in rows],
+        [row[DEPARTURE] for row in rows], [row[DURATION] for row in rows]
+    )
+
+
+def stream_rows(statement, fetch_size, as_array):
+    """
+    Run the statement on its own connection with a server-side cursor and yield
+    one chunk of encoded rows per fetch, so only fetch_size rows are in memory.
+    """
+    with replicas.read_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=fetch_size).execute(statement)
+        # Rows per round trip for drivers that prefetch (cx_Oracle arraysize)
+        result.cursor.arraysize = fetch_size
+        first = True
+        if as_array:
+            yield '['
+        try:
+            for rows in result.partitions():
+                lines = [encode_row(row, price) for row, price in zip(rows, price_rows(rows))]
+                if as_array:
+                    yield ('' if first else ',') + ','.join(lines)
+                else:
+                    yield '\n'.join(lines) + '\n'
+                first = False
+        except Exception as e:
+            # The status line is already sent; end the stream with an error record
+            print(f"API stream error: {e}")
+            error = json.dumps({'error': 'The search failed while streaming results.'})
+            yield (('' if first else ',') + error) if as_array else error + '\n'
+        if as_array:
+            yield ']'
+
+
+@api_bp.route('/flights/search')
+@login_required
+@replicas.read_only
+def flight_search():
+    """
+    Flight Search API
+    Streams flights with seats and their economy fare as NDJSON (default) or a chunked JSON array.
+    Query parameters: origin, destination (airport code or city text), date
+    (YYYY-MM-DD), sort (departure, -departure, arrival, duration, flight_number),
+    limit, fetch_size and format (ndjson or json).
+    """
+    origin = request.args.get('origin', '').strip().upper()
+    destination = request.args.get('destination', '').strip().upper()
+
+    day = None
+    date_str = request.args.get('date')
+    if date_str:
+        try:
+            day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return bad_request('Invalid date format. Use YYYY-MM-DD.')
+
+    sort = request.args.get('sort', 'departure')
+    if sort not in SORTS:
+        return bad_request(f"Invalid sort; use one of {', '.join(SORTS)}.")
+
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return bad_request('limit must be a positive integer.')
+
+    fetch_size = request.args.get('fetch_size', current_app.config.get('API_FETCH_SIZE', API_FETCH_SIZE), type=int)
+    fetch_size = max(1, min(fetch_size, current_app.config.get('API_MAX_FETCH_SIZE', API_MAX_FETCH_SIZE)))
+
+    output = request.args.get('format', 'ndjson')
+    if output not in ('ndjson', 'json'):
+        return bad_request('format must be ndjson or json.')
+
+    # Airport text resolved in memory, as in the HTML search
+    origin_codes = airport_index.match(origin) if origin else None
+    destination_codes = airport_index.match(destination) if destination else None
+
+    statement = flight_search_statement(origin_codes, destination_codes, day, sort, limit)
+    return Response(
+        stream_with_context(stream_rows(statement, fetch_size, as_array=output == 'json')),
+        mimetype='application/json' if output == 'json' else 'application/x-ndjson'
+    )
+
+
+@api_bp.route('/itineraries')
+@login_required
+@replicas.read_only
+def itineraries():
+    """
+    Connecting Itineraries API
+    Direct and multi-leg itineraries from the in-memory route graph.
+    Query parameters: origin, destination (airport code or city text), date
+    (YYYY-MM-DD, first leg departs that day), max_legs, min_connection and
+    max_connection (minutes), rank (arrival or duration) and limit.
+    """
+    origin = request.args.get('origin', '').strip().upper()
+    destination = request.args.get('destination', '').strip().upper()
+    if not origin or not destination:
+        return bad_request('origin and destination are required.')
+
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return bad_request('date is required as YYYY-MM-DD.')
+
+    rank = request.args.get('rank', 'arrival')
+    if rank not in RANKINGS:
+        return bad_request(f"rank must be one of {', '.join(RANKINGS)}.")
+
+    max_legs = request.args.get('max_legs', type=int)
+    min_connection = request.args.get('min_connection', type=int)
+    max_connection = request.args.get('max_connection', type=int)
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAX_ITINERARIES))
+    if (max_legs is not None and max_legs < 1) or (min_connection or 0) < 0 or (max_connection or 0) < 0:
+        return bad_request('max_legs, min_connection and max_connection must be positive.')
+
+    origin_codes = airport_index.match(origin)
+    destination_codes = airport_index.match(destination)
+
+    started = time.perf_counter()
+    start = datetime.combine(day, datetime.min.time())
+    # Some candidates may have a full leg, so ask the graph for extra ones
+    found = route_graph.search(origin_codes, destination_codes, start, start + timedelta(days=1),
+                               max_legs=max_legs, min_connection=min_connection,
+                               max_connection=max_connection, rank=rank, limit=limit * 2)
+    search_ms = (time.perf_counter() - started) * 1000
+
+    # Seats are not part of the graph (they change with every booking): one grouped query
+    numbers = sorted({leg.flight_number for legs in found for leg in legs})
+    seats = {}
+    if numbers:
+        rows = Flight.available_seats_query(
+            db.session.query(Flight).filter(Flight.flight_number.in_(numbers)), only_available=False
+        ).all()
+        seats = {flight.flight_number: available for flight, available in rows}
+    bookable = [legs for legs in found if all(seats.get(leg.flight_number, 0) > 0 for leg in legs)]
+
+    return jsonify({
+        'itineraries': [itinerary_json(legs, seats) for legs in bookable[:limit]],
+        'search_ms': round(search_ms, 2),
+    })
+
+
+@api_bp.route('/fare-calendar')
+@login_required
+@replicas.read_only
+def flight_fare_calendar():
+    """
+    Fare Calendar API
+    Per day from date - days to date + days: flights with seats, cheapest economy
+    fare and earliest departure, from one grouped query.
+    Query parameters: origin, destination (airport code or city text), date
+    (YYYY-MM-DD) and days (default 3, at most CALENDAR_MAX_DAYS).
+    """
+    origin = request.args.get('origin', '').strip().upper()
+    destination = request.args.get('destination', '').strip().upper()
+    if not origin or not destination:
+        return bad_request('origin and destination are required.')
+
+    try:
+        day = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return bad_request('date is required as YYYY-MM-DD.')
+
+    spread = request.args.get('days', 3, type=int)
+    if not 0 <= spread <= CALENDAR_MAX_DAYS:
+        return bad_request(f'days must be between 0 and {CALENDAR_MAX_DAYS}.')
+
+    calendar = fare_calendar(airport_index.match(origin), airport_index.match(destination), day, spread)
+    return jsonify({
+        'days': [{
+            'date': entry['date'].isoformat(),
+            'flights': entry['flights'],
+            'cheapest_fare': entry['cheapest_fare'],
+            'earliest_departure': entry['earliest_departure'].isoformat() if entry['earliest_departure'] else None,
+        } for entry in calendar],
+    })
+
+
+def ops_token_required(view):
+    """Operations endpoints take a bearer token (OPS_API_TOKEN) instead of a passenger login"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        token = current_app.config.get('OPS_API_TOKEN', os.getenv('OPS_API_TOKEN'))
+        if not token:
+            abort(404)
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+            abort(401)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+@api_bp.route('/reports/<level>')
+@ops_token_required
+@replicas.read_only
+def sales_report(level):
+    """
+    Sales Report API (OPS_REPORTS=1, OPS_API_TOKEN)
+    Load factor, revenue and cancellation rate per flight, route or airline,
+    read from the FLIGHT_STATS summary table only. Staff data, so it takes the
+    operations bearer token, not a passenger login.
+    Query parameters: from and to (YYYY-MM-DD, departure dates, to exclusive),
+    airline_id, origin and limit.
+    """
+    if not current_app.config.get('OPS_REPORTS', env_bool('OPS_REPORTS')):
+        abort(404)
+    if level not in REPORT_LEVELS:
+        return bad_request(f"level must be one of {', '.join(REPORT_LEVELS)}.")
+
+    bounds = {}
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        if value:
+            try:
+                bounds[name] = datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                return bad_request(f'{name} must be YYYY-MM-DD.')
+
+    origin = request.args.get('origin', '').strip().upper() or None
+    limit = max(1, min(request.args.get('limit', 100, type=int), MAX_REPORT_ROWS))
+    rows = report(level, start=bounds.get('from'), end=bounds.get('to'),
+                  airline_id=request.args.get('airline_id', type=int), origin=origin, limit=limit)
+    return jsonify({'level': level, 'rows': rows})
+
+
+def ops_request():
+    """(flight numbers, JSON body) of an operations request"""
+    body = request.get_json(silent=True) or {}
+    flight_numbers = body.get('flight_numbers')
+    if not isinstance(flight_numbers, list) or not flight_numbers or \
+            not all(isinstance(number, str) for number in flight_numbers):
+        return None, body
+    return [number.strip().upper() for number in flight_numbers], body
+
+
+@api_bp.route('/ops/flights/cancel', methods=['POST'])
+@ops_token_required
+def ops_cancel_flights():
+    """
+    Bulk Flight Cancellation API (OPS_API_TOKEN)
+    Cancels every ACTIVE ticket of the flights in batches, or rebooks them onto
+    a replacement flight on the same route, not yet departed, while it has seats.
+    JSON body: flight_numbers (list), rebook_to, batch_size, notify (default true).
+    """
+    flight_numbers, body = ops_request()
+    if flight_numbers is None:
+        return bad_request('flight_numbers must be a non-empty list of flight numbers.')
+    rebook_to = (body.get('rebook_to') or '').strip().upper() or None
+    batch_size = body.get('batch_size', OPS_BATCH_SIZE)
+    if not isinstance(batch_size, int) or batch_size < 1:
+        return bad_request('batch_size must be a positive integer.')
+    try:
+        result = cancel_flights(flight_numbers, rebook_to, batch_size, notify=body.get('notify', True) is not False)
+    except OperationError as e:
+        return bad_request(str(e))
+    return jsonify(result)
+
+
+@api_bp.route('/ops/flights/reschedule', methods=['POST'])
+@ops_token_required
+def ops_reschedule_flights():
+    """
+    Bulk Flight Rescheduling API (OPS_API_TOKEN)
+    Moves the flights' departure and arrival times and records the change on
+    every ACTIVE ticket.
+    JSON body: flight_numbers (list), shift_minutes, batch_size, notify (default true).
+    """
+    flight_numbers, body = ops_request()
+    if flight_numbers is None:
+        return bad_request('flight_numbers must be a non-empty list of flight numbers.')
+    shift_minutes = body.get('shift_minutes')
+    if not isinstance(shift_minutes, int) or shift_minutes == 0:
+        return bad_request('shift_minutes must be a non-zero integer.')
+    batch_size = body.get('batch_size', OPS_BATCH_SIZE)
+    if not isinstance(batch_size, int) or batch_size < 1:
+        return bad_request('batch_size must be a positive integer.')
+    try:
+        result = reschedule_flights(flight_numbers, timedelta(minutes=shift_minutes), batch_size,
+                                    notify=body.get('notify', True) is not False)
+    except OperationError as e:
+        return bad_request(str(e))
+    return jsonify(result)
@@ -1,62 +1,205 @@
-from flask import Flask, render_template, redirect, url_for
+from flask import Flask, render_template, redirect, url_for, jsonify
 from flask_login import LoginManager, login_required, current_user
 from models import db, Passenger  # Use Oracle models
 from datetime import datetime
+import logging
 import os
+import time
+import weakref
 
-# Import Oracle configuration
-from oracle_config import ORACLE_CONNECTION_STRING, ORACLE_ENGINE_OPTIONS, ORACLE_HOST, ORACLE_USERNAME
+# Database configuration (Oracle or SQLite stand-in, selected with DB_BACKEND)
+from db_config import DB_BACKEND, env_bool, get_database_config, replica_binds, describe_database
+from profiling import sql_profiler
+from airport_index import airport_index
+from route_graph import route_graph
+from search_cache import search_cache
+from pricing import pricing
+from user_cache import user_cache
+from fragments import fragment_cache
+from http_cache import http_cache
+from mailer import mailer
+from replicas import replicas, replicas_cli
+from tasks import task_queue, tasks_cli
+from operations import ops_cli
+from inventory import inventory_cli
+from bulk_loader import loader_cli
+from analytics import analytics_cli
+from passwords import passwords, passwords_cli
+from schema import schema_cli, add_columns  # Also declares the hot-query indexes before create_all()
 
-# Initialize Flask application
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-# Configuration
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = ORACLE_CONNECTION_STRING
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = ORACLE_ENGINE_OPTIONS
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True  # Show SQL queries for debugging
-
-# Initialize extensions
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Please log in to access this page.'
 
+
 # User loader callback for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
     """
     Flask-Login uses this to reload the user object from the user ID stored in the session.
+    Returns a cached PassengerSnapshot, so most requests skip the PASSENGER query.
+    """
+    return user_cache.load(user_id)
+
+
+def create_app(config=None):
+    """
+    Build the application. Settings come from the environment (FLASK_* variables
+    and each extension's own, see its module) and then from `config`.
+    Warms up (see warm_up) unless WARM_UP is off.
     """
-    return Passenger.query.get(int(user_id))
+    started = time.perf_counter()
+    database_uri, engine_options = get_database_config()
+
+    # Initialize Flask application
+    app = Flask(__name__)
+
+    # Configuration
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-this-in-production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    app.config['SQLALCHEMY_BINDS'] = replica_binds()  # Read replicas (DB_REPLICAS), if any
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ECHO'] = env_bool('SQLALCHEMY_ECHO')  # Dump every statement (debugging only)
+    app.config.from_prefixed_env()  # FLASK_SECRET_KEY, FLASK_SEARCH_CACHE_TTL=30, ...
+    app.config.update(config or {})
+
+    # Initialize extensions
+    db.init_app(app)
+    replicas.init_app(app)  # Reads of read-only views go to the replicas (REPLICA_READS, REPLICA_LAG_SECONDS)
+    login_manager.init_app(app)
+    passwords.init_app(app)  # Password hashing on a bounded pool (PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_COST)
+    search_cache.init_app(app)  # Search result cache (SEARCH_CACHE_BACKEND, SEARCH_CACHE_TTL)
+    pricing.init_app(app)  # Load-factor fares and the per-flight quote cache (PRICING_*)
+    user_cache.init_app(app)  # Passenger snapshots for the user loader (USER_CACHE_BACKEND, USER_CACHE_TTL)
+    fragment_cache.init_app(app)  # Rendered flight/reservation cards and Jinja bytecode cache (FRAGMENT_CACHE)
+    http_cache.init_app(app)  # ETag/304 for listing pages, gzip per blueprint (HTTP_CONDITIONAL, COMPRESS_*)
+    mailer.init_app(app)  # Booking emails (MAILER=outbox writes .eml files locally)
+    task_queue.init_app(app)  # Post-booking work queue (TASK_QUEUE_PATH, TASK_WORKERS)
+    airport_index.init_app(app)  # In-memory airport lookup used by search and autocomplete
+    route_graph.init_app(app)  # In-memory flight graph used by the connecting itinerary search
+    app.cli.add_command(schema_cli)  # flask --app app schema create-indexes / explain
+    app.cli.add_command(inventory_cli)  # flask --app app inventory rebuild
+    app.cli.add_command(loader_cli)  # flask --app app load files / generate
+    app.cli.add_command(analytics_cli)  # flask --app app analytics rebuild
+    app.cli.add_command(tasks_cli)  # flask --app app tasks work / status / reconcile
+    app.cli.add_command(ops_cli)  # flask --app app ops cancel / reschedule
+    app.cli.add_command(replicas_cli)  # flask --app app replicas status / sync
+    app.cli.add_command(passwords_cli)  # flask --app app passwords set EMAIL
+    sql_profiler.init_app(app)  # Per-request query stats / slow-query log (SQL_PROFILING, SQL_SLOW_QUERY_MS)
+
+    # Cache hit/miss counters (DEBUG_ENDPOINTS=1)
+    app.config.setdefault('DEBUG_ENDPOINTS', env_bool('DEBUG_ENDPOINTS'))
+    if app.config['DEBUG_ENDPOINTS']:
+        @app.route('/_debug/cache')
+        def debug_cache():
+            return jsonify({'search': search_cache.stats(), 'users': user_cache.stats(),
+                            'fragments': fragment_cache.stats(), 'quotes': pricing.stats(),
+                            'route_graph': route_graph.stats(),
+                            'tasks': task_queue.stats()})
+
+    # Import and register blueprints (route modules)
+    from auth_routes import auth_bp
+    from user_routes import user_bp
+    from api_routes import api_bp
+
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(user_bp, url_prefix='/user')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    login_manager.blueprint_login_views['api'] = None  # API calls get 401 instead of the login page
+
+    # Home route
+    @app.route('/')
+    def index():
+        """
+        Home page - redirects to search if logged in, otherwise to login.
+        """
+        if current_user.is_authenticated:
+            return redirect(url_for('user.search'))
+        return redirect(url_for('auth.login'))
+
+    # The SQLite stand-in starts empty, so create the schema on startup
+    if DB_BACKEND == 'sqlite':
+        with app.app_context():
+            db.create_all(bind_key=None)  # Not on the replicas
+            add_columns(db.engine)  # Files created before a column was added (PASSENGER.PASSWORD_HASH)
+
+    # Connections must not be shared with forked worker processes (serve.py, gunicorn --preload)
+    global _fork_app
+    _fork_app = weakref.ref(app)
 
-# Import and register blueprints (route modules)
-from auth_routes import auth_bp
-from user_routes import user_bp
+    app.config['STARTUP_TIMINGS'] = {'create_app_ms': round((time.perf_counter() - started) * 1000, 1)}
+    if app.config.get('WARM_UP', env_bool('WARM_UP', True)):
+        warm_up(app)
+    return app
 
-app.register_blueprint(auth_bp, url_prefix='/auth')
-app.register_blueprint(user_bp, url_prefix='/user')
 
-# Home route
-@app.route('/')
-def index():
+def warm_up(app):
     """
-    Home page - redirects to search if logged in, otherwise to login.
+    Load what the first requests would otherwise pay for: the airport and
+    route lookups, and every template compiled. Returns the startup timings.
     """
-    if current_user.is_authenticated:
-        return redirect(url_for('user.search'))
-    return redirect(url_for('auth.login'))
+    timings = app.config['STARTUP_TIMINGS']
+
+    def timed(name, step):
+        started = time.perf_counter()
+        step()
+        timings[f'{name}_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    with app.app_context():
+        timed('airport_index', airport_index.warm_up)
+        timed('route_graph', route_graph.warm_up)
+        timed('templates', lambda: [app.jinja_env.get_template(name) for name in app.jinja_env.list_templates()])
+    logger.info('Warm-up: %s', timings)
+    return timings
+
+
+def after_fork(app):
+    """In a forked child: drop the parent's pooled connections without closing them"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+# The app the fork handler cleans up: the latest one built, without keeping it alive
+_fork_app = None
+
+
+def _after_fork_in_child():
+    app = _fork_app() if _fork_app is not None else None
+    if app is not None:
+        after_fork(app)
+
+
+# Registered once: create_app() runs many times in tests and benchmarks
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def warm_pool(app, connections):
+    """Open `connections` pooled connections per engine now instead of on the first requests"""
+    with app.app_context():
+        opened = []
+        try:
+            for engine in db.engines.values():
+                opened.extend(engine.connect() for _ in range(connections))
+        except Exception as e:
+            print(f"Pool warm-up error: {e}")
+        finally:
+            for connection in opened:
+                connection.close()
+
 
 if __name__ == '__main__':
     print("\n" + "="*60)
-    print("🚀 Starting Flask Application with Oracle Database")
+    print("🚀 Starting Flask Application")
     print("="*60)
-    print(f"📍 Connecting to: {ORACLE_HOST}")
-    print(f"👤 Username: {ORACLE_USERNAME}")
-    print(f"🔗 Database: course (SID)")
+    print(f"🔗 Database: {describe_database()}")
     print("="*60 + "\n")
-    
-    # Run the application
-    app.run(debug=True, port=5000)
+
+    # Development server; use serve.py for multiple workers
+    app = create_app()
+    # Pick up tasks left queued by a previous run
+    task_queue.start()
+    app.run(debug=env_bool('FLASK_DEBUG', True), port=5000)
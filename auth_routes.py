@@ -1,11 +1,37 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required
 from models import db, Passenger
+from passwords import passwords, PasswordsBusy
 from datetime import datetime, date
 
 # Create blueprint for authentication routes
 auth_bp = Blueprint('auth', __name__)
 
+BUSY_MESSAGE = 'Too many sign-ins right now. Please try again in a moment.'
+
+
+def find_passenger(email):
+    """Passenger with this email (an equality lookup on IX_PASSENGER_EMAIL), or None"""
+    return db.session.execute(
+        db.select(Passenger).where(Passenger.email == email)
+    ).scalar_one_or_none()
+
+
+def upgrade_password(passenger, password):
+    """
+    Re-hash a password that was just verified when its stored hash is not at the
+    current method and cost (or the account had none yet). A failure only
+    means it is tried again at the next login.
+    """
+    if not passwords.needs_rehash(passenger.password_hash):
+        return
+    try:
+        passenger.password_hash = passwords.hash(password)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Password upgrade error: {e}")
+
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
     """
@@ -15,7 +41,7 @@ def register():
     if request.method == 'POST':
         # Get form data
         full_name = request.form.get('full_name')
-        email = request.form.get('email')
+        email = (request.form.get('email') or '').strip()
         password = request.form.get('password')
         confirm_password = request.form.get('confirm_password')
         phone = request.form.get('phone')
@@ -43,7 +69,7 @@ def register():
             return render_template('register.html')
         
         # Check if email already exists
-        if Passenger.query.filter_by(email=email).first():
+        if find_passenger(email):
             flash('Email already registered. Please use a different email.', 'danger')
             return render_template('register.html')
         
@@ -55,7 +81,11 @@ def register():
             nationality=nationality,
             phone=phone
         )
-        new_passenger.set_password(password)
+        try:
+            new_passenger.set_password(password)
+        except PasswordsBusy:
+            flash(BUSY_MESSAGE, 'warning')
+            return render_template('register.html'), 503
         
         # Add to database
         try:
@@ -78,7 +108,7 @@ def login():
     Authenticates passengers by email and password
     """
     if request.method == 'POST':
-        email = request.form.get('email')
+        email = (request.form.get('email') or '').strip()
         password = request.form.get('password')
         
         # Validation
@@ -87,10 +117,18 @@ def login():
             return render_template('login.html')
         
         # Find passenger by email
-        passenger = Passenger.query.filter_by(email=email).first()
+        passenger = find_passenger(email)
+        
+        # Verify credentials (hashed on the password pool; an unknown email costs the same)
+        try:
+            valid = passenger.check_password(password) if passenger else passwords.check(None, password)
+            if valid:
+                upgrade_password(passenger, password)
+        except PasswordsBusy:
+            flash(BUSY_MESSAGE, 'warning')
+            return render_template('login.html'), 503
         
-        # Verify credentials
-        if passenger and passenger.check_password(password):
+        if valid:
             login_user(passenger)
             flash(f'Welcome back, {passenger.first_name}!', 'success')
             
@@ -0,0 +1,9 @@
+"""
+Benchmarks for the Flask routes against a SQLite stand-in database.
+
+    python -m bench.run --scale small --clients 8 --duration 20
+    python -m bench.run --scale medium --save-baseline medium
+    python -m bench.run --scale medium --compare medium
+
+See bench/run.py for all options and bench/dataset.py for the dataset scales.
+"""
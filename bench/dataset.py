@@ -0,0 +1,99 @@
+"""
+Synthetic benchmark datasets
+
+Seeds a SQLite database at a given scale with bulk_loader.generate(), which
+fills all ten tables in batches with executemany. Flights never get more
+tickets than their cabins have seats, and ticket seat numbers follow the seat
+map layout so bookings made during a run stay consistent. Passengers log in
+with bulk_loader.SYNTHETIC_PASSWORD.
+
+The benchmarks call prepare(), which seeds a missing dataset and brings files
+seeded by an older version up to date.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+# name -> row counts; tickets stay below the total seat capacity of the flights
+SCALES = {
+    'tiny':   {'airports': 20,  'passengers': 500,     'flights': 200,    'tickets': 2_000},
+    'small':  {'airports': 60,  'passengers': 5_000,   'flights': 2_000,  'tickets': 50_000},
+    'medium': {'airports': 150, 'passengers': 50_000,  'flights': 10_000, 'tickets': 500_000},
+    'large':  {'airports': 300, 'passengers': 200_000, 'flights': 30_000, 'tickets': 2_000_000},
+    'xlarge': {'airports': 500, 'passengers': 500_000, 'flights': 60_000, 'tickets': 5_000_000},
+}
+
+SCHEDULE_START = datetime(2030, 1, 1)
+
+
+def database_path(scale, directory=None):
+    directory = directory or os.path.join(os.path.dirname(__file__), 'data')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f'{scale}.db')
+
+
+def tasks_path(path):
+    """Task queue file (tasks.py) kept next to a dataset"""
+    return path + '.tasks'
+
+
+def seed(path, scale, seed_value=42, report=print):
+    """Create the schema in a fresh SQLite file and fill it at the given scale"""
+    from models import db
+    import schema
+    from bulk_loader import ProgressReport, generate
+
+    # Tasks queued against the old data refer to tickets that will not exist
+    for stale in (path, tasks_path(path), tasks_path(path) + '-wal', tasks_path(path) + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    # Load without secondary indexes, then build them once at the end
+    schema.drop_indexes(engine)
+    progress = ProgressReport(echo=report)
+    with engine.begin() as conn:
+        generate(conn, start=SCHEDULE_START, seed=seed_value, progress=progress, **SCALES[scale])
+    schema.create_indexes(engine)
+    progress.finish()
+    engine.dispose()
+
+
+def prepare(path, scale, seed_value=42, reseed=False, report=print):
+    """Seed the dataset if it is missing (or reseed is asked), else update it"""
+    if reseed or not os.path.exists(path):
+        report(f'Seeding {scale} dataset into {path}')
+        seed(path, scale, seed_value=seed_value, report=report)
+    else:
+        update(path)
+
+
+def update(path):
+    """Add what older datasets lack: PASSENGER.PASSWORD_HASH for the synthetic passengers"""
+    import schema
+    from bulk_loader import SYNTHETIC_HASH_METHOD, SYNTHETIC_PASSWORD
+    from werkzeug.security import generate_password_hash
+
+    engine = create_engine(f'sqlite:///{path}')
+    schema.add_columns(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            'UPDATE PASSENGER SET PASSWORD_HASH = ? WHERE PASSWORD_HASH IS NULL',
+            (generate_password_hash(SYNTHETIC_PASSWORD, SYNTHETIC_HASH_METHOD),)
+        )
+    engine.dispose()
+
+
+def sample_flights(path, limit=5000):
+    """(flight_number, origin, destination, date) rows to drive the benchmark flows"""
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            'SELECT FLIGHT_NUMBER, DEPARTURE_AIRPORT, ARRIVAL_AIRPORT, DEPARTURE_TIME '
+            'FROM FLIGHT ORDER BY FLIGHT_NUMBER LIMIT ?', (limit,)
+        ).fetchall()
+        passengers = conn.exec_driver_sql('SELECT COUNT(*) FROM PASSENGER').scalar()
+    engine.dispose()
+    return [(n, o, d, str(t)[:10]) for n, o, d, t in rows], passengers
@@ -0,0 +1,168 @@
+"""
+Login benchmark: logins per second per core at each password hash cost
+
+For each --costs entry (algorithm:cost, see passwords.py) it builds the app
+with that setting against a seeded SQLite database and measures:
+
+    hash ms        one password check, outside the app
+    upgrade ms     median first login of a passenger whose hash is at another
+                   cost (e.g. the cheap generated one): check, re-hash at this
+                   cost and store it
+    logins/s       --clients threads logging in for --duration seconds
+    per core       logins/s divided by the CPUs this process may use
+    p50 / p95      login latency
+    page p95       latency of /user/my-reservations, requested every
+                   --page-interval seconds meanwhile by one more client, to see
+                   whether logins starve other pages
+    busy           logins turned away because the hashing queue was full
+
+    python -m bench.logins --scale small --costs pbkdf2:100000,pbkdf2:600000,scrypt:32768
+
+Passengers log in with their synthetic password (bulk_loader.py), as in
+bench.run, and keep the hash of the last cost measured. Clients are threads in this process, like
+the request threads of a worker.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+from bench.dataset import SCALES, database_path, prepare, sample_flights, tasks_path
+from bench.run import percentile
+from bulk_loader import SYNTHETIC_PASSWORD as PASSWORD, passenger_email
+
+
+def login(client, passenger_id):
+    started = time.perf_counter()
+    response = client.post('/auth/login', data={'email': passenger_email(passenger_id), 'password': PASSWORD})
+    return response.status_code, (time.perf_counter() - started) * 1000
+
+
+def measure(args, algorithm, cost, passengers):
+    from werkzeug.security import check_password_hash, generate_password_hash
+    from app import create_app
+    from passwords import hash_method
+
+    method = hash_method(algorithm, cost)
+    stored = generate_password_hash(PASSWORD, method)
+    started = time.perf_counter()
+    check_password_hash(stored, PASSWORD)
+    hash_ms = (time.perf_counter() - started) * 1000
+
+    config = {'PASSWORD_HASH_ALGORITHM': algorithm, 'PASSWORD_HASH_COST': cost, 'WARM_UP': False}
+    if args.hash_threads:
+        config['PASSWORD_HASH_THREADS'] = args.hash_threads
+    app = create_app(config)
+
+    # First login of each passenger at this cost stores a new hash
+    upgrades = []
+    with app.test_client() as client:
+        for passenger_id in passengers:
+            status, ms = login(client, passenger_id)
+            if status == 302:
+                upgrades.append(ms)
+
+    stop, measuring = threading.Event(), threading.Event()
+    logins, pages, busy, errors = [], [], [], []
+
+    def log_in(index):
+        client = app.test_client()
+        i = index
+        while not stop.is_set():
+            status, ms = login(client, passengers[i % len(passengers)])
+            i += args.clients
+            if measuring.is_set():
+                if status == 302:
+                    logins.append(ms)
+                elif status == 503:
+                    busy.append(ms)
+                else:
+                    errors.append(status)
+
+    def browse():
+        client = app.test_client()
+        login(client, passengers[0])
+        while not stop.is_set():
+            started = time.perf_counter()
+            status = client.get('/user/my-reservations').status_code
+            if measuring.is_set():
+                pages.append((time.perf_counter() - started) * 1000)
+                if status != 200:
+                    errors.append(status)
+            stop.wait(args.page_interval)
+
+    threads = [threading.Thread(target=log_in, args=(i,), daemon=True) for i in range(args.clients)]
+    threads.append(threading.Thread(target=browse, daemon=True))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    measuring.set()
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    measuring.clear()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    logins.sort()
+    pages.sort()
+    rate = len(logins) / elapsed
+    return {
+        'method': method,
+        'hash_ms': round(hash_ms, 1),
+        'upgrade_ms': round(statistics.median(upgrades), 1) if upgrades else 0.0,
+        'logins_per_s': round(rate, 2),
+        'per_core': round(rate / args.cores, 2),
+        'p50_ms': round(percentile(logins, 50), 1),
+        'p95_ms': round(percentile(logins, 95), 1),
+        'page_p95_ms': round(percentile(pages, 95), 1),
+        'busy': len(busy),
+        'errors': len(errors),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark logins per second at each password hash cost.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--costs', default='pbkdf2:100000,pbkdf2:600000,scrypt:16384,scrypt:32768',
+                        help='Comma-separated algorithm:cost settings.')
+    parser.add_argument('--clients', type=int, default=8, help='Threads logging in concurrently.')
+    parser.add_argument('--passengers', type=int, default=20, help='Distinct passengers logging in.')
+    parser.add_argument('--hash-threads', type=int, help='PASSWORD_HASH_THREADS (default: CPU count).')
+    parser.add_argument('--page-interval', type=float, default=0.1, help='Seconds between page requests.')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds per cost.')
+    parser.add_argument('--warmup', type=float, default=1, help='Seconds before measuring.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help='Where the seeded databases live (default bench/data).')
+    args = parser.parse_args(argv)
+    args.cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+    path = database_path(args.scale, args.data_dir)
+    prepare(path, args.scale, seed_value=args.seed)
+    _, passenger_count = sample_flights(path)
+    passengers = list(range(1, min(args.passengers, passenger_count) + 1))
+
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = path
+    os.environ['TASK_QUEUE_PATH'] = tasks_path(path)
+    os.environ['MAILER'] = 'none'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    print(f'{args.scale} dataset, {args.clients} clients, {len(passengers)} passengers, '
+          f'{args.cores} cores, {args.duration}s measured per cost')
+    print(f"{'method':<22} {'hash ms':>8} {'upgrade ms':>11} {'logins/s':>9} {'per core':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'page p95':>9} {'busy':>5} {'errors':>7}")
+    for setting in args.costs.split(','):
+        algorithm, cost = setting.split(':')
+        r = measure(args, algorithm, int(cost), passengers)
+        print(f"{r['method']:<22} {r['hash_ms']:>8.1f} {r['upgrade_ms']:>11.1f} {r['logins_per_s']:>9.2f} "
+              f"{r['per_core']:>9.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['page_p95_ms']:>9.1f} "
+              f"{r['busy']:>5} {r['errors']:>7}", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
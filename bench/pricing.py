@@ -0,0 +1,79 @@
+"""
+Fare pricing benchmark
+
+Prices one page of --flights flights from a seeded SQLite database three ways
+and reports milliseconds per page:
+
+    per_flight   a fare property per flight: each one counts the flight's
+                 ACTIVE tickets (pricing.quote with an empty quote cache)
+    page         the listing path: one grouped seats query for the page, then
+                 pricing.price_flights() over it
+    pass_only    pricing.price_flights() alone, on flights already loaded
+
+    python -m bench.pricing --scale small --flights 500 --repeat 10
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from bench.dataset import SCALES, database_path, prepare, tasks_path
+
+
+def timed(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark fare pricing for a page of flights.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--flights', type=int, default=500, help='Flights per page.')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per variant (median is reported).')
+    parser.add_argument('--data-dir', help='Where the seeded databases live (default bench/data).')
+    args = parser.parse_args(argv)
+
+    path = database_path(args.scale, args.data_dir)
+    prepare(path, args.scale)
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = path
+    os.environ['TASK_QUEUE_PATH'] = tasks_path(path)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app
+    from models import db, Flight
+    from pricing import pricing
+
+    app = create_app()
+    with app.app_context():
+        numbers = [number for (number,) in db.session.query(Flight.flight_number).order_by(
+            Flight.departure_time, Flight.flight_number).limit(args.flights)]
+
+        def listing():
+            return Flight.with_available_seats(
+                Flight.query.filter(Flight.flight_number.in_(numbers)), only_available=False)
+
+        def per_flight():
+            pricing.clear()
+            db.session.expunge_all()
+            for flight in Flight.query.filter(Flight.flight_number.in_(numbers)):
+                pricing.quote(flight)
+
+        loaded = listing()
+        results = {
+            'per_flight': timed(per_flight, args.repeat),
+            'page': timed(lambda: pricing.price_flights(listing()), args.repeat),
+            'pass_only': timed(lambda: pricing.price_flights(loaded), args.repeat),
+        }
+
+    print(f'{len(numbers)} flights ({args.scale} dataset), median of {args.repeat} runs (ms per page)')
+    for name, ms in results.items():
+        print(f'  {name:<12}{ms:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Card rendering benchmark
+
+Renders 1,000 flight cards three ways inside a request context and reports
+milliseconds per 1,000 cards:
+
+    inline   the listing loop as it was before fragments.py (strftime and
+             price formatting in the template, once per card and render)
+    cold     flight_card() with an empty fragment cache (precomputed display
+             fields, one render per card)
+    warm     flight_card() on a page already rendered once (cache hits)
+
+    python -m bench.render --cards 1000 --repeat 20
+
+No database is needed; the cards are built from synthetic FlightSummary rows.
+"""
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+# The listing loop of templates/results.html before the cards were extracted
+INLINE_TEMPLATE = """
+{% for flight in flights %}
+<div class="card flight-card mb-3">
+    <div class="card-body">
+        <div class="row align-items-center">
+            <div class="col-md-8">
+                <h5 class="card-title mb-1">
+                    <span class="badge bg-primary">{{ flight.flight_number }}</span>
+                    {{ flight.airline_name or 'N/A' }}
+                </h5>
+                <p class="mb-2">
+                    <strong>{{ flight.origin }}</strong> 
+                    <span class="text-muted">→</span> 
+                    <strong>{{ flight.destination }}</strong>
+                </p>
+                <p class="mb-1 text-muted">
+                    🛫 {{ flight.departure_time.strftime('%B %d, %Y at %I:%M %p') }}
+                </p>
+                <p class="mb-1 text-muted">
+                    🛬 {{ flight.arrival_time.strftime('%B %d, %Y at %I:%M %p') }}
+                </p>
+                <p class="mb-0">
+                    <span class="badge bg-success">{{ flight.available_seats }} seats available</span>
+                </p>
+            </div>
+            <div class="col-md-4 text-end">
+                <h3 class="text-primary mb-3">${{ "%.2f"|format(flight.price) }}</h3>
+                <a href="{{ url_for('user.reserve', flight_number=flight.flight_number) }}" 
+                   class="btn btn-primary">Book Flight</a>
+            </div>
+        </div>
+    </div>
+</div>
+{% endfor %}
+"""
+
+CACHED_TEMPLATE = """
+{% for flight in flights %}
+{{ flight_card(flight, book_label='Book Flight', spaced=True) }}
+{% endfor %}
+"""
+
+
+def make_flights(count):
+    from models import FlightSummary
+    start = datetime(2030, 1, 1, 6, 0)
+    return [
+        FlightSummary(flight_number=f'BR{i:05d}', airline_name=f'Airline {i % 12}',
+                      departure_airport='EWR', arrival_airport='LAX',
+                      departure_time=start + timedelta(minutes=17 * i),
+                      arrival_time=start + timedelta(minutes=17 * i + 330),
+                      duration_minutes=330, available_seats=150 - i % 150, price=200.0)
+        for i in range(count)
+    ]
+
+
+def timed(render, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        render()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark flight card rendering.')
+    parser.add_argument('--cards', type=int, default=1000, help='Cards per page.')
+    parser.add_argument('--repeat', type=int, default=20, help='Renders per variant (median is reported).')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DB_BACKEND', 'sqlite')
+    os.environ.setdefault('SQLITE_PATH', ':memory:')
+    os.environ['FRAGMENT_CACHE_MAX_ENTRIES'] = str(max(args.cards, 5000))
+    from app import create_app
+    from fragments import fragment_cache
+
+    app = create_app()
+    flights = make_flights(args.cards)
+    inline = app.jinja_env.from_string(INLINE_TEMPLATE)
+    cached = app.jinja_env.from_string(CACHED_TEMPLATE)
+
+    def cold():
+        fragment_cache.cache.clear()
+        cached.render(flights=flights)
+
+    with app.test_request_context('/'):
+        inline.render(flights=flights)
+        results = {
+            'inline': timed(lambda: inline.render(flights=flights), args.repeat),
+            'cold': timed(cold, args.repeat),
+        }
+        cached.render(flights=flights)
+        results['warm'] = timed(lambda: cached.render(flights=flights), args.repeat)
+
+    per_thousand = 1000 / args.cards
+    print(f'{args.cards} cards, median of {args.repeat} renders (ms per 1,000 cards)')
+    for name, ms in results.items():
+        print(f'  {name:<8}{ms * per_thousand:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+Route benchmark
+
+Runs the app in-process against a seeded SQLite database (bench/dataset.py)
+and drives concurrent clients, each logged in as a different passenger,
+through a weighted mix of flows:
+
+    login            POST /auth/login
+    search           GET  /user/search?origin=..&destination=..&date=..
+    results          GET  /user/results, then its next page
+    reserve          POST /user/reserve/<flight>  (one economy seat)
+    my_reservations  GET  /user/my-reservations
+
+Per route it reports throughput, p50/p95/p99 latency and the average number of
+SQL statements per request (from the X-DB-Query-Count header, so SQL_PROFILING
+is switched on). Results can be saved as a JSON baseline and compared against
+later runs; --compare exits with status 1 when a route got slower than
+--threshold or runs more queries than the baseline.
+
+    python -m bench.run --scale small --clients 8 --duration 20 --save-baseline small
+    python -m bench.run --scale small --clients 8 --duration 20 --compare small
+
+The app reads its configuration from the environment at import time, so the
+database and cache settings are applied before the app is imported and created. Clients are
+threads sharing one process: numbers are comparable between runs on the same
+machine, not absolute capacity figures.
+"""
+import argparse
+import html
+import json
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from bench.dataset import SCALES, database_path, prepare, sample_flights, tasks_path
+from bulk_loader import SYNTHETIC_PASSWORD, passenger_email
+
+NEXT_PAGE_LINK = re.compile(r'href="([^"]*[?&](?:amp;)?cursor=[^"]*)"')
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# flow name -> relative weight
+FLOWS = {
+    'search': 35,
+    'results': 15,
+    'my_reservations': 25,
+    'reserve': 15,
+    'login': 10,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Latencies and query counts per route, shared by all client threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.recording = False
+
+    def add(self, route, elapsed_ms, response):
+        if not self.recording:
+            return
+        queries = response.headers.get('X-DB-Query-Count')
+        with self.lock:
+            self.samples.setdefault(route, []).append((elapsed_ms, int(queries) if queries else None))
+            if response.status_code >= 400:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, seconds):
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            latencies = sorted(ms for ms, _ in samples)
+            queries = [q for _, q in samples if q is not None]
+            routes[route] = {
+                'requests': len(samples),
+                'errors': self.errors.get(route, 0),
+                'throughput_rps': round(len(samples) / seconds, 2),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'p99_ms': round(percentile(latencies, 99), 2),
+                'max_ms': round(latencies[-1], 2),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+        return routes
+
+
+class Client:
+    """One simulated user: a Flask test client logged in as one passenger"""
+
+    def __init__(self, app, recorder, flights, passenger_id, rng):
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.flights = flights
+        self.passenger_id = passenger_id
+        self.rng = rng
+
+    def timed(self, route, method, path, **kwargs):
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        self.recorder.add(route, (time.perf_counter() - started) * 1000, response)
+        return response
+
+    def login(self):
+        self.timed('login', 'POST', '/auth/login',
+                   data={'email': passenger_email(self.passenger_id), 'password': SYNTHETIC_PASSWORD})
+
+    def search(self):
+        _, origin, destination, day = self.rng.choice(self.flights)
+        kind = self.rng.random()
+        if kind < 0.6:
+            query = {'origin': origin, 'destination': destination, 'date': day}
+        elif kind < 0.8:
+            query = {'origin': origin, 'date': day}
+        else:
+            query = {'destination': destination}
+        self.timed('search', 'GET', '/user/search', query_string=query)
+
+    def results(self):
+        response = self.timed('results', 'GET', '/user/results')
+        # Follow the pager's "Next page" link
+        match = NEXT_PAGE_LINK.search(response.get_data(as_text=True))
+        if match:
+            self.timed('results', 'GET', html.unescape(match.group(1)))
+
+    def reserve(self):
+        flight_number = self.rng.choice(self.flights)[0]
+        self.timed('reserve', 'POST', f'/user/reserve/{flight_number}',
+                   data={'num_passengers': 1, 'seat_class': 'ECONOMY'})
+
+    def my_reservations(self):
+        self.timed('my_reservations', 'GET', '/user/my-reservations')
+
+    def run(self, stop):
+        self.login()
+        names = list(FLOWS)
+        weights = [FLOWS[name] for name in names]
+        while not stop.is_set():
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+
+def load_app(path, cache, profiling=True):
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['SQLITE_PATH'] = path
+    os.environ['SQL_PROFILING'] = '1' if profiling else '0'
+    os.environ.setdefault('DB_POOL_SIZE', '20')
+    # Post-booking tasks run against this dataset; no email files
+    os.environ['TASK_QUEUE_PATH'] = tasks_path(path)
+    os.environ.setdefault('MAILER', 'none')
+    # A cheap hash keeps logins from hiding the other routes; bench.logins measures the real cost
+    os.environ.setdefault('PASSWORD_HASH_COST', '1000')
+    if not cache:
+        os.environ['SEARCH_CACHE_BACKEND'] = 'none'
+        os.environ['USER_CACHE_BACKEND'] = 'none'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import create_app
+    from tasks import task_queue
+    app = create_app({'TESTING': True})
+    task_queue.start()
+    return app
+
+
+def run(args):
+    path = database_path(args.scale, args.data_dir)
+    prepare(path, args.scale, seed_value=args.seed, reseed=args.reseed)
+
+    flights, passengers = sample_flights(path)
+    app = load_app(path, cache=not args.no_cache)
+    recorder = Recorder()
+    stop = threading.Event()
+    rng = random.Random(args.seed)
+    clients = [
+        Client(app, recorder, flights, rng.randrange(passengers) + 1, random.Random(args.seed + i))
+        for i in range(args.clients)
+    ]
+    threads = [threading.Thread(target=client.run, args=(stop,), daemon=True) for client in clients]
+
+    print(f'{args.clients} clients, {args.warmup}s warm-up, {args.duration}s measured')
+    for thread in threads:
+        thread.start()
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    routes = recorder.summary(elapsed)
+    return {
+        'scale': args.scale,
+        'dataset': SCALES[args.scale],
+        'clients': args.clients,
+        'duration_s': round(elapsed, 2),
+        'cache': not args.no_cache,
+        'total_rps': round(sum(r['requests'] for r in routes.values()) / elapsed, 2),
+        'routes': routes,
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def print_report(result):
+    print(f"\n{result['scale']} dataset, {result['clients']} clients, "
+          f"{result['total_rps']} req/s total")
+    print(f"{'route':<16} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'queries':>8}")
+    for route, r in result['routes'].items():
+        queries = '-' if r['queries_per_request'] is None else f"{r['queries_per_request']:.1f}"
+        print(f"{route:<16} {r['requests']:>7} {r['errors']:>5} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {queries:>8}")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def compare(result, baseline, threshold):
+    """Print per-route deltas against a baseline; returns the list of regressions"""
+    regressions = []
+    print(f"\nCompared with baseline recorded {baseline.get('recorded_at', '?')} "
+          f"(regression threshold {threshold:.0%})")
+    def settings(r):
+        # Reserve's queries per request also depend on the duration (first bookings set up inventory)
+        return {'scale': r.get('scale'), 'clients': r.get('clients'), 'cache': r.get('cache'),
+                'cpus': r.get('cpus'), 'duration': round(r.get('duration_s') or 0)}
+
+    for setting, value in settings(baseline).items():
+        if value != settings(result)[setting]:
+            print(f"Warning: baseline ran with {setting}={value}, this run with "
+                  f"{setting}={settings(result)[setting]}; the numbers are not comparable")
+    print(f"{'route':<16} {'p50':>16} {'p95':>16} {'req/s':>16} {'queries':>12}")
+    for route, r in result['routes'].items():
+        old = baseline['routes'].get(route)
+        if not old:
+            print(f'{route:<16} (not in baseline)')
+            continue
+
+        def delta(key):
+            return (r[key] - old[key]) / old[key] if old[key] else 0.0
+
+        print(f"{route:<16} {old['p50_ms']:>6.1f}->{r['p50_ms']:<6.1f}{delta('p50_ms'):>+4.0%} "
+              f"{old['p95_ms']:>6.1f}->{r['p95_ms']:<6.1f}{delta('p95_ms'):>+4.0%} "
+              f"{old['throughput_rps']:>6.1f}->{r['throughput_rps']:<6.1f}{delta('throughput_rps'):>+4.0%} "
+              f"{old['queries_per_request'] or 0:>5.1f}->{r['queries_per_request'] or 0:<5.1f}")
+        if delta('p95_ms') > threshold:
+            regressions.append(f'{route}: p95 {old["p95_ms"]} -> {r["p95_ms"]} ms')
+        if (r['queries_per_request'] or 0) > (old['queries_per_request'] or 0) + 0.5:
+            regressions.append(f'{route}: queries/request {old["queries_per_request"]} -> '
+                               f'{r["queries_per_request"]}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Flask routes against a seeded SQLite database.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='Measured seconds.')
+    parser.add_argument('--warmup', type=float, default=3, help='Seconds before measuring.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help='Where the seeded databases live (default bench/data).')
+    parser.add_argument('--reseed', action='store_true', help='Re-create the dataset even if it exists.')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the search and user caches.')
+    parser.add_argument('--json', help='Also write the results to this file.')
+    parser.add_argument('--save-baseline', metavar='NAME', help='Save the results as bench/baselines/NAME.json.')
+    parser.add_argument('--compare', metavar='NAME', help='Compare with bench/baselines/NAME.json.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 slowdown (default 0.2 = 20%%).')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path(args.save_baseline), 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'\nSaved baseline {baseline_path(args.save_baseline)}')
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print('\nRegressions:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
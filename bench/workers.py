@@ -0,0 +1,212 @@
+"""
+Serving benchmark: cold start and throughput per worker count
+
+Starts serve.py against a seeded SQLite database once per worker count and
+measures:
+
+    cold start   from launching the process to the first 200 response
+    req/s        over --duration seconds of logged-in clients on keep-alive
+                 connections, cycling through read-only pages
+                 (/user/search, /user/results, /user/my-reservations)
+    p50 / p95    request latency seen by the clients
+
+then stops the server with SIGTERM (graceful shutdown is part of the run: a
+non-zero exit status is reported).
+
+    python -m bench.workers --scale small --workers 1,2,4 --threads 8 --clients 32
+
+The clients are threads in this process, so on a small machine they compete
+with the workers for CPU; compare worker counts with each other rather than
+reading the figures as absolute capacity.
+"""
+import argparse
+import http.client
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from bench.dataset import SCALES, database_path, prepare, sample_flights, tasks_path
+from bench.run import percentile
+from bulk_loader import SYNTHETIC_PASSWORD, passenger_email
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# page -> relative weight
+PAGES = {
+    'search': 50,
+    'results': 20,
+    'my_reservations': 30,
+}
+
+
+def start_server(path, port, workers, threads):
+    env = dict(os.environ, DB_BACKEND='sqlite', SQLITE_PATH=path, TASK_QUEUE_PATH=tasks_path(path),
+               MAILER='none', DB_POOL_SIZE=str(threads),
+               PASSWORD_HASH_COST=os.getenv('PASSWORD_HASH_COST', '1000'))  # Logins are bench.logins' subject
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'serve.py'), '--port', str(port),
+         '--workers', str(workers), '--threads', str(threads)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        start_new_session=True,  # So a hung server can be killed with its workers
+    )
+
+
+def wait_ready(process, port, timeout=60):
+    """Seconds until the server answers 200, or raises if it exits or times out"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with {process.returncode}:\n{process.stdout.read()}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/auth/login')
+            if conn.getresponse().status == 200:
+                return time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError('Server did not start in time')
+
+
+class Client:
+    """One logged-in passenger on one keep-alive connection"""
+
+    def __init__(self, port, flights, passenger_id, rng):
+        self.port = port
+        self.flights = flights
+        self.passenger_id = passenger_id
+        self.rng = rng
+        self.conn = None
+        self.headers = {'Accept-Encoding': 'gzip'}
+
+    def request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=dict(self.headers, **(headers or {})))
+                response = self.conn.getresponse()
+                response.read()
+                return response
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def login(self):
+        body = urlencode({'email': passenger_email(self.passenger_id), 'password': SYNTHETIC_PASSWORD})
+        response = self.request('POST', '/auth/login', body,
+                                {'Content-Type': 'application/x-www-form-urlencoded'})
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.headers['Cookie'] = cookie.split(';', 1)[0]
+
+    def path(self, page):
+        if page == 'search':
+            _, origin, destination, day = self.rng.choice(self.flights)
+            return '/user/search?' + urlencode({'origin': origin, 'destination': destination, 'date': day})
+        if page == 'results':
+            return '/user/results'
+        return '/user/my-reservations'
+
+    def run(self, stop, measuring, latencies, errors):
+        self.login()
+        names = list(PAGES)
+        weights = [PAGES[name] for name in names]
+        while not stop.is_set():
+            path = self.path(self.rng.choices(names, weights)[0])
+            started = time.perf_counter()
+            try:
+                status = self.request('GET', path).status
+            except (http.client.HTTPException, OSError):
+                status = None
+            if measuring.is_set():
+                latencies.append((time.perf_counter() - started) * 1000)
+                if status != 200:
+                    errors.append(status)
+
+
+def measure(args, path, flights, passengers, workers):
+    process = start_server(path, args.port, workers, args.threads)
+    try:
+        cold_start = wait_ready(process, args.port)
+        stop, measuring = threading.Event(), threading.Event()
+        latencies, errors = [], []
+        rng = random.Random(args.seed)
+        clients = [
+            Client(args.port, flights, rng.randrange(passengers) + 1, random.Random(args.seed + i))
+            for i in range(args.clients)
+        ]
+        threads = [
+            threading.Thread(target=client.run, args=(stop, measuring, latencies, errors), daemon=True)
+            for client in clients
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        measuring.set()
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        measuring.clear()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            exit_status = process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            exit_status = process.wait()
+
+    latencies.sort()
+    return {
+        'workers': workers,
+        'threads': args.threads,
+        'cold_start_ms': round(cold_start * 1000, 1),
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'exit_status': exit_status,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark serve.py across worker counts.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts.')
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker.')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds per worker count.')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds before measuring.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', help='Where the seeded databases live (default bench/data).')
+    args = parser.parse_args(argv)
+
+    path = database_path(args.scale, args.data_dir)
+    prepare(path, args.scale, seed_value=args.seed)
+    flights, passengers = sample_flights(path)
+
+    print(f'{args.scale} dataset, {args.clients} clients, {args.threads} threads per worker, '
+          f'{args.duration}s measured')
+    print(f"{'workers':>7} {'cold start ms':>14} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'exit':>5}")
+    for workers in [int(n) for n in args.workers.split(',')]:
+        r = measure(args, path, flights, passengers, workers)
+        print(f"{r['workers']:>7} {r['cold_start_ms']:>14.1f} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['errors']:>7} {r['exit_status']:>5}", flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
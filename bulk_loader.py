@@ -0,0 +1,442 @@
+"""
+Bulk loading
+
+Loads the ten Oracle tables in fixed-size batches with one executemany per
+batch (array DML on cx_Oracle) instead of adding model objects one by one.
+Rows are streamed, so memory stays flat however many rows are loaded.
+
+    # Import <TABLE>.csv / <TABLE>.parquet files found in a directory
+    flask --app app load files ./data
+
+    # Import one file into one table
+    flask --app app load file TICKET tickets.csv
+
+    # Generate a referentially consistent synthetic dataset
+    flask --app app load generate --flights 20000 --tickets 2000000
+
+CSV headers (and Parquet column names) are matched case-insensitively to the
+table's column names (FLIGHT_NUMBER) or model attributes (flight_number).
+Parquet needs pyarrow. The hot-query indexes (schema.py) are dropped during
+the load and rebuilt at the end unless --keep-indexes is given. After loading
+tickets, run `flask --app app inventory rebuild` and
+`flask --app app analytics rebuild` to update the derived tables.
+"""
+import csv
+import os
+import random
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Date, DateTime, Integer, Numeric, func, select
+from werkzeug.security import generate_password_hash
+
+import schema
+from models import (db, Airport, Airline, Aircraft, Flight, Passenger, Ticket, Payment,
+                    Staff, FlightStaff, TicketChange, SeatInventory, SeatMap, FlightStats)
+from seatmap import SEAT_CLASSES, cabin_layout, seat_label
+
+# Parents before children
+MODELS = (Airport, Airline, Aircraft, Flight, Passenger, Ticket, Payment, Staff, FlightStaff, TicketChange)
+TABLES = [model.__table__ for model in MODELS]
+TABLES_BY_NAME = {table.name: table for table in TABLES}
+
+BATCH_SIZE = 10_000
+
+# Every generated passenger logs in with this password. Its hash is stored at a
+# low cost so generating stays fast; login re-hashes it at PASSWORD_HASH_COST.
+SYNTHETIC_PASSWORD = 'synthetic'
+SYNTHETIC_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+# Base fare and class multipliers used for generated ticket prices
+BASE_FARE = 200
+CLASS_MULTIPLIERS = {'ECONOMY': 1.0, 'BUSINESS': 2.5, 'FIRST': 4.0}
+
+
+class ProgressReport:
+    """Rows written per table and rows/second, printed every `every` rows"""
+
+    def __init__(self, echo=click.echo, every=100_000):
+        self.echo = echo
+        self.every = every
+        self.started = time.perf_counter()
+        self.counts = {}
+        self.reported = {}
+
+    def add(self, table, rows):
+        count = self.counts[table] = self.counts.get(table, 0) + rows
+        if self.echo and count - self.reported.get(table, 0) >= self.every:
+            self.reported[table] = count
+            self.line(table)
+
+    def line(self, table):
+        elapsed = time.perf_counter() - self.started
+        count = self.counts.get(table, 0)
+        self.echo(f'  {table:<13} {count:>12,} rows  {self.total / elapsed if elapsed else 0:>10,.0f} rows/s'
+                  f'  ({elapsed:.1f}s)')
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def finish(self):
+        if not self.echo:
+            return
+        for table in self.counts:
+            if self.reported.get(table) != self.counts[table]:
+                self.line(table)
+        elapsed = time.perf_counter() - self.started
+        self.echo(f'Loaded {self.total:,} rows in {elapsed:.1f}s '
+                  f'({self.total / elapsed if elapsed else 0:,.0f} rows/s)')
+
+
+class BatchWriter:
+    """
+    Buffers rows per table and inserts each full buffer with one executemany.
+    Parent tables are flushed before their children, so foreign keys always
+    point at rows that are already in the database.
+    """
+
+    def __init__(self, conn, batch_size=BATCH_SIZE, progress=None):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.progress = progress
+        self.buffers = {}
+
+    def write(self, table, row):
+        buffer = self.buffers.setdefault(table.name, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(upto=table)
+
+    def flush(self, upto=None):
+        for table in TABLES:
+            buffer = self.buffers.get(table.name)
+            if buffer:
+                self.conn.execute(table.insert(), buffer)
+                if self.progress:
+                    self.progress.add(table.name, len(buffer))
+                self.buffers[table.name] = []
+            if table is upto:
+                break
+
+
+# -- File import ----------------------------------------------------------
+
+def column_converters(table):
+    """{header (lower case): (column name, converter)} for a table"""
+    model = next(model for model in MODELS if model.__table__ is table)
+    attributes = {column.name: key for key, column in model.__mapper__.columns.items()}
+    converters = {}
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            convert = datetime.fromisoformat
+        elif isinstance(column.type, Date):
+            convert = lambda value: date.fromisoformat(value[:10])
+        elif isinstance(column.type, Integer):
+            convert = int
+        elif isinstance(column.type, Numeric):
+            convert = Decimal
+        else:
+            convert = str
+        converters[column.name.lower()] = (column.name, convert)
+        converters[attributes[column.name].lower()] = (column.name, convert)
+    return converters
+
+
+def convert_row(converters, record):
+    row = {}
+    for header, value in record.items():
+        target = converters.get(header.strip().lower())
+        if target is None:
+            continue
+        name, convert = target
+        if value is None or value == '':
+            row[name] = None
+        elif isinstance(value, str):
+            row[name] = convert(value.strip())
+        else:
+            row[name] = value  # Parquet values are already typed
+    return row
+
+
+def read_records(path, batch_size=BATCH_SIZE):
+    """Stream dict records from a .csv or .parquet file"""
+    if path.lower().endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise click.ClickException('Loading Parquet files requires pyarrow (pip install pyarrow).')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+
+
+def load_file(conn, table, path, batch_size=BATCH_SIZE, progress=None):
+    converters = column_converters(table)
+    writer = BatchWriter(conn, batch_size, progress)
+    for record in read_records(path, batch_size):
+        writer.write(table, convert_row(converters, record))
+    writer.flush()
+
+
+def find_table_files(directory):
+    """[(table, path)] in load order for every <TABLE>.csv/.parquet in a directory"""
+    files = {}
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in ('.csv', '.parquet') and stem.upper() in TABLES_BY_NAME:
+            files[stem.upper()] = os.path.join(directory, name)
+    return [(table, files[table.name]) for table in TABLES if table.name in files]
+
+
+# -- Synthetic data -------------------------------------------------------
+
+def airport_code(i):
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return letters[i // 676 % 26] + letters[i // 26 % 26] + letters[i % 26]
+
+
+def flight_number(i):
+    return f'SY{i:07d}'
+
+
+def passenger_email(i):
+    return f'passenger{i}@example.com'
+
+
+def generate(conn, airports=50, airlines=10, aircraft_per_airline=10, staff_per_airline=40,
+             passengers=10_000, flights=2_000, tickets=100_000, start=None, days=60,
+             seed=42, batch_size=BATCH_SIZE, progress=None):
+    """
+    Generate and insert a synthetic dataset for all ten tables.
+
+    Flights never get more tickets than their cabins have seats, seat numbers
+    follow the seat map layout (seatmap.py), every ACTIVE ticket has a payment,
+    and every CANCELED ticket has a TICKETCHANGE row. Bookings, payments and
+    cancellations are dated before `start`, the earliest departure. Passengers
+    log in as passenger<i>@example.com with SYNTHETIC_PASSWORD. Only a few
+    small arrays per flight are kept in memory; tickets are streamed.
+    """
+    rng = random.Random(seed)
+    start = start or datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    writer = BatchWriter(conn, batch_size, progress)
+    capacities_choice = (120, 150, 180, 220, 300)
+
+    for i in range(airports):
+        writer.write(Airport.__table__, {'AIRPORT_CODE': airport_code(i), 'CITY': f'City {i}',
+                                         'COUNTRY': 'Synthland'})
+    for airline in range(1, airlines + 1):
+        writer.write(Airline.__table__, {'AIRLINE_ID': airline, 'NAME': f'Synth Air {airline}'})
+
+    aircraft = []  # (aircraft_id, airline_id, capacity)
+    for airline in range(1, airlines + 1):
+        for _ in range(aircraft_per_airline):
+            capacity = rng.choice(capacities_choice)
+            aircraft.append((len(aircraft) + 1, airline, capacity))
+            writer.write(Aircraft.__table__, {'AIRCRAFT_ID': len(aircraft), 'MODEL': f'S{capacity}',
+                                              'CAPACITY': capacity, 'AIRLINE_ID': airline})
+
+    # Staff ids are contiguous per airline: airline a owns ids (a-1)*n+1 .. a*n
+    roles = ['PILOT', 'COPILOT'] + ['CREW'] * 4
+    for staff_id in range(1, airlines * staff_per_airline + 1):
+        writer.write(Staff.__table__, {
+            'STAFF_ID': staff_id, 'FULL_NAME': f'Staff Member{staff_id}',
+            'ROLE': roles[(staff_id - 1) % len(roles)], 'PHONE': None,
+            'EMAIL': f'staff{staff_id}@example.com',
+            'AIRLINE_ID': (staff_id - 1) // staff_per_airline + 1,
+        })
+
+    flight_capacity = array('H')
+    for i in range(flights):
+        aircraft_id, airline, capacity = rng.choice(aircraft)
+        origin, destination = rng.sample(range(airports), 2)
+        minutes = rng.randrange(days * 24 * 12) * 5
+        duration = rng.randrange(60, 600, 5)
+        departure = start + timedelta(minutes=minutes)
+        flight_capacity.append(capacity)
+        writer.write(Flight.__table__, {
+            'FLIGHT_NUMBER': flight_number(i), 'AIRLINE_ID': airline, 'AIRCRAFT_ID': aircraft_id,
+            'DEPARTURE_AIRPORT': airport_code(origin), 'ARRIVAL_AIRPORT': airport_code(destination),
+            'DEPARTURE_TIME': departure, 'ARRIVAL_TIME': departure + timedelta(minutes=duration),
+            'DURATION_MINUTES': duration,
+        })
+        first_staff = (airline - 1) * staff_per_airline + 1
+        crew = rng.sample(range(first_staff, first_staff + staff_per_airline), min(4, staff_per_airline))
+        for position, staff_id in enumerate(crew):
+            writer.write(FlightStaff.__table__, {
+                'FLIGHT_NUMBER': flight_number(i), 'STAFF_ID': staff_id,
+                'ROLE_ON_FLIGHT': ('CAPTAIN', 'FIRST OFFICER')[position] if position < 2 else 'CABIN CREW',
+            })
+
+    password_hash = generate_password_hash(SYNTHETIC_PASSWORD, SYNTHETIC_HASH_METHOD)
+    for i in range(1, passengers + 1):
+        writer.write(Passenger.__table__, {
+            'PASSENGER_ID': i, 'FULL_NAME': f'Synth Passenger{i}',
+            'DATE_OF_BIRTH': date(1950, 1, 1) + timedelta(days=rng.randrange(20000)),
+            'NATIONALITY': 'Synthland', 'PHONE': None, 'EMAIL': passenger_email(i),
+            'PASSWORD_HASH': password_hash,
+        })
+
+    layouts = {capacity: cabin_layout(capacity) for capacity in capacities_choice}
+    class_weights = [layouts[120][cls][1] for cls in SEAT_CLASSES]
+    booked = {cls: array('H', bytes(2 * flights)) for cls in SEAT_CLASSES}
+    payment_id = change_id = 0
+    for number in range(1, tickets + 1):
+        f = rng.randrange(flights)
+        seat_class = rng.choices(SEAT_CLASSES, class_weights)[0]
+        first_row, seats = layouts[flight_capacity[f]][seat_class]
+        if booked[seat_class][f] >= seats:
+            continue  # Cabin full; skip rather than oversell
+        seat = seat_label(first_row, booked[seat_class][f])
+        booked[seat_class][f] += 1
+        # Booked before `start`, the earliest departure, so no booking lies in the future
+        booking_date = start - timedelta(days=rng.randrange(120), minutes=rng.randrange(1, 1440))
+        price = Decimal(BASE_FARE * CLASS_MULTIPLIERS[seat_class]).quantize(Decimal('0.01'))
+        status = 'ACTIVE' if rng.random() < 0.92 else 'CANCELED'
+        writer.write(Ticket.__table__, {
+            'TICKET_NUMBER': number, 'PASSENGER_ID': rng.randrange(passengers) + 1,
+            'FLIGHT_NUMBER': flight_number(f), 'SEAT_NUMBER': seat, 'SEAT_CLASS': seat_class,
+            'PRICE': price, 'BOOKING_DATE': booking_date, 'STATUS': status,
+        })
+        if status == 'ACTIVE':
+            payment_id += 1
+            writer.write(Payment.__table__, {
+                'PAYMENT_ID': payment_id, 'TICKET_NUMBER': number, 'PAYMENT_DATE': booking_date,
+                'AMOUNT': price, 'METHOD': rng.choice(('CARD', 'CARD', 'WALLET', 'CASH')),
+            })
+        else:
+            # A cancelled seat stays taken in this dataset, so seat numbers stay unique
+            change_id += 1
+            changed_at = min(booking_date + timedelta(hours=rng.randrange(1, 48)), start - timedelta(minutes=1))
+            writer.write(TicketChange.__table__, {
+                'CHANGE_ID': change_id, 'TICKET_NUMBER': number, 'CHANGE_DATE': changed_at, 'NEW_STATUS': status,
+            })
+    writer.flush()
+
+
+# -- Helpers shared by the commands ---------------------------------------
+
+def non_empty_tables(conn, tables):
+    return [table.name for table in tables
+            if conn.execute(select(func.count()).select_from(table)).scalar()]
+
+
+def dependent_tables(tables):
+    """Loaded tables that reference one of `tables` but are not in it"""
+    names = {table.name for table in tables}
+    return [table for table in TABLES if table.name not in names and any(
+        fk.column.table.name in names for fk in table.foreign_keys
+    )]
+
+
+def clear_tables(conn, tables):
+    blocking = non_empty_tables(conn, dependent_tables(tables))
+    if blocking:
+        raise click.ClickException(
+            f"Cannot replace: rows in {', '.join(blocking)} reference the tables being loaded."
+        )
+    if Flight.__table__ in tables:
+        # Derived per-flight rows (inventory.py, analytics.py) would point at deleted flights
+        conn.execute(SeatMap.__table__.delete())
+        conn.execute(SeatInventory.__table__.delete())
+        conn.execute(FlightStats.__table__.delete())
+    for table in reversed(TABLES):
+        if table in tables:
+            conn.execute(table.delete())
+
+
+def run_load(load, tables, batch_size, replace, keep_indexes):
+    """Run load(conn, progress) in one transaction with the index and emptiness checks"""
+    engine = db.engine
+    progress = ProgressReport()
+    dropped = [] if keep_indexes else schema.drop_indexes(engine)
+    try:
+        with engine.begin() as conn:
+            if replace:
+                clear_tables(conn, tables)
+            else:
+                filled = non_empty_tables(conn, tables)
+                if filled:
+                    raise click.ClickException(
+                        f"Tables already contain rows: {', '.join(filled)} (use --replace to clear them first)."
+                    )
+            load(conn, progress)
+    finally:
+        if dropped:
+            schema.create_indexes(engine)
+            click.echo(f"Rebuilt indexes: {', '.join(dropped)}")
+    progress.finish()
+
+
+DERIVED_HINT = ('Run `flask --app app inventory rebuild` and `flask --app app analytics rebuild` '
+                'to bring SEAT_INVENTORY and FLIGHT_STATS up to date.')
+
+loader_cli = AppGroup('load', help='Bulk load the tables from files or synthetic data.')
+
+batch_option = click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Rows per executemany.')
+replace_option = click.option('--replace', is_flag=True, help='Delete the existing rows of the loaded tables first.')
+indexes_option = click.option('--keep-indexes', is_flag=True, help='Do not drop the hot-query indexes during the load.')
+
+
+@loader_cli.command('file')
+@click.argument('table_name')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@batch_option
+@replace_option
+@indexes_option
+def file_command(table_name, path, batch_size, replace, keep_indexes):
+    """Load one CSV/Parquet file into TABLE_NAME."""
+    table = TABLES_BY_NAME.get(table_name.upper())
+    if table is None:
+        raise click.ClickException(f"Unknown table {table_name}; expected one of {', '.join(TABLES_BY_NAME)}.")
+    run_load(lambda conn, progress: load_file(conn, table, path, batch_size, progress),
+             [table], batch_size, replace, keep_indexes)
+    if table is Ticket.__table__:
+        click.echo(DERIVED_HINT)
+
+
+@loader_cli.command('files')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@batch_option
+@replace_option
+@indexes_option
+def files_command(directory, batch_size, replace, keep_indexes):
+    """Load every <TABLE>.csv / <TABLE>.parquet in DIRECTORY, parents first."""
+    found = find_table_files(directory)
+    if not found:
+        raise click.ClickException(f'No <TABLE>.csv or <TABLE>.parquet files in {directory}.')
+
+    def load(conn, progress):
+        for table, path in found:
+            click.echo(f'{table.name} <- {path}')
+            load_file(conn, table, path, batch_size, progress)
+
+    run_load(load, [table for table, _ in found], batch_size, replace, keep_indexes)
+    if any(table is Ticket.__table__ for table, _ in found):
+        click.echo(DERIVED_HINT)
+
+
+@loader_cli.command('generate')
+@click.option('--airports', default=50, show_default=True)
+@click.option('--airlines', default=10, show_default=True)
+@click.option('--aircraft-per-airline', default=10, show_default=True)
+@click.option('--staff-per-airline', default=40, show_default=True)
+@click.option('--passengers', default=10_000, show_default=True)
+@click.option('--flights', default=2_000, show_default=True)
+@click.option('--tickets', default=100_000, show_default=True)
+@click.option('--days', default=60, show_default=True, help='Days of schedule, starting tomorrow.')
+@click.option('--seed', default=42, show_default=True)
+@batch_option
+@replace_option
+@indexes_option
+def generate_command(batch_size, replace, keep_indexes, **sizes):
+    """Generate a referentially consistent synthetic dataset for all ten tables."""
+    run_load(lambda conn, progress: generate(conn, batch_size=batch_size, progress=progress, **sizes),
+             TABLES, batch_size, replace, keep_indexes)
+    click.echo(DERIVED_HINT)
@@ -0,0 +1,257 @@
+"""
+Small TTL cache with pluggable backends
+
+MemoryBackend keeps entries in-process (bounded LRU); RedisBackend shares them
+between worker processes and is only imported when configured. Entries can be
+tagged so that everything derived from, say, one flight can be dropped at once.
+TTLCache adds hit/miss/eviction counters on top of either backend.
+
+A value loaded on a miss may be stale by the time it is stored: a booking can
+invalidate its tags while the loader is still reading. Backends therefore
+number their invalidations; a load notes the number before reading
+(generation()) and set(..., since=that) stores nothing when one of the
+entry's tags, or its key, was invalidated (or the cache cleared) meanwhile.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+# Invalidation marks besides the tags: one key's deletion, and clear()
+KEY_MARK = 'key:'
+CLEARED = '*cleared*'
+
+# How long an invalidation is remembered for the loads in flight
+INVALIDATION_MEMORY_SECONDS = 300
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # key -> (expires_at, value, tags)
+        self._tags = {}                 # tag -> set of keys
+        self._lock = threading.Lock()
+        self._generation = 0            # bumped by every invalidation
+        self._invalidated = {}          # tag, KEY_MARK + key or CLEARED -> (generation, monotonic time)
+        self._prune_at = 1024
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[1]
+
+    def generation(self):
+        """Invalidation number to pass to set(since=...) for a value about to be loaded"""
+        return self._generation
+
+    def set(self, key, value, ttl, tags=(), since=None):
+        with self._lock:
+            if since is not None and self._stale(key, tags, since):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._invalidate([KEY_MARK + key])
+            return self._remove(key)
+
+    def invalidate_tags(self, tags):
+        """Drop every entry carrying any of the tags; returns how many were dropped"""
+        with self._lock:
+            self._invalidate(tags)
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.pop(tag, set())
+            return sum(self._remove(key) for key in keys)
+
+    def clear(self):
+        with self._lock:
+            self._invalidate([CLEARED])
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _invalidate(self, marks):
+        self._generation += 1
+        now = time.monotonic()
+        for mark in marks:
+            self._invalidated[mark] = (self._generation, now)
+        if len(self._invalidated) > self._prune_at:
+            # No load runs for minutes, so older invalidations cannot make one stale
+            self._invalidated = {mark: stamp for mark, stamp in self._invalidated.items()
+                                 if stamp[1] > now - INVALIDATION_MEMORY_SECONDS}
+            self._prune_at = max(1024, 2 * len(self._invalidated))
+
+    def _stale(self, key, tags, since):
+        invalidated = self._invalidated
+        return any(invalidated.get(mark, (-1,))[0] > since for mark in (CLEARED, KEY_MARK + key, *tags))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+
+class RedisBackend:
+    """Shared backend; Redis expires entries itself and evicts under its maxmemory policy"""
+
+    def __init__(self, url, prefix='flightapp:'):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    def generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def set(self, key, value, ttl, tags=(), since=None):
+        if since is not None and self._stale(key, tags, since):
+            return False
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)))
+        for tag in tags:
+            pipe.sadd(self.prefix + 'tag:' + tag, key)
+            pipe.expire(self.prefix + 'tag:' + tag, max(1, int(ttl)))
+        pipe.execute()
+        return True
+
+    def delete(self, key):
+        self._invalidate([KEY_MARK + key])
+        return bool(self.client.delete(self.prefix + key))
+
+    def invalidate_tags(self, tags):
+        self._invalidate(tags)
+        keys = set()
+        for tag in tags:
+            members = self.client.smembers(self.prefix + 'tag:' + tag)
+            keys |= {m.decode() for m in members}
+            self.client.delete(self.prefix + 'tag:' + tag)
+        if not keys:
+            return 0
+        return self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        # The invalidation numbers stay: loads in flight compare with them
+        kept = (self.prefix + 'generation', self.prefix + 'inv:')
+        for key in self.client.scan_iter(self.prefix + '*'):
+            if not key.decode().startswith(kept):
+                self.client.delete(key)
+        self._invalidate([CLEARED])
+
+    def _invalidate(self, marks):
+        generation = self.client.incr(self.prefix + 'generation')
+        pipe = self.client.pipeline()
+        for mark in marks:
+            pipe.set(self.prefix + 'inv:' + mark, generation, ex=INVALIDATION_MEMORY_SECONDS)
+        pipe.execute()
+
+    def _stale(self, key, tags, since):
+        marks = [CLEARED, KEY_MARK + key, *tags]
+        stamps = self.client.mget([self.prefix + 'inv:' + mark for mark in marks])
+        return any(stamp is not None and int(stamp) > since for stamp in stamps)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + '*'))
+
+
+def make_backend(name, max_entries=1024, redis_url=None, prefix='flightapp:'):
+    """Backend by name: 'memory' or 'redis'"""
+    if name == 'memory':
+        return MemoryBackend(max_entries)
+    if name == 'redis':
+        return RedisBackend(redis_url, prefix)
+    raise ValueError(f"Unknown cache backend '{name}' (expected 'memory' or 'redis')")
+
+
+class TTLCache:
+    """Cache front end with hit/miss/invalidation counters"""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        found, value = self.backend.get(key)
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found, value
+
+    def generation(self):
+        """Note before loading a value; pass to set(since=...) so a stale value is not stored"""
+        return self.backend.generation()
+
+    def set(self, key, value, ttl=None, tags=(), since=None):
+        """Store a value; with since, only if nothing it depends on was invalidated after that"""
+        return self.backend.set(key, value, self.ttl if ttl is None else ttl, tags, since)
+
+    def get_or_load(self, key, loader, tags=lambda value: ()):
+        """Cached value for key, calling loader() (and tags(value)) on a miss"""
+        found, value = self.get(key)
+        if not found:
+            since = self.generation()
+            value = loader()
+            self.set(key, value, tags=tags(value), since=since)
+        return value
+
+    def delete(self, key):
+        if self.backend.delete(key):
+            self.invalidations += 1
+
+    def invalidate_tags(self, tags):
+        self.invalidations += self.backend.invalidate_tags(tags)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.backend.evictions,
+            'expirations': self.backend.expirations,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,204 @@
+"""
+Database engine configuration
+
+Builds the SQLAlchemy URI and engine options from environment variables so the
+same application can run against Oracle (pooled connections) or a SQLite
+stand-in (no Oracle server needed, e.g. for local runs and benchmarks).
+
+Environment variables:
+    DB_BACKEND               oracle (default) or sqlite
+    SQLITE_PATH              SQLite file path, or :memory: (default) for in-memory
+    DB_POOL_SIZE             connections kept open in the pool (default 5)
+    DB_POOL_MAX_OVERFLOW     extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT          seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE          seconds before a connection is replaced (default 1800)
+    DB_POOL_PRE_PING         check connections before use (default true)
+    DB_STATEMENT_CACHE_SIZE  cx_Oracle statement cache per connection (default 50)
+    ORACLE_SESSION_POOL      use a cx_Oracle SessionPool instead of SQLAlchemy's pool
+    ORACLE_DRCP              connect through Database Resident Connection Pooling
+    ORACLE_DRCP_CLASS        connection class name used with DRCP (default FLIGHTAPP)
+    DB_REPLICAS              comma-separated read replicas: SQLAlchemy URLs, or file paths
+                             with the SQLite backend (opened read-only); see replicas.py
+"""
+import os
+
+from sqlalchemy.pool import NullPool, StaticPool
+
+
+def env_int(name, default):
+    """Read an integer environment variable"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_float(name, default):
+    """Read a float environment variable"""
+    value = os.getenv(name)
+    return float(value) if value not in (None, '') else default
+
+
+def env_bool(name, default=False):
+    """Read a boolean environment variable (1/true/yes/on)"""
+    value = os.getenv(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+DB_BACKEND = os.getenv('DB_BACKEND', 'oracle').strip().lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', ':memory:')
+
+POOL_SIZE = env_int('DB_POOL_SIZE', 5)
+POOL_MAX_OVERFLOW = env_int('DB_POOL_MAX_OVERFLOW', 10)
+POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)
+POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+STATEMENT_CACHE_SIZE = env_int('DB_STATEMENT_CACHE_SIZE', 50)
+
+ORACLE_SESSION_POOL = env_bool('ORACLE_SESSION_POOL')
+ORACLE_DRCP = env_bool('ORACLE_DRCP')
+ORACLE_DRCP_CLASS = os.getenv('ORACLE_DRCP_CLASS', 'FLIGHTAPP')
+
+REPLICAS = [replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',') if replica.strip()]
+
+
+def sqlite_config():
+    """URI and engine options for the SQLite stand-in backend"""
+    if SQLITE_PATH in ('', ':memory:'):
+        # One shared connection, otherwise every connection sees its own empty database
+        return 'sqlite://', {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False},
+        }
+    return f'sqlite:///{os.path.abspath(SQLITE_PATH)}', sqlite_file_options()
+
+
+def sqlite_file_options():
+    """Engine options for a SQLite database file"""
+    return {
+        'pool_size': POOL_SIZE,
+        'max_overflow': POOL_MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_pre_ping': POOL_PRE_PING,
+        'connect_args': {'check_same_thread': False, 'timeout': POOL_TIMEOUT},
+    }
+
+
+def oracle_config():
+    """
+    URI and engine options for Oracle, using the credentials in oracle_config.py.
+    Nothing is imported or opened until the first connection is needed, and a
+    SessionPool belongs to the process that created it, so a forked worker
+    builds its own.
+    """
+    sessions = {}  # pid -> cx_Oracle.SessionPool
+
+    def connect_args():
+        # Imported here so the SQLite backend works without cx_Oracle installed
+        import cx_Oracle
+        import oracle_config as creds
+
+        if ORACLE_DRCP:
+            dsn = cx_Oracle.makedsn(creds.ORACLE_HOST, creds.ORACLE_PORT,
+                                    sid=creds.ORACLE_SID, server_type='pooled')
+            purity = {'cclass': ORACLE_DRCP_CLASS, 'purity': cx_Oracle.ATTR_PURITY_SELF}
+        else:
+            dsn = creds.ORACLE_DSN
+            purity = {}
+        return cx_Oracle, creds, dsn, purity
+
+    if ORACLE_SESSION_POOL:
+        def session_pool():
+            pid = os.getpid()
+            if pid not in sessions:
+                cx_Oracle, creds, dsn, purity = connect_args()
+                # cx_Oracle keeps the sessions; SQLAlchemy just borrows and returns them
+                pool = cx_Oracle.SessionPool(
+                    user=creds.ORACLE_USERNAME,
+                    password=creds.ORACLE_PASSWORD,
+                    dsn=dsn,
+                    min=POOL_SIZE,
+                    max=POOL_SIZE + POOL_MAX_OVERFLOW,
+                    increment=1,
+                    threaded=True,
+                    getmode=cx_Oracle.SPOOL_ATTRVAL_TIMEDWAIT,
+                    wait_timeout=POOL_TIMEOUT * 1000,
+                    max_lifetime_session=POOL_RECYCLE,
+                    encoding='UTF-8',
+                )
+                pool.stmtcachesize = STATEMENT_CACHE_SIZE
+                sessions.clear()  # A pool inherited from the parent process is never used here
+                sessions[pid] = (pool, purity)
+            return sessions[pid]
+
+        def creator():
+            pool, purity = session_pool()
+            return pool.acquire(**purity)
+
+        return 'oracle+cx_oracle://', {
+            'creator': creator,
+            'poolclass': NullPool,
+            'pool_pre_ping': POOL_PRE_PING,
+        }
+
+    def creator():
+        cx_Oracle, creds, dsn, purity = connect_args()
+        connection = cx_Oracle.connect(
+            user=creds.ORACLE_USERNAME,
+            password=creds.ORACLE_PASSWORD,
+            dsn=dsn,
+            encoding='UTF-8',
+            **purity
+        )
+        connection.stmtcachesize = STATEMENT_CACHE_SIZE
+        return connection
+
+    return 'oracle+cx_oracle://', {
+        'creator': creator,
+        'pool_size': POOL_SIZE,
+        'max_overflow': POOL_MAX_OVERFLOW,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_recycle': POOL_RECYCLE,
+        'pool_pre_ping': POOL_PRE_PING,
+    }
+
+
+def get_database_config():
+    """Return (SQLALCHEMY_DATABASE_URI, SQLALCHEMY_ENGINE_OPTIONS) for DB_BACKEND"""
+    if DB_BACKEND == 'sqlite':
+        return sqlite_config()
+    if DB_BACKEND == 'oracle':
+        return oracle_config()
+    raise ValueError(f"Unknown DB_BACKEND '{DB_BACKEND}' (expected 'oracle' or 'sqlite')")
+
+
+def replica_binds():
+    """SQLALCHEMY_BINDS entries (replica0, replica1, ...) for the replicas in DB_REPLICAS"""
+    binds = {}
+    for i, replica in enumerate(REPLICAS):
+        if '://' in replica:
+            options = {
+                'url': replica,
+                'pool_size': POOL_SIZE,
+                'max_overflow': POOL_MAX_OVERFLOW,
+                'pool_timeout': POOL_TIMEOUT,
+                'pool_recycle': POOL_RECYCLE,
+                'pool_pre_ping': POOL_PRE_PING,
+            }
+        elif DB_BACKEND == 'sqlite':
+            # Read-only, so a write routed to a replica by mistake fails instead of diverging
+            options = dict(sqlite_file_options(), url=f'sqlite:///file:{os.path.abspath(replica)}?mode=ro&uri=true')
+        else:
+            raise ValueError(f"DB_REPLICAS entry '{replica}' is not a database URL")
+        binds[f'replica{i}'] = options
+    return binds
+
+
+def describe_database():
+    """Short human-readable description of the configured database"""
+    replicas = f' + {len(REPLICAS)} read replica(s)' if REPLICAS else ''
+    if DB_BACKEND == 'sqlite':
+        return f'SQLite ({SQLITE_PATH}){replicas}'
+    import oracle_config as creds
+    mode = 'DRCP' if ORACLE_DRCP else ('SessionPool' if ORACLE_SESSION_POOL else 'QueuePool')
+    return f'Oracle {creds.ORACLE_USERNAME}@{creds.ORACLE_HOST} (SID {creds.ORACLE_SID}, {mode}){replicas}'
@@ -0,0 +1,96 @@
+"""
+Flexible-date fare calendar
+
+For an origin/destination pair and a date, the days from date - N to date + N,
+each with the number of flights that have seats, the cheapest economy fare and
+the earliest departure. One grouped query covers the whole range instead of
+one search per day:
+
+    SELECT day, COUNT(*), MIN(departure_time), MIN(route x demand)
+      FROM (SELECT CASE WHEN departure_time < :day1 THEN 0
+                        WHEN departure_time < :day2 THEN 1 ... END AS day, ...
+              FROM FLIGHT JOIN AIRCRAFT ... LEFT JOIN (ACTIVE tickets per flight) ...
+             WHERE departure_time >= :first AND departure_time < :end AND seats > 0 ...)
+     GROUP BY day
+
+The day bucket compares DEPARTURE_TIME with bound day boundaries, so no
+dialect date function is needed and the range filter can use the index. The
+buckets are grouped in an outer query because Oracle only groups by an
+expression that matches the select list exactly, bind names included.
+
+All flights of a day share the urgency markup (pricing counts calendar days),
+so the cheapest fare of a day is pricing.day_fare() of the smallest
+route x demand part, which the database computes.
+
+    CALENDAR_MAX_DAYS   largest N accepted (default 7)
+"""
+from datetime import timedelta
+
+from airport_index import codes_filter
+from db_config import env_int
+from models import db, Aircraft, Flight
+from pricing import pricing
+from schema import day_range
+
+CALENDAR_MAX_DAYS = env_int('CALENDAR_MAX_DAYS', 7)
+
+
+def calendar_statement(origin_codes, destination_codes, start, days):
+    """Grouped SELECT of (day index, flights, earliest departure, cheapest route x demand)"""
+    boundaries = [start + timedelta(days=i) for i in range(1, days)]
+    end = start + timedelta(days=days)
+    bucket = db.case(
+        *((Flight.departure_time < boundary, index) for index, boundary in enumerate(boundaries)),
+        else_=days - 1
+    ) if boundaries else db.literal(0)
+
+    booked = Flight.booked_seats_subquery()
+    booked_seats = db.func.coalesce(booked.c.booked, 0)
+    flights = db.select(
+        bucket.label('day'),
+        Flight.departure_time.label('departure_time'),
+        pricing.route_demand_expression(Aircraft.capacity, booked_seats, Flight.duration_minutes).label('fare'),
+    ).join(
+        Aircraft, Flight.aircraft_id == Aircraft.aircraft_id
+    ).outerjoin(
+        booked, booked.c.flight_number == Flight.flight_number
+    ).where(
+        Aircraft.capacity - booked_seats > 0,
+        codes_filter(Flight.departure_airport, origin_codes),
+        codes_filter(Flight.arrival_airport, destination_codes),
+        Flight.departure_time >= start,
+        Flight.departure_time < end,
+    ).subquery()
+
+    return db.select(
+        flights.c.day,
+        db.func.count().label('flights'),
+        db.func.min(flights.c.departure_time).label('earliest'),
+        db.func.min(flights.c.fare).label('fare'),
+    ).group_by(flights.c.day)
+
+
+def fare_calendar(origin_codes, destination_codes, day, spread):
+    """
+    One entry per day from day - spread to day + spread:
+    {'date', 'flights', 'cheapest_fare', 'earliest_departure'}; days without a
+    flight with seats have 0 flights and None for the others.
+    """
+    first = day - timedelta(days=spread)
+    days = 2 * spread + 1
+    found = {}
+    if origin_codes and destination_codes:
+        statement = calendar_statement(origin_codes, destination_codes, day_range(first)[0], days)
+        found = {row.day: row for row in db.session.execute(statement)}
+
+    calendar = []
+    for index in range(days):
+        date = first + timedelta(days=index)
+        row = found.get(index)
+        calendar.append({
+            'date': date,
+            'flights': row.flights if row else 0,
+            'cheapest_fare': pricing.day_fare(row.fare, date) if row else None,
+            'earliest_departure': row.earliest if row else None,
+        })
+    return calendar
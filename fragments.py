@@ -0,0 +1,102 @@
+"""
+Template fragment caching
+
+Listings render one card per flight or ticket. The cards are rendered through
+the flight_card() / reservation_card() template globals, which cache the
+rendered HTML under a key made of everything the card shows that can change:
+
+    flight card        flight number, available seats, schedule, price, airline
+    reservation card   ticket number, status, seat, price, flight schedule
+
+A booking or cancellation changes the flight's seat count and so its key,
+which means entries never need invalidating; stale ones age out of the LRU.
+The templates are also compiled once per machine instead of once per worker
+start through Jinja's on-disk bytecode cache.
+
+Configuration (app.config, defaults read from the environment):
+    FRAGMENT_CACHE               memory (default) or none
+    FRAGMENT_CACHE_TTL           seconds a card stays cached (default 600)
+    FRAGMENT_CACHE_MAX_ENTRIES   cards kept per worker (default 5000)
+    JINJA_BYTECODE_CACHE_DIR     directory for compiled templates ('' to disable)
+"""
+import os
+import tempfile
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from cache import MemoryBackend, TTLCache
+from db_config import env_int
+from models import format_datetime
+
+
+class FragmentCache:
+    """Rendered card HTML by content key; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE', os.getenv('FRAGMENT_CACHE', 'memory'))
+        app.config.setdefault('FRAGMENT_CACHE_TTL', env_int('FRAGMENT_CACHE_TTL', 600))
+        app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', env_int('FRAGMENT_CACHE_MAX_ENTRIES', 5000))
+        app.config.setdefault('JINJA_BYTECODE_CACHE_DIR', os.getenv(
+            'JINJA_BYTECODE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'flightapp-jinja')
+        ))
+
+        if app.config['FRAGMENT_CACHE'] == 'none':
+            self.cache = None
+        else:
+            # Rendered HTML is cheap to rebuild, so each worker keeps its own copy
+            self.cache = TTLCache(MemoryBackend(app.config['FRAGMENT_CACHE_MAX_ENTRIES']),
+                                  app.config['FRAGMENT_CACHE_TTL'])
+
+        directory = app.config['JINJA_BYTECODE_CACHE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+        app.add_template_global(self.flight_card)
+        app.add_template_global(self.reservation_card)
+        app.add_template_filter(format_datetime, 'display_datetime')
+
+    @staticmethod
+    def _render(template, macro, arguments):
+        # The cards are macros of a template module that Jinja builds once, so
+        # a card costs a macro call instead of a new template context per card
+        module = current_app.jinja_env.get_template(template).module
+        return str(getattr(module, macro)(**arguments))
+
+    def render(self, key, template, macro, **arguments):
+        """HTML of template's macro called with arguments, cached under key"""
+        if self.cache is None:
+            return Markup(self._render(template, macro, arguments))
+        found, html = self.cache.get(key)
+        if not found:
+            html = self._render(template, macro, arguments)
+            self.cache.set(key, html)
+        return Markup(html)
+
+    def flight_card(self, flight, book_label='Book Flight', labelled=False, spaced=False):
+        """Card of a FlightSummary"""
+        key = repr(('flight', flight.flight_number, flight.available_seats, flight.departure_time,
+                    flight.arrival_time, flight.price, flight.airline_name, book_label, labelled, spaced))
+        return self.render(key, '_flight_card.html', 'flight_card', flight=flight, book_label=book_label,
+                           labelled=labelled, spaced=spaced)
+
+    def reservation_card(self, ticket):
+        """Card of a Ticket (with its flight loaded)"""
+        flight = ticket.flight
+        key = repr(('ticket', ticket.ticket_number, ticket.status, ticket.seat_number, ticket.seat_class,
+                    str(ticket.price), ticket.booking_date, flight.flight_number, flight.departure_time,
+                    flight.departure_airport, flight.arrival_airport, flight.airline_name))
+        return self.render(key, '_reservation_card.html', 'reservation_card', reservation=ticket)
+
+    def stats(self):
+        return self.cache.stats() if self.cache is not None else {'enabled': False}
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,136 @@
+"""
+Conditional GET and response compression
+
+Listing views compute a cheap version stamp of what the page shows (for
+example the count and latest booking/change time of a passenger's tickets)
+and ask not_modified() for a 304 before loading and rendering anything:
+
+    stamp = reservations_stamp(current_user.passenger_id)
+    unchanged = http_cache.not_modified(*stamp, last_modified=max(...))
+    if unchanged is not None:
+        return unchanged
+
+The ETag is a digest of the stamp, the URL (page cursor included), the user
+and the templates, so it changes with any of them. Pages are sent with
+"Cache-Control: private, no-cache": browsers keep them but revalidate on
+every load, and shared caches never store them.
+
+Blueprints opt in to gzip with http_cache.compress(blueprint); streamed
+responses (the NDJSON API) are left alone.
+
+Configuration (app.config, defaults read from the environment):
+    HTTP_CONDITIONAL     ETag / Last-Modified / 304 handling (default on)
+    HTTP_ETAG_SALT       mixed into every ETag (default: digest of the templates)
+    COMPRESS_MIN_SIZE    smallest body compressed, in bytes (default 1024)
+    COMPRESS_LEVEL       gzip level 1-9 (default 6)
+"""
+import gzip
+import hashlib
+import os
+from datetime import timezone
+from functools import partial
+
+from flask import current_app, g, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from db_config import env_bool, env_int
+
+COMPRESSIBLE = ('text/html', 'application/json')
+
+
+def template_digest(app):
+    """Digest of the template files, so a deploy that changes them changes every ETag"""
+    digest = hashlib.sha1()
+    folder = os.path.join(app.root_path, app.template_folder or 'templates')
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, folder).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class HttpCache:
+    """ETag/304 handling and per-blueprint gzip; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.salt = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HTTP_CONDITIONAL', env_bool('HTTP_CONDITIONAL', True))
+        app.config.setdefault('HTTP_ETAG_SALT', os.getenv('HTTP_ETAG_SALT') or template_digest(app))
+        app.config.setdefault('COMPRESS_MIN_SIZE', env_int('COMPRESS_MIN_SIZE', 1024))
+        app.config.setdefault('COMPRESS_LEVEL', env_int('COMPRESS_LEVEL', 6))
+        self.salt = app.config['HTTP_ETAG_SALT']
+        app.after_request(self._add_validators)
+
+    # -- Conditional GET ---------------------------------------------------
+
+    def etag(self, stamp):
+        user = current_user.get_id() if current_user.is_authenticated else None
+        return hashlib.sha1(repr((self.salt, request.full_path, user, stamp)).encode()).hexdigest()
+
+    def not_modified(self, *stamp, last_modified=None):
+        """
+        304 response when the client's copy of this page matches the stamp,
+        else None (and the validators are added to the page rendered next).
+        """
+        if not current_app.config['HTTP_CONDITIONAL'] or request.method not in ('GET', 'HEAD'):
+            return None
+        # Pending flash messages go into the page, so it must be rendered and not reused later
+        if session.get('_flashes'):
+            return None
+
+        etag = self.etag(stamp)
+        if last_modified is not None:
+            # Stored times are local; HTTP dates are UTC
+            last_modified = last_modified.astimezone(timezone.utc)
+        g.http_validators = (etag, last_modified)
+        if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return None
+        response = current_app.response_class(status=304)
+        return self._add_validators(response)
+
+    @staticmethod
+    def _add_validators(response):
+        validators = g.pop('http_validators', None)
+        if validators is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = validators
+        # Weak: the gzip and identity encodings of a page share the tag
+        response.set_etag(etag, weak=True)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    # -- Compression -------------------------------------------------------
+
+    def compress(self, blueprint, mimetypes=COMPRESSIBLE, min_size=None, level=None):
+        """gzip the blueprint's responses of these types (COMPRESS_* settings unless given)"""
+        blueprint.after_request(partial(self._compress, mimetypes, min_size, level))
+
+    @staticmethod
+    def _compress(mimetypes, min_size, level, response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype not in mimetypes or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+        data = response.get_data()
+        if len(data) < (current_app.config['COMPRESS_MIN_SIZE'] if min_size is None else min_size):
+            return response
+        level = current_app.config['COMPRESS_LEVEL'] if level is None else level
+        response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+
+http_cache = HttpCache()
@@ -0,0 +1,196 @@
+"""
+Seat inventory
+
+SEAT_INVENTORY holds the remaining seats of every flight per cabin class, so
+booking never has to count TICKET rows. A booking is one conditional UPDATE
+
+    UPDATE SEAT_INVENTORY SET REMAINING = REMAINING - :n
+     WHERE FLIGHT_NUMBER = :f AND SEAT_CLASS = :c AND REMAINING >= :n
+
+in the same transaction as the ticket inserts: the row lock serializes
+concurrent bookings of one flight/class and a request that would oversell
+updates nothing. Cancellation gives the seats back the same way. Rows are
+created from TICKET the first time a flight is booked, and
+
+    flask --app app inventory rebuild
+
+recomputes all of them, and the seat maps (seatmap.py), from TICKET (e.g.
+after loading data directly). Legacy tickets whose seat number is taken twice
+or lies outside their cabin are given the seat the map assigns them.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Aircraft, Flight, SeatInventory, SeatMap, Ticket
+from seatmap import build_seat_maps, cabin_capacities
+
+
+def active_counts(flight_numbers=None):
+    """{(flight_number, seat_class): ACTIVE tickets} from one grouped query"""
+    query = db.session.query(
+        Ticket.flight_number, Ticket.seat_class, db.func.count(Ticket.ticket_number)
+    ).filter(Ticket.status == 'ACTIVE')
+    if flight_numbers is not None:
+        query = query.filter(Ticket.flight_number.in_(flight_numbers))
+    rows = query.group_by(Ticket.flight_number, Ticket.seat_class).all()
+    return {(flight, cls): count for flight, cls, count in rows}
+
+
+def active_seat_numbers(flight_numbers):
+    """{flight_number: [(ticket number, seat number, seat class) of ACTIVE tickets]}"""
+    rows = db.session.query(
+        Ticket.flight_number, Ticket.ticket_number, Ticket.seat_number, Ticket.seat_class
+    ).filter(
+        Ticket.status == 'ACTIVE',
+        Ticket.flight_number.in_(flight_numbers)
+    ).all()
+    seats = {}
+    for flight_number, ticket_number, seat_number, seat_class in rows:
+        seats.setdefault(flight_number, []).append((ticket_number, seat_number, seat_class))
+    return seats
+
+
+def move_tickets(moved):
+    """Give tickets the seats build_seat_maps() assigned them, in the caller's transaction"""
+    if moved:
+        db.session.execute(
+            db.update(Ticket).where(Ticket.ticket_number.in_(list(moved))).values(
+                seat_number=db.case(moved, value=Ticket.ticket_number)
+            ).execution_options(synchronize_session=False)
+        )
+
+
+def inventory_rows(flight_number, capacity, counts):
+    # Legacy flights can hold more tickets in a cabin than its share of the
+    # aircraft allows: such a cabin is full, not below zero
+    return [
+        SeatInventory(flight_number=flight_number, seat_class=cls, capacity=seats,
+                      remaining=max(0, seats - counts.get((flight_number, cls), 0)), version=0)
+        for cls, seats in cabin_capacities(capacity).items()
+    ]
+
+
+def ensure_inventory(flight):
+    """
+    Create the flight's inventory and seat map rows from TICKET if they do not
+    exist yet. Commits; call it before starting the booking transaction.
+    """
+    number = flight.flight_number
+    has_inventory = db.session.query(SeatInventory.flight_number).filter_by(flight_number=number).first()
+    has_seat_map = db.session.query(SeatMap.flight_number).filter_by(flight_number=number).first()
+    if has_inventory and has_seat_map:
+        return
+    capacity = flight.aircraft_rel.capacity
+    # Read everything before adding rows, so no autoflush happens outside the try below
+    rows = []
+    if not has_inventory:
+        rows += inventory_rows(number, capacity, active_counts([number]))
+    moved = {}
+    if not has_seat_map:
+        seat_maps, moved = build_seat_maps(number, capacity, active_seat_numbers([number]).get(number, []))
+        rows += seat_maps
+    db.session.add_all(rows)
+    try:
+        move_tickets(moved)
+        db.session.commit()
+    except IntegrityError:
+        # Another request created them first
+        db.session.rollback()
+
+
+def remaining_seats(flight_number):
+    """{seat_class: remaining} for a flight (empty if it has no inventory yet)"""
+    rows = db.session.query(SeatInventory.seat_class, SeatInventory.remaining).filter_by(
+        flight_number=flight_number
+    ).all()
+    return dict(rows)
+
+
+def take_seats(flight_number, seat_class, count):
+    """
+    Atomically take `count` seats; False (and nothing changed) if not enough remain.
+    Runs in the caller's transaction, which holds the row lock until it commits.
+    """
+    result = db.session.execute(
+        db.update(SeatInventory).where(
+            SeatInventory.flight_number == flight_number,
+            SeatInventory.seat_class == seat_class,
+            SeatInventory.remaining >= count,
+        ).values(
+            remaining=SeatInventory.remaining - count,
+            version=SeatInventory.version + 1,
+        )
+    )
+    return result.rowcount == 1
+
+
+def take_available_seats(flight_number, seat_class, wanted):
+    """
+    Take up to `wanted` seats (as many as remain) and return how many were taken.
+    Locks the inventory row for the rest of the caller's transaction.
+    """
+    remaining = db.session.query(SeatInventory.remaining).filter_by(
+        flight_number=flight_number, seat_class=seat_class
+    ).with_for_update().scalar() or 0
+    count = min(wanted, remaining)
+    if count <= 0 or not take_seats(flight_number, seat_class, count):
+        return 0
+    return count
+
+
+def release_seats(flight_number, seat_class, count=1):
+    """Give seats back (cancellation), in the caller's transaction"""
+    db.session.execute(
+        db.update(SeatInventory).where(
+            SeatInventory.flight_number == flight_number,
+            SeatInventory.seat_class == seat_class,
+        ).values(
+            remaining=SeatInventory.remaining + count,
+            version=SeatInventory.version + 1,
+        )
+    )
+
+
+def rebuild_inventory(flight_numbers=None, batch_size=1000):
+    """
+    Recompute inventory and seat map rows from TICKET and AIRCRAFT, in batches of flights.
+    Returns the number of flights rebuilt.
+    """
+    query = db.session.query(Flight.flight_number, Aircraft.capacity).join(
+        Aircraft, Flight.aircraft_id == Aircraft.aircraft_id
+    ).order_by(Flight.flight_number)
+    if flight_numbers:
+        query = query.filter(Flight.flight_number.in_(flight_numbers))
+    flights = query.all()
+
+    for start in range(0, len(flights), batch_size):
+        batch = flights[start:start + batch_size]
+        numbers = [number for number, _ in batch]
+        counts = active_counts(numbers)
+        taken = active_seat_numbers(numbers)
+        db.session.execute(db.delete(SeatInventory).where(SeatInventory.flight_number.in_(numbers)))
+        db.session.execute(db.delete(SeatMap).where(SeatMap.flight_number.in_(numbers)))
+        rows = []
+        moved = {}
+        for number, capacity in batch:
+            rows.extend(inventory_rows(number, capacity, counts))
+            seat_maps, flight_moved = build_seat_maps(number, capacity, taken.get(number, []))
+            rows.extend(seat_maps)
+            moved.update(flight_moved)
+        db.session.add_all(rows)
+        move_tickets(moved)
+        db.session.commit()
+    return len(flights)
+
+
+inventory_cli = AppGroup('inventory', help='Maintain the SEAT_INVENTORY and SEAT_MAP tables.')
+
+
+@inventory_cli.command('rebuild')
+@click.argument('flight_numbers', nargs=-1)
+@click.option('--batch-size', default=1000, show_default=True, help='Flights per transaction.')
+def rebuild_command(flight_numbers, batch_size):
+    """Recompute remaining seats and seat maps from TICKET (all flights, or the ones given)."""
+    count = rebuild_inventory(list(flight_numbers) or None, batch_size)
+    click.echo(f'Rebuilt seat inventory for {count} flight(s).')
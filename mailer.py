@@ -0,0 +1,78 @@
+"""
+Outgoing mail for booking notifications
+
+Sent from the background task workers (tasks.py), never from a request.
+
+Configuration (app.config, defaults read from the environment):
+    MAILER             outbox (default), smtp or none
+    MAIL_OUTBOX_DIR    where the outbox mailer writes .eml files (default tmp/flightapp-outbox)
+    MAIL_SENDER        From address (default bookings@flightapp.local)
+    MAIL_SMTP_HOST     SMTP server for the smtp mailer (default localhost)
+    MAIL_SMTP_PORT     SMTP port (default 25)
+
+The outbox mailer is a local fake: each message is written to its own file
+named after the task's idempotency key, so a retried task overwrites its
+message instead of sending a second one.
+"""
+import os
+import re
+import smtplib
+import tempfile
+from email.message import EmailMessage
+
+from db_config import env_int
+
+
+class Mailer:
+    """Sends EmailMessages through the configured transport; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.transport = 'none'
+        self.sender = 'bookings@flightapp.local'
+        self.outbox_dir = None
+        self.smtp_host = 'localhost'
+        self.smtp_port = 25
+        self.sent = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAILER', os.getenv('MAILER', 'outbox'))
+        app.config.setdefault('MAIL_OUTBOX_DIR', os.getenv(
+            'MAIL_OUTBOX_DIR', os.path.join(tempfile.gettempdir(), 'flightapp-outbox')
+        ))
+        app.config.setdefault('MAIL_SENDER', os.getenv('MAIL_SENDER', 'bookings@flightapp.local'))
+        app.config.setdefault('MAIL_SMTP_HOST', os.getenv('MAIL_SMTP_HOST', 'localhost'))
+        app.config.setdefault('MAIL_SMTP_PORT', env_int('MAIL_SMTP_PORT', 25))
+        self.transport = app.config['MAILER']
+        self.sender = app.config['MAIL_SENDER']
+        self.outbox_dir = app.config['MAIL_OUTBOX_DIR']
+        self.smtp_host = app.config['MAIL_SMTP_HOST']
+        self.smtp_port = app.config['MAIL_SMTP_PORT']
+        if self.transport not in ('outbox', 'smtp', 'none'):
+            raise ValueError(f'Unknown MAILER {self.transport}')
+
+    def send(self, to, subject, body, message_id):
+        """Send one plain-text message; message_id is stable across retries"""
+        if self.transport == 'none' or not to:
+            return
+        # Task keys look like mail:booking:123
+        message_id = re.sub(r'[^A-Za-z0-9_.-]', '.', message_id)
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = to
+        message['Subject'] = subject
+        message['Message-ID'] = f'<{message_id}@flightapp.local>'
+        message.set_content(body)
+
+        if self.transport == 'outbox':
+            os.makedirs(self.outbox_dir, exist_ok=True)
+            with open(os.path.join(self.outbox_dir, message_id + '.eml'), 'wb') as f:
+                f.write(message.as_bytes())
+        else:
+            with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30) as smtp:
+                smtp.send_message(message)
+        self.sent += 1
+
+
+mailer = Mailer()
@@ -1,9 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import contains_eager
 from datetime import datetime
+from replicas import RoutingSession
+from passwords import passwords
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})  # Reads may go to replicas (replicas.py)
+
+# How dates and times are shown on flight and reservation cards
+DISPLAY_DATETIME_FORMAT = '%B %d, %Y at %I:%M %p'
+
+
+def format_datetime(value):
+    return value.strftime(DISPLAY_DATETIME_FORMAT) if value is not None else ''
 
-db = SQLAlchemy()
 
 class Airport(db.Model):
     """Maps to Airport table in Oracle"""
@@ -71,17 +81,82 @@ class Flight(db.Model):
     @property
     def available_seats(self):
         """Calculate available seats based on aircraft capacity and booked tickets"""
-        if self.aircraft_rel:
-            booked = len([t for t in self.tickets if t.status == 'ACTIVE'])
-            return self.aircraft_rel.capacity - booked
-        return 0
+        # Set by with_available_seats() when the flight came from a listing query
+        if '_available_seats' in self.__dict__:
+            return self._available_seats
+        if not self.aircraft_rel:
+            return 0
+        # Count in the database instead of loading every ticket of the flight
+        booked = db.session.query(db.func.count(Ticket.ticket_number)).filter(
+            Ticket.flight_number == self.flight_number,
+            Ticket.status == 'ACTIVE'
+        ).scalar()
+        self._available_seats = self.aircraft_rel.capacity - booked
+        return self._available_seats
+    
+    @staticmethod
+    def booked_seats_subquery():
+        """(flight_number, booked) for every flight with ACTIVE tickets, as a subquery"""
+        return db.session.query(
+            Ticket.flight_number.label('flight_number'),
+            db.func.count(Ticket.ticket_number).label('booked')
+        ).filter(
+            Ticket.status == 'ACTIVE'
+        ).group_by(Ticket.flight_number).subquery()
+    
+    @classmethod
+    def available_seats_query(cls, query=None, only_available=True):
+        """
+        Extend a Flight query so each row is (flight, available_seats), computed in
+        one grouped SQL query: capacity minus the number of ACTIVE tickets. With
+        only_available the "has seats" filter is applied by the database.
+        """
+        if query is None:
+            query = cls.query
+        
+        booked = cls.booked_seats_subquery()
+        seats = Aircraft.capacity - db.func.coalesce(booked.c.booked, 0)
+        # The AIRCRAFT join also populates aircraft_rel, so no lazy load follows
+        query = query.join(
+            cls.aircraft_rel
+        ).options(
+            contains_eager(cls.aircraft_rel)
+        ).outerjoin(
+            booked, booked.c.flight_number == cls.flight_number
+        ).add_columns(seats.label('available_seats'))
+        
+        if only_available:
+            query = query.filter(seats > 0)
+        return query
+    
+    @staticmethod
+    def attach_available_seats(rows):
+        """Turn (flight, available_seats) rows into flights with available_seats set"""
+        flights = []
+        for flight, available in rows:
+            flight._available_seats = available
+            flights.append(flight)
+        return flights
+    
+    @classmethod
+    def with_available_seats(cls, query=None, only_available=True):
+        """Run a Flight query and return its flights with available_seats attached"""
+        return cls.attach_available_seats(cls.available_seats_query(query, only_available).all())
     
     @property
     def price(self):
-        """Base price for the flight (you can customize this logic)"""
-        # Simple pricing: base price of $200
-        # You could make this more sophisticated based on distance, demand, etc.
-        return 200.00
+        """Economy fare from the pricing engine (pricing.py)"""
+        # Set by pricing.price_flights() when the flight came from a listing
+        if '_price' in self.__dict__:
+            return self._price
+        from pricing import pricing
+        self._price = pricing.quote(self)['ECONOMY']
+        return self._price
+    
+    @property
+    def airline_name(self):
+        """Name of the operating airline (None if unknown)"""
+        return self.airline.name if self.airline else None
     
     @property
     def origin(self):
@@ -99,6 +174,44 @@ class Flight(db.Model):
         return self.flight_number
 
 
+class FlightSummary:
+    """
+    Detached, plain-data snapshot of a Flight as shown in listings.
+    Safe to cache and share between requests (no session, no lazy loads).
+    """
+    
+    FIELDS = ('flight_number', 'airline_name', 'departure_airport', 'arrival_airport',
+              'departure_time', 'arrival_time', 'duration_minutes', 'available_seats', 'price')
+    
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+        # Display strings computed once here (and cached with the snapshot), not per render
+        self.airline_display = self.airline_name or 'N/A'
+        self.departure_display = format_datetime(self.departure_time)
+        self.arrival_display = format_datetime(self.arrival_time)
+        self.price_display = f'{self.price:.2f}' if self.price is not None else ''
+    
+    @classmethod
+    def from_flight(cls, flight):
+        return cls(**{name: getattr(flight, name) for name in cls.FIELDS})
+    
+    @property
+    def origin(self):
+        return self.departure_airport
+    
+    @property
+    def destination(self):
+        return self.arrival_airport
+    
+    @property
+    def id(self):
+        return self.flight_number
+    
+    def __repr__(self):
+        return f'<FlightSummary {self.flight_number}>'
+
+
 class Passenger(UserMixin, db.Model):
     """
     Maps to Passenger table in Oracle
@@ -111,11 +224,11 @@ class Passenger(UserMixin, db.Model):
     date_of_birth = db.Column('DATE_OF_BIRTH', db.Date, nullable=False)
     nationality = db.Column('NATIONALITY', db.String(80), nullable=False)
     phone = db.Column('PHONE', db.String(32))
-    email = db.Column('EMAIL', db.String(120), unique=True)
+    email = db.Column('EMAIL', db.String(120))  # Unique through IX_PASSENGER_EMAIL (schema.py)
     
-    # Additional fields for authentication (you'll need to add this to Oracle)
-    # Commented out until you add the column: ALTER TABLE PASSENGER ADD PASSWORD_HASH VARCHAR2(255);
-    # password_hash = db.Column('PASSWORD_HASH', db.String(255), nullable=True, server_default=None)
+    # Added to the Oracle table by `flask --app app schema create-tables`; NULL until
+    # the passenger sets a password (see passwords.py)
+    password_hash = db.Column('PASSWORD_HASH', db.String(255), nullable=True)
     
     # Relationships
     tickets = db.relationship('Ticket', backref='passenger', lazy=True)
@@ -125,20 +238,19 @@ class Passenger(UserMixin, db.Model):
         return str(self.passenger_id)
     
     def set_password(self, password):
-        """Hash and store the password securely"""
-        # TODO: Uncomment when PASSWORD_HASH column is added to database
-        # self.password_hash = generate_password_hash(password)
-        pass
+        """Hash and store the password securely (on the hashing pool, may raise PasswordsBusy)"""
+        self.password_hash = passwords.hash(password)
     
     def check_password(self, password):
-        """Verify password against stored hash"""
-        # TODO: Uncomment when PASSWORD_HASH column is added to database
-        # if not self.password_hash:
-        #     return False
-        # return check_password_hash(self.password_hash, password)
-        
-        # Temporary: Allow any password for testing
-        return True
+        """
+        Verify password against stored hash. An account without one is refused
+        (unless PASSWORD_CLAIM_UNSET is on; login then stores the password),
+        after the same hashing work as any other check.
+        """
+        if self.password_hash is None:
+            passwords.check(None, password)
+            return passwords.claim_unset
+        return passwords.check(self.password_hash, password)
     
     @property
     def first_name(self):
@@ -160,6 +272,35 @@ class Passenger(UserMixin, db.Model):
         return f'<Passenger {self.full_name}>'
 
 
+class PassengerSnapshot(UserMixin):
+    """
+    Detached, plain-data copy of a Passenger for Flask-Login's current_user.
+    Cached between requests by user_cache.py, so it holds no session or relationships.
+    """
+    
+    FIELDS = ('passenger_id', 'full_name', 'date_of_birth', 'nationality', 'phone', 'email')
+    
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+    
+    @classmethod
+    def from_passenger(cls, passenger):
+        return cls(**{name: getattr(passenger, name) for name in cls.FIELDS})
+    
+    def get_id(self):
+        """Required by Flask-Login"""
+        return str(self.passenger_id)
+    
+    # Same display helpers as the model
+    first_name = Passenger.first_name
+    last_name = Passenger.last_name
+    username = Passenger.username
+    
+    def __repr__(self):
+        return f'<PassengerSnapshot {self.full_name}>'
+
+
 class Ticket(db.Model):
     """Maps to Ticket table in Oracle"""
     __tablename__ = 'TICKET'
@@ -235,5 +376,67 @@ class TicketChange(db.Model):
         return f'<TicketChange {self.change_id}>'
 
 
+class SeatInventory(db.Model):
+    """
+    Remaining seats per flight and cabin class, kept in step with TICKET by
+    reserve()/cancel_ticket() (see inventory.py). Not part of the original
+    schema: create it with `flask schema create-tables`.
+    """
+    __tablename__ = 'SEAT_INVENTORY'
+    
+    flight_number = db.Column('FLIGHT_NUMBER', db.String(10), db.ForeignKey('FLIGHT.FLIGHT_NUMBER'), primary_key=True)
+    seat_class = db.Column('SEAT_CLASS', db.String(10), primary_key=True)  # ECONOMY, BUSINESS, FIRST
+    capacity = db.Column('CAPACITY', db.Integer, nullable=False)
+    remaining = db.Column('REMAINING', db.Integer, nullable=False)
+    version = db.Column('VERSION', db.Integer, nullable=False, default=0)  # Bumped on every change
+    
+    def __repr__(self):
+        return f'<SeatInventory {self.flight_number} {self.seat_class} {self.remaining}/{self.capacity}>'
+
+
+class SeatMap(db.Model):
+    """
+    Occupied seats of one cabin of a flight as a bitmap (bit i = i-th seat of
+    the cabin, stored as hex), so seats can be assigned without reading TICKET
+    (see seatmap.py). Not part of the original schema: create it with
+    `flask schema create-tables`.
+    """
+    __tablename__ = 'SEAT_MAP'
+    
+    flight_number = db.Column('FLIGHT_NUMBER', db.String(10), db.ForeignKey('FLIGHT.FLIGHT_NUMBER'), primary_key=True)
+    seat_class = db.Column('SEAT_CLASS', db.String(10), primary_key=True)
+    first_row = db.Column('FIRST_ROW', db.Integer, nullable=False)
+    seats = db.Column('SEATS', db.Integer, nullable=False)
+    occupied = db.Column('OCCUPIED', db.String(1024), nullable=False, default='0')
+    
+    def __repr__(self):
+        return f'<SeatMap {self.flight_number} {self.seat_class}>'
+
+
+class FlightStats(db.Model):
+    """
+    Sales summary of one flight (seats sold/cancelled, revenue), kept in step
+    with TICKET by reserve()/cancel_ticket() so reports never aggregate TICKET
+    (see analytics.py). Not part of the original schema: create it with
+    `flask schema create-tables`.
+    """
+    __tablename__ = 'FLIGHT_STATS'
+    
+    flight_number = db.Column('FLIGHT_NUMBER', db.String(10), db.ForeignKey('FLIGHT.FLIGHT_NUMBER'), primary_key=True)
+    airline_id = db.Column('AIRLINE_ID', db.Integer, nullable=False)
+    departure_airport = db.Column('DEPARTURE_AIRPORT', db.String(8), nullable=False)
+    arrival_airport = db.Column('ARRIVAL_AIRPORT', db.String(8), nullable=False)
+    departure_time = db.Column('DEPARTURE_TIME', db.DateTime, nullable=False)
+    capacity = db.Column('CAPACITY', db.Integer, nullable=False)
+    seats_sold = db.Column('SEATS_SOLD', db.Integer, nullable=False, default=0)  # ACTIVE tickets
+    seats_canceled = db.Column('SEATS_CANCELED', db.Integer, nullable=False, default=0)
+    revenue = db.Column('REVENUE', db.Numeric(12, 2), nullable=False, default=0)  # Price of ACTIVE tickets
+    paid_revenue = db.Column('PAID_REVENUE', db.Numeric(12, 2), nullable=False, default=0)  # PAYMENT amounts
+    updated_at = db.Column('UPDATED_AT', db.DateTime, nullable=False)
+    
+    def __repr__(self):
+        return f'<FlightStats {self.flight_number} {self.seats_sold}/{self.capacity}>'
+
+
 # For backward compatibility with existing Flask-Login code
 User = Passenger
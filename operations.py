@@ -0,0 +1,377 @@
+"""
+Airline operations: bulk flight cancellation, rebooking and rescheduling
+
+A disrupted flight can have hundreds of tickets. Instead of one load, update
+and commit per ticket (cancel_ticket()), the flight's ACTIVE tickets are
+walked in batches of `batch_size`, in ticket order, and every batch is one
+short transaction:
+
+    UPDATE TICKET SET STATUS = 'CANCELED'
+     WHERE TICKET_NUMBER IN (:batch) AND STATUS = 'ACTIVE'
+    INSERT INTO TICKETCHANGE (TICKET_NUMBER, CHANGE_DATE, NEW_STATUS)
+    SELECT TICKET_NUMBER, :now, 'CANCELED' FROM TICKET WHERE TICKET_NUMBER IN (:batch)
+
+plus one relative UPDATE of SEAT_INVENTORY, SEAT_MAP and FLIGHT_STATS per
+flight and cabin of the batch. A ticket changed by a passenger meanwhile makes
+the guarded UPDATE miss a row; the batch is then rolled back and read again.
+
+Rebooking moves tickets to a replacement flight on the same route that has
+not departed yet, keeping their number and price, with seats from its seat map: earliest tickets first, as many as its
+cabins have room for; the others are cancelled. Rescheduling shifts the
+flights' times and records a RESCHEDULED change per ticket (tickets stay
+ACTIVE). Passengers are notified through the task queue (tasks.py).
+
+FLIGHT has no status column, so a cancelled flight itself stays in the
+schedule, with all its seats free again.
+
+    flask --app app ops cancel AA100 AA102 --rebook-to AA104
+    flask --app app ops reschedule AA100 --shift-minutes 90
+"""
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from models import db, Flight, FlightStats, Passenger, Payment, Ticket, TicketChange
+from analytics import ensure_flight_stats, record_booking, record_cancellation, record_payment
+from inventory import ensure_inventory, release_seats, take_available_seats
+from route_graph import route_graph
+from search_cache import search_cache
+from pricing import pricing
+from seatmap import SeatMapFull, allocate_seats, free_seats
+from tasks import queue_safely
+
+BATCH_SIZE = 500
+
+# A batch whose tickets keep changing under it is given up after this many tries
+MAX_BATCH_RETRIES = 5
+
+
+class OperationError(Exception):
+    """An operation that cannot run as asked (unknown flight, bad replacement)"""
+
+
+class ConcurrentChange(Exception):
+    """Tickets of the batch changed between reading and updating it"""
+
+
+def load_flights(flight_numbers):
+    numbers = sorted(set(flight_numbers))
+    if not numbers:
+        raise OperationError('No flights given.')
+    flights = Flight.query.filter(Flight.flight_number.in_(numbers)).all()
+    missing = set(numbers) - {flight.flight_number for flight in flights}
+    if missing:
+        raise OperationError(f"Unknown flight(s): {', '.join(sorted(missing))}")
+    return flights
+
+
+def check_replacement(target, flights, now=None):
+    """Raise OperationError unless target flies every flight's route and has not departed yet"""
+    routes = sorted({f'{flight.departure_airport}-{flight.arrival_airport}' for flight in flights
+                     if (flight.departure_airport, flight.arrival_airport)
+                     != (target.departure_airport, target.arrival_airport)})
+    if routes:
+        raise OperationError(f'The replacement flight {target.flight_number} flies '
+                             f'{target.departure_airport}-{target.arrival_airport}, not {", ".join(routes)}.')
+    if target.departure_time <= (now or datetime.now()):
+        raise OperationError(f'The replacement flight {target.flight_number} departed at {target.departure_time}.')
+
+
+def ticket_batches(flight_numbers, batch_size):
+    """
+    The flights' ACTIVE tickets, batch_size at a time in ticket order, as
+    rows of (ticket_number, flight_number, seat_class, seat_number, price, email).
+    Each batch is read after the previous one was committed.
+    """
+    last = None
+    while True:
+        query = db.session.query(
+            Ticket.ticket_number, Ticket.flight_number, Ticket.seat_class, Ticket.seat_number,
+            Ticket.price, Passenger.email
+        ).join(
+            Passenger, Passenger.passenger_id == Ticket.passenger_id
+        ).filter(
+            Ticket.flight_number.in_(flight_numbers), Ticket.status == 'ACTIVE'
+        )
+        if last is not None:
+            query = query.filter(Ticket.ticket_number > last)
+        rows = query.order_by(Ticket.ticket_number).limit(batch_size).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].ticket_number
+
+
+def run_batch(apply, rows, result):
+    """Run apply(rows) and commit; retry with fresh rows when tickets changed meanwhile"""
+    numbers = [row.ticket_number for row in rows]
+    for attempt in range(MAX_BATCH_RETRIES):
+        try:
+            outcome = apply(rows)
+            db.session.commit()
+            result['batches'] += 1
+            return outcome
+        except ConcurrentChange:
+            db.session.rollback()
+            result['retries'] += 1
+            # Re-read the batch: tickets cancelled meanwhile drop out
+            rows = db.session.query(
+                Ticket.ticket_number, Ticket.flight_number, Ticket.seat_class, Ticket.seat_number,
+                Ticket.price, Passenger.email
+            ).join(
+                Passenger, Passenger.passenger_id == Ticket.passenger_id
+            ).filter(
+                Ticket.ticket_number.in_(numbers), Ticket.status == 'ACTIVE'
+            ).order_by(Ticket.ticket_number).all()
+        except Exception:
+            db.session.rollback()
+            raise
+    raise OperationError(f'Tickets {numbers[0]}-{numbers[-1]} kept changing; run the operation again.')
+
+
+def insert_changes(ticket_numbers, new_status, changed_at):
+    """TICKETCHANGE row per ticket with one INSERT ... SELECT"""
+    db.session.execute(db.insert(TicketChange).from_select(
+        [TicketChange.ticket_number, TicketChange.change_date, TicketChange.new_status],
+        db.select(Ticket.ticket_number, db.literal(changed_at, db.DateTime), db.literal(new_status))
+        .where(Ticket.ticket_number.in_(ticket_numbers))
+    ))
+
+
+def by_cabin(rows):
+    """{(flight_number, seat_class): [rows]}"""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row.flight_number, row.seat_class), []).append(row)
+    return groups
+
+
+def release(rows, canceled):
+    """Give the rows' seats back on their flights and take them off the flights' sales"""
+    for (flight_number, seat_class), group in by_cabin(rows).items():
+        release_seats(flight_number, seat_class, len(group))
+        free_seats(flight_number, seat_class, [row.seat_number for row in group])
+        price = sum(row.price for row in group)
+        if canceled:
+            record_cancellation(flight_number, price, count=len(group))
+        else:
+            # Moved to another flight: no longer sold on this one
+            record_booking(flight_number, -len(group), -price)
+
+
+def cancel_rows(rows, changed_at):
+    if not rows:
+        return
+    numbers = [row.ticket_number for row in rows]
+    updated = db.session.execute(
+        db.update(Ticket).where(Ticket.ticket_number.in_(numbers), Ticket.status == 'ACTIVE')
+        .values(status='CANCELED').execution_options(synchronize_session=False)
+    ).rowcount
+    if updated != len(numbers):
+        raise ConcurrentChange()
+    insert_changes(numbers, 'CANCELED', changed_at)
+    release(rows, canceled=True)
+
+
+def rebook_rows(rows, target, changed_at):
+    """Move as many rows as fit onto target; returns ({ticket_number: new seat}, rows left over)"""
+    seats = {}
+    left = []
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.seat_class, []).append(row)
+    for seat_class, group in groups.items():
+        # Same cabin on the replacement; a cabin it lacks (no inventory row) takes nobody
+        count = take_available_seats(target.flight_number, seat_class, len(group))
+        try:
+            labels = allocate_seats(target.flight_number, seat_class, count, adjacent=False) if count else []
+        except SeatMapFull:
+            # Seat map fuller than the inventory says: stop rather than double-assign seats
+            raise OperationError(f'Seat map of {target.flight_number} {seat_class} is out of step; '
+                                 f'run `flask inventory rebuild {target.flight_number}`.')
+        seats.update(zip((row.ticket_number for row in group), labels))
+        left += group[count:]
+    if not seats:
+        return seats, left
+
+    moved = [row for row in rows if row.ticket_number in seats]
+    numbers = list(seats)
+    # Paid amounts per flight the tickets leave, read before they move
+    paid = db.session.query(Ticket.flight_number, db.func.sum(Payment.amount)).join(
+        Payment, Payment.ticket_number == Ticket.ticket_number
+    ).filter(Ticket.ticket_number.in_(numbers)).group_by(Ticket.flight_number).all()
+
+    updated = db.session.execute(
+        db.update(Ticket).where(
+            Ticket.ticket_number.in_(numbers), Ticket.status == 'ACTIVE'
+        ).values(
+            flight_number=target.flight_number,
+            seat_number=db.case(seats, value=Ticket.ticket_number),
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    if updated != len(numbers):
+        raise ConcurrentChange()
+    insert_changes(numbers, 'REBOOKED', changed_at)
+
+    release(moved, canceled=False)
+    record_booking(target.flight_number, len(moved), sum(row.price for row in moved))
+    # Payments follow their tickets to the new flight
+    for flight_number, amount in paid:
+        record_payment(flight_number, -amount)
+        record_payment(target.flight_number, amount)
+    return seats, left
+
+
+def new_result(operation, flights):
+    return {'operation': operation, 'flights': [flight.flight_number for flight in flights],
+            'tickets_canceled': 0, 'tickets_rebooked': 0, 'tickets_rescheduled': 0,
+            'batches': 0, 'retries': 0, 'notifications': 0, 'seconds': 0.0}
+
+
+def cancel_flights(flight_numbers, rebook_to=None, batch_size=BATCH_SIZE, notify=True):
+    """
+    Cancel every ACTIVE ticket of the flights, or move them to the flight
+    rebook_to as far as its seats allow. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    flights = load_flights(flight_numbers)
+    numbers = [flight.flight_number for flight in flights]
+    departures = {flight.flight_number: flight.departure_airport for flight in flights}
+    target = None
+    if rebook_to is not None:
+        if rebook_to in numbers:
+            raise OperationError('The replacement flight is one of the cancelled flights.')
+        target = db.session.get(Flight, rebook_to)
+        if target is None:
+            raise OperationError(f'Unknown replacement flight: {rebook_to}')
+        check_replacement(target, flights)
+        # Inventory and sales rows of the replacement, created from TICKET if missing (commits)
+        ensure_inventory(target)
+        ensure_flight_stats(target)
+    result = new_result('cancel', flights)
+
+    for rows in ticket_batches(numbers, batch_size):
+        changed_at = datetime.now()
+
+        def apply(rows):
+            seats, left = rebook_rows(rows, target, changed_at) if target is not None else ({}, rows)
+            cancel_rows(left, changed_at)
+            return rows, seats, left
+
+        rows, seats, left = run_batch(apply, rows, result)
+        result['tickets_rebooked'] += len(seats)
+        result['tickets_canceled'] += len(left)
+        if notify:
+            result['notifications'] += notify_disruption(rows, seats, target, changed_at)
+
+    for number in numbers:
+        search_cache.flight_changed(number, departures[number], seats_freed=True)
+    if target is not None:
+        search_cache.flight_changed(target.flight_number)
+    pricing.flight_changed(*numbers, *([target.flight_number] if target is not None else []))
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def reschedule_flights(flight_numbers, shift, batch_size=BATCH_SIZE, notify=True):
+    """
+    Move the flights' departure and arrival by `shift` (a timedelta) and record
+    a RESCHEDULED change for each of their ACTIVE tickets. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    flights = load_flights(flight_numbers)
+    numbers = [flight.flight_number for flight in flights]
+    result = new_result('reschedule', flights)
+    times = {}
+    for flight in flights:
+        times[flight.flight_number] = (flight.departure_time + shift, flight.arrival_time + shift)
+        db.session.execute(db.update(Flight).where(Flight.flight_number == flight.flight_number).values(
+            departure_time=flight.departure_time + shift, arrival_time=flight.arrival_time + shift
+        ).execution_options(synchronize_session=False))
+        db.session.execute(db.update(FlightStats).where(
+            FlightStats.flight_number == flight.flight_number
+        ).values(departure_time=flight.departure_time + shift, updated_at=datetime.now()))
+    db.session.commit()
+    # Bulk statements bypass the ORM events the route graph listens to
+    route_graph.flights_changed(numbers)
+    # Retimed flights move between date and listing pages, so no cached page can be trusted
+    search_cache.clear()
+    pricing.flight_changed(*numbers)  # Days to departure moved
+
+    for rows in ticket_batches(numbers, batch_size):
+        changed_at = datetime.now()
+
+        def apply(rows):
+            insert_changes([row.ticket_number for row in rows], 'RESCHEDULED', changed_at)
+            return rows
+
+        rows = run_batch(apply, rows, result)
+        result['tickets_rescheduled'] += len(rows)
+        if notify:
+            result['notifications'] += queue_safely([
+                ('notify', {
+                    'to': row.email,
+                    'subject': f'Flight {row.flight_number} has a new schedule',
+                    'body': (f'Flight {row.flight_number} (ticket {row.ticket_number}, seat {row.seat_number}) '
+                             f'now departs {times[row.flight_number][0]:%B %d, %Y at %I:%M %p} and arrives '
+                             f'{times[row.flight_number][1]:%B %d, %Y at %I:%M %p}.\n'),
+                }, f'mail:reschedule:{row.ticket_number}:{times[row.flight_number][0]:%Y%m%d%H%M}')
+                for row in rows
+            ])
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def notify_disruption(rows, seats, target, changed_at):
+    """Queue one email per ticket of a committed cancel/rebook batch"""
+    tasks = []
+    for row in rows:
+        if row.ticket_number in seats:
+            subject = f'Flight {row.flight_number} cancelled - rebooked on {target.flight_number}'
+            body = (f'Flight {row.flight_number} has been cancelled. Ticket {row.ticket_number} is now on '
+                    f'flight {target.flight_number}, departing '
+                    f'{target.departure_time:%B %d, %Y at %I:%M %p}, seat {seats[row.ticket_number]}.\n')
+            key = f'mail:rebook:{row.ticket_number}:{target.flight_number}'
+        else:
+            subject = f'Flight {row.flight_number} cancelled'
+            body = (f'Flight {row.flight_number} has been cancelled and ticket {row.ticket_number} '
+                    f'(seat {row.seat_number}) with it.\n')
+            key = f'mail:cancel:{row.ticket_number}'
+        tasks.append(('notify', {'to': row.email, 'subject': subject, 'body': body}, key))
+    return queue_safely(tasks)
+
+
+ops_cli = AppGroup('ops', help='Bulk flight cancellation and rescheduling.')
+
+
+def echo_result(result):
+    click.echo(', '.join(f'{name}={value}' for name, value in result.items() if name != 'operation'))
+
+
+@ops_cli.command('cancel')
+@click.argument('flight_numbers', nargs=-1, required=True)
+@click.option('--rebook-to', help='Move passengers to this flight while it has seats.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Tickets per transaction.')
+@click.option('--no-notify', is_flag=True, help='Do not email the passengers.')
+def cancel_command(flight_numbers, rebook_to, batch_size, no_notify):
+    """Cancel (or rebook) every ACTIVE ticket of the flights."""
+    try:
+        echo_result(cancel_flights(flight_numbers, rebook_to, batch_size, notify=not no_notify))
+    except OperationError as e:
+        raise click.ClickException(str(e))
+
+
+@ops_cli.command('reschedule')
+@click.argument('flight_numbers', nargs=-1, required=True)
+@click.option('--shift-minutes', type=int, required=True, help='Minutes to move the flights by (negative = earlier).')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Tickets per transaction.')
+@click.option('--no-notify', is_flag=True, help='Do not email the passengers.')
+def reschedule_command(flight_numbers, shift_minutes, batch_size, no_notify):
+    """Move the flights' times and record the change on their tickets."""
+    try:
+        echo_result(reschedule_flights(flight_numbers, timedelta(minutes=shift_minutes), batch_size,
+                                       notify=not no_notify))
+    except OperationError as e:
+        raise click.ClickException(str(e))
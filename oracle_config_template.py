@@ -1,5 +1,4 @@
 import cx_Oracle
-from sqlalchemy.pool import NullPool
 
 
 ORACLE_HOST = "prophet.njit.edu"  # NJIT Oracle server
@@ -11,7 +10,7 @@ ORACLE_PASSWORD = "YOUR_PASSWORD_HERE"   # Replace with your password
 # Build DSN using cx_Oracle.makedsn with SID (tested and working!)
 ORACLE_DSN = cx_Oracle.makedsn(ORACLE_HOST, ORACLE_PORT, sid=ORACLE_SID)
 
-# Create a connection factory function
+# Create a connection factory function (handy for scripts; the app uses the pool in db_config.py)
 def get_oracle_connection():
     """Create and return a new Oracle database connection"""
     return cx_Oracle.connect(
@@ -21,10 +20,6 @@ def get_oracle_connection():
         encoding="UTF-8"
     )
 
-# For SQLAlchemy, we'll use the creator parameter instead of connection string
-# This bypasses URL parsing issues with special characters in password
-ORACLE_CONNECTION_STRING = "oracle+cx_oracle://"  # Placeholder
-ORACLE_ENGINE_OPTIONS = {
-    "creator": get_oracle_connection,
-    "poolclass": NullPool  # Disable pooling for simplicity
-}
+# Engine and pool settings (pool size, recycle, SessionPool/DRCP, SQLite stand-in)
+# are read from environment variables in db_config.py; this file only holds
+# the connection details.
@@ -0,0 +1,114 @@
+"""
+Keyset (cursor) pagination
+
+Pages are fetched with a WHERE clause that starts right after the last row of
+the previous page instead of OFFSET, so every page costs the same no matter
+how deep the user has paged or how large the table is. The position is passed
+between requests as an opaque, URL-safe cursor string.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import and_, or_
+
+from db_config import env_int
+
+DEFAULT_PAGE_SIZE = env_int('PAGE_SIZE', 25)
+DEFAULT_MAX_PAGE_SIZE = env_int('MAX_PAGE_SIZE', 100)
+
+
+class Page:
+    """One page of results plus the cursor of the next page (None on the last page)"""
+
+    def __init__(self, items, next_cursor, page_size, cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.page_size = page_size
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return self.cursor is None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    """Serialize the sort key of a row into a cursor string"""
+    tagged = []
+    for value in values:
+        if isinstance(value, datetime):
+            tagged.append(['dt', value.isoformat()])
+        else:
+            tagged.append(['v', value])
+    raw = json.dumps(tagged, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; aborts with 400 on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return tuple(
+            datetime.fromisoformat(value) if tag == 'dt' else value
+            for tag, value in json.loads(raw)
+        )
+    except (ValueError, TypeError):
+        abort(400, description='Invalid page cursor.')
+
+
+def page_size_from_request():
+    """Page size from ?per_page=, bounded by PAGE_SIZE / MAX_PAGE_SIZE config"""
+    default = current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    maximum = current_app.config.get('MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+    size = request.args.get('per_page', default, type=int)
+    return max(1, min(size, maximum))
+
+
+def after_key(columns, values, descending=False):
+    """
+    WHERE clause selecting rows strictly after `values` in the ordering given by
+    `columns`, written as (a > x) OR (a = x AND b > y) because Oracle has no
+    row-value comparison. The leading a >= x lets the optimizer use an index range.
+    """
+    def beyond(column, value):
+        return column < value if descending else column > value
+
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal_prefix = [c == v for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*equal_prefix, beyond(column, value)))
+
+    leading = columns[0] <= values[0] if descending else columns[0] >= values[0]
+    return and_(leading, or_(*clauses))
+
+
+def keyset_page(query, columns, key, cursor=None, page_size=DEFAULT_PAGE_SIZE, descending=False):
+    """
+    Fetch one page of `query` ordered by `columns`.
+
+    key(row) must return the values of `columns` for a result row; the last
+    row's key becomes the next cursor. One extra row is fetched to find out
+    whether another page exists.
+    """
+    if cursor:
+        query = query.filter(after_key(columns, decode_cursor(cursor), descending))
+
+    order = [c.desc() for c in columns] if descending else list(columns)
+    rows = query.order_by(*order).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return Page(rows, next_cursor, page_size, cursor)
@@ -0,0 +1,166 @@
+"""
+Password hashing
+
+Passwords are hashed with werkzeug.security (hashlib underneath) using the
+configured algorithm and cost. The stored hash names the method it was made
+with ('pbkdf2:sha256:600000$salt$hash'), so changing the cost locks nobody out:
+check() verifies with the stored method, and login re-hashes the password at
+the current one when needs_rehash() says so.
+
+A hash costs hundreds of milliseconds of CPU, and hashlib releases the GIL
+while it runs, so with every request thread hashing at once logins would take
+all the cores and starve the page requests. Hashes therefore run on a small
+pool of PASSWORD_HASH_THREADS threads per process (created after the fork);
+up to PASSWORD_HASH_QUEUE more logins wait for it, and beyond that they are
+turned away (PasswordsBusy, shown as "try again") instead of piling up.
+
+Accounts without a hash (created before hashing) cannot log in until a
+password is set for them:
+
+    flask --app app passwords set passenger@example.com
+
+They are checked against a dummy hash anyway, so a login attempt takes as long
+as for any other account. PASSWORD_CLAIM_UNSET lets them take the first
+password they log in with instead: anyone who knows the email can then take
+the account over, so it is only for local databases of demo accounts.
+
+Configuration (app.config, defaults read from the environment):
+    PASSWORD_HASH_ALGORITHM  pbkdf2 (PBKDF2-HMAC-SHA256) or scrypt (default pbkdf2)
+    PASSWORD_HASH_COST       pbkdf2 iterations (default 600000) or scrypt N, a power
+                             of two (default 32768)
+    PASSWORD_HASH_THREADS    hashes computed at once per process (default: CPU count)
+    PASSWORD_HASH_QUEUE      logins allowed to wait for a hashing thread (default 32)
+    PASSWORD_CLAIM_UNSET     accounts without a hash take the first password (default off;
+                             local demo data only)
+
+    python -m bench.logins --costs pbkdf2:100000,pbkdf2:600000,scrypt:32768
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from flask.cli import AppGroup
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_COSTS = {'pbkdf2': 600000, 'scrypt': 32768}
+
+
+class PasswordsBusy(Exception):
+    """More logins are waiting for a hash than PASSWORD_HASH_QUEUE allows"""
+
+
+def hash_method(algorithm, cost):
+    """werkzeug method string for an algorithm and cost, as stored in front of the hash"""
+    if algorithm == 'pbkdf2':
+        return f'pbkdf2:sha256:{cost}'
+    if algorithm == 'scrypt':
+        return f'scrypt:{cost}:8:1'
+    raise ValueError(f'Unknown password hash algorithm: {algorithm}')
+
+
+class Passwords:
+    """Hashes and verifies passwords on a bounded thread pool; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.method = hash_method('pbkdf2', DEFAULT_COSTS['pbkdf2'])
+        self.threads = os.cpu_count() or 1
+        self.claim_unset = False
+        self._slots = threading.BoundedSemaphore(self.threads + 32)
+        self._dummy = None
+        self._pid = None          # process whose pool is running
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Not at the top: models imports this module, and db_config reads the environment on import
+        from db_config import env_bool, env_int
+
+        app.config.setdefault('PASSWORD_HASH_ALGORITHM', os.getenv('PASSWORD_HASH_ALGORITHM', 'pbkdf2'))
+        algorithm = app.config['PASSWORD_HASH_ALGORITHM']
+        if algorithm not in DEFAULT_COSTS:
+            raise ValueError(f"PASSWORD_HASH_ALGORITHM must be one of {', '.join(DEFAULT_COSTS)}")
+        app.config.setdefault('PASSWORD_HASH_COST', env_int('PASSWORD_HASH_COST', DEFAULT_COSTS[algorithm]))
+        app.config.setdefault('PASSWORD_HASH_THREADS', env_int('PASSWORD_HASH_THREADS', os.cpu_count() or 1))
+        app.config.setdefault('PASSWORD_HASH_QUEUE', env_int('PASSWORD_HASH_QUEUE', 32))
+        app.config.setdefault('PASSWORD_CLAIM_UNSET', env_bool('PASSWORD_CLAIM_UNSET'))
+
+        self.method = hash_method(algorithm, app.config['PASSWORD_HASH_COST'])
+        self.threads = max(1, app.config['PASSWORD_HASH_THREADS'])
+        self.claim_unset = app.config['PASSWORD_CLAIM_UNSET']
+        self._slots = threading.BoundedSemaphore(self.threads + max(0, app.config['PASSWORD_HASH_QUEUE']))
+        self._dummy = None
+        self.shutdown()
+
+    # -- Hashing pool --------------------------------------------------------
+
+    def _run(self, fn, *args):
+        """Run fn on the hashing pool and wait for it; raises PasswordsBusy when the queue is full"""
+        if not self._slots.acquire(blocking=False):
+            raise PasswordsBusy()
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _pool(self):
+        # Threads do not survive a fork, so one pool per process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='password-hash')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+        self._executor = None
+        self._pid = None
+
+    # -- Passwords -----------------------------------------------------------
+
+    def hash(self, password):
+        """Hash a password at the current method and cost"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, stored, password):
+        """
+        Verify a password against a stored hash. Without a hash (unknown email)
+        a dummy hash is checked anyway, so the answer takes as long either way.
+        """
+        if stored is None:
+            if self._dummy is None:
+                self._dummy = self.hash(os.urandom(16).hex())
+            self._run(check_password_hash, self._dummy, password)
+            return False
+        return self._run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        """True when a stored hash was not made with the current method and cost"""
+        return stored is None or stored.split('$', 1)[0] != self.method
+
+
+passwords = Passwords()
+
+
+passwords_cli = AppGroup('passwords', help='Set passenger passwords.')
+
+
+@passwords_cli.command('set')
+@click.argument('email')
+@click.password_option()
+def set_command(email, password):
+    """Set the password of the passenger with EMAIL (also for accounts without one)."""
+    from models import db, Passenger
+
+    passenger = db.session.execute(
+        db.select(Passenger).where(Passenger.email == email)
+    ).scalar_one_or_none()
+    if passenger is None:
+        raise click.ClickException(f'No passenger with email {email}.')
+    passenger.set_password(password)
+    db.session.commit()
+    click.echo(f'Password set for {email}.')
@@ -0,0 +1,180 @@
+"""
+Dynamic fares
+
+A fare is built from the route and scaled by demand:
+
+    route      PRICING_BASE_FARE + PRICING_PER_MINUTE * flight duration
+    demand     DEMAND_FLOOR .. DEMAND_PEAK, rising with the square of the load
+               factor (ACTIVE tickets / aircraft capacity)
+    urgency    up to URGENCY_MARKUP more in the last URGENCY_DAYS before departure
+    class      CLASS_MULTIPLIERS (economy 1, business 2.5, first 4)
+
+Listings price a whole page in one pass over columns (fare_column), from the
+seat counts their query already returns: no query and no per-object property
+per flight. Days to departure count calendar days, so a fare only moves when
+the flight's load changes or the date does, pages and cards stay cacheable,
+and every flight of a day shares its urgency: the fare calendar
+(fare_calendar.py) takes the cheapest route x demand part of each day in SQL
+(route_demand_expression) and finishes it with day_fare().
+
+A single flight (the reserve page) gets a quote(): fares per class, cached per
+flight until its inventory changes (reserve, cancel and the disruption
+operations call flight_changed() after committing) or PRICING_QUOTE_TTL
+passes. reserve() books at a freshly computed quote, the same function the
+page showed, and asks for confirmation when it moved in between.
+
+Configuration (app.config, defaults read from the environment):
+    PRICING_BASE_FARE          fixed part of an economy fare (default 100)
+    PRICING_PER_MINUTE         per minute of flight time (default 0.30)
+    PRICING_MIN_FARE           lowest economy fare (default 49)
+    PRICING_QUOTE_TTL          seconds a cached quote is kept (default 300)
+    PRICING_QUOTE_MAX_ENTRIES  bound for the memory backend (default 10000)
+Quotes share the search cache backend (SEARCH_CACHE_BACKEND / _REDIS_URL).
+"""
+import os
+from datetime import datetime
+
+from cache import TTLCache, make_backend
+from db_config import env_float, env_int
+
+CLASS_MULTIPLIERS = {'ECONOMY': 1.0, 'BUSINESS': 2.5, 'FIRST': 4.0}
+
+DEMAND_FLOOR = 0.8   # Empty flight
+DEMAND_PEAK = 2.0    # Full flight
+URGENCY_DAYS = 21
+URGENCY_MARKUP = 0.5
+DEFAULT_DURATION = 120  # Minutes, for flights without a duration
+
+
+class Pricing:
+    """Fare computation and the per-flight quote cache; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.base_fare = 100.0
+        self.per_minute = 0.30
+        self.min_fare = 49.0
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PRICING_BASE_FARE', env_float('PRICING_BASE_FARE', 100.0))
+        app.config.setdefault('PRICING_PER_MINUTE', env_float('PRICING_PER_MINUTE', 0.30))
+        app.config.setdefault('PRICING_MIN_FARE', env_float('PRICING_MIN_FARE', 49.0))
+        app.config.setdefault('PRICING_QUOTE_TTL', env_int('PRICING_QUOTE_TTL', 300))
+        app.config.setdefault('PRICING_QUOTE_MAX_ENTRIES', env_int('PRICING_QUOTE_MAX_ENTRIES', 10000))
+        self.base_fare = app.config['PRICING_BASE_FARE']
+        self.per_minute = app.config['PRICING_PER_MINUTE']
+        self.min_fare = app.config['PRICING_MIN_FARE']
+
+        backend = app.config.get('SEARCH_CACHE_BACKEND', os.getenv('SEARCH_CACHE_BACKEND', 'memory'))
+        if backend == 'none' or not app.config['PRICING_QUOTE_TTL']:
+            self.cache = None
+        else:
+            self.cache = TTLCache(
+                make_backend(backend, app.config['PRICING_QUOTE_MAX_ENTRIES'],
+                             app.config.get('SEARCH_CACHE_REDIS_URL'), prefix='flightapp:quotes:v1:'),
+                app.config['PRICING_QUOTE_TTL'],
+            )
+
+    # -- Fares ---------------------------------------------------------------
+
+    def fare_column(self, capacities, available, departures, durations, now=None, seat_class='ECONOMY'):
+        """
+        Fares for whole columns of flights (capacity, seats left, departure
+        time, duration in minutes) in one pass; returns a list of floats.
+        """
+        today = (now or datetime.now()).date()
+        base, per_minute, min_fare = self.base_fare, self.per_minute, self.min_fare
+        spread = DEMAND_PEAK - DEMAND_FLOOR
+        markup = URGENCY_MARKUP / URGENCY_DAYS
+        multiplier = CLASS_MULTIPLIERS[seat_class]
+        fares = []
+        append = fares.append
+        for capacity, seats, departure, minutes in zip(capacities, available, departures, durations):
+            load = 1.0 - seats / capacity if capacity else 1.0
+            load = 0.0 if load < 0.0 else 1.0 if load > 1.0 else load
+            days = (departure.date() - today).days
+            urgency = 1.0 + markup * (URGENCY_DAYS - max(days, 0)) if days < URGENCY_DAYS else 1.0
+            fare = (base + per_minute * (minutes or DEFAULT_DURATION)) * (DEMAND_FLOOR + spread * load * load) * urgency
+            append(round((fare if fare > min_fare else min_fare) * multiplier, 2))
+        return fares
+
+    def route_demand_expression(self, capacity, booked, duration):
+        """
+        SQL expression of the part of a fare that does not depend on the day:
+        route fare x demand, for flights with seats (booked < capacity)
+        """
+        from models import db
+        load = db.cast(booked, db.Float) / capacity
+        route = self.base_fare + self.per_minute * db.func.coalesce(duration, DEFAULT_DURATION)
+        return route * (DEMAND_FLOOR + (DEMAND_PEAK - DEMAND_FLOOR) * load * load)
+
+    def day_fare(self, route_demand, day, today=None, seat_class='ECONOMY'):
+        """Fare of a flight departing on `day` from its route_demand_expression() value"""
+        days = (day - (today or datetime.now().date())).days
+        urgency = 1.0 + URGENCY_MARKUP / URGENCY_DAYS * (URGENCY_DAYS - max(days, 0)) if days < URGENCY_DAYS else 1.0
+        fare = route_demand * urgency
+        return round((fare if fare > self.min_fare else self.min_fare) * CLASS_MULTIPLIERS[seat_class], 2)
+
+    def price_flights(self, flights, now=None):
+        """
+        Set the economy fare (flight.price) of every flight of a listing. The
+        flights need available_seats attached and aircraft_rel loaded
+        (Flight.available_seats_query does both).
+        """
+        if not flights:
+            return flights
+        prices = self.fare_column(
+            [flight.aircraft_rel.capacity for flight in flights],
+            [flight.available_seats for flight in flights],
+            [flight.departure_time for flight in flights],
+            [flight.duration_minutes for flight in flights],
+            now=now,
+        )
+        for flight, price in zip(flights, prices):
+            flight._price = price
+        return flights
+
+    # -- Quotes --------------------------------------------------------------
+
+    def compute_quote(self, flight, now=None):
+        """{seat_class: fare} for one flight, from its current seat count"""
+        now = now or datetime.now()
+        columns = ([flight.aircraft_rel.capacity], [flight.available_seats],
+                   [flight.departure_time], [flight.duration_minutes])
+        return {cls: self.fare_column(*columns, now=now, seat_class=cls)[0] for cls in CLASS_MULTIPLIERS}
+
+    def quote(self, flight, fresh=False):
+        """
+        Fares per class for one flight, from the quote cache unless fresh.
+        A cached quote is dropped when the flight's inventory changes, and not
+        reused on another day (the urgency markup is per day).
+        """
+        today = datetime.now().date().isoformat()
+        key = flight.flight_number
+        if self.cache is not None and not fresh:
+            found, cached = self.cache.get(key)
+            if found and cached[0] == today:
+                return cached[1]
+        since = self.cache.generation() if self.cache is not None else None
+        fares = self.compute_quote(flight)
+        if self.cache is not None:
+            self.cache.set(key, (today, fares), since=since)
+        return fares
+
+    def flight_changed(self, *flight_numbers):
+        """Call after a change to the flights' inventory has been committed"""
+        if self.cache is not None:
+            for number in flight_numbers:
+                self.cache.delete(number)
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats() if self.cache is not None else {'enabled': False}
+
+
+pricing = Pricing()
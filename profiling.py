@@ -0,0 +1,163 @@
+"""
+Per-request SQL profiling and slow-query log
+
+Records, for every request, how many statements it ran, the total time spent
+in the database and its slowest statements. Results are returned in response
+headers (X-DB-Query-Count, X-DB-Time-Ms), kept for the most recent requests
+at /_debug/sql (only with DEBUG_ENDPOINTS, as it shows statement text), and
+statements slower than a threshold are written to the "flightapp.slow_query"
+logger as one JSON object per line.
+
+Configuration (app.config, defaults read from the environment):
+    SQL_PROFILING            enable per-request stats and headers, and /_debug/sql with
+                             DEBUG_ENDPOINTS=1
+    SQL_SLOW_QUERY_MS        log statements slower than this many ms (0 = off)
+    SQL_PROFILING_TOP_N      slowest statements kept per request (default 5)
+    SQL_PROFILING_HISTORY    number of recent requests kept for /_debug/sql
+
+When both SQL_PROFILING and SQL_SLOW_QUERY_MS are off no event listeners are
+installed at all, so there is no per-statement overhead.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request, jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db_config import env_bool, env_float, env_int
+
+slow_query_logger = logging.getLogger('flightapp.slow_query')
+
+
+class SQLProfiler:
+    """Collects SQL timings per request; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query_ms = 0
+        self.top_n = 5
+        self.history = deque(maxlen=100)
+        self.route_totals = {}
+        self._lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILING', env_bool('SQL_PROFILING'))
+        app.config.setdefault('SQL_SLOW_QUERY_MS', env_float('SQL_SLOW_QUERY_MS', 0))
+        app.config.setdefault('SQL_PROFILING_TOP_N', env_int('SQL_PROFILING_TOP_N', 5))
+        app.config.setdefault('SQL_PROFILING_HISTORY', env_int('SQL_PROFILING_HISTORY', 100))
+        app.config.setdefault('DEBUG_ENDPOINTS', env_bool('DEBUG_ENDPOINTS'))
+
+        self.enabled = app.config['SQL_PROFILING']
+        self.slow_query_ms = app.config['SQL_SLOW_QUERY_MS']
+        self.top_n = app.config['SQL_PROFILING_TOP_N']
+        self.history = deque(maxlen=app.config['SQL_PROFILING_HISTORY'])
+
+        if not (self.enabled or self.slow_query_ms):
+            return
+
+        if not self._listening:
+            # Listening on the Engine class covers every engine the app creates
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+
+        if self.enabled:
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+            if app.config['DEBUG_ENDPOINTS']:
+                app.add_url_rule('/_debug/sql', 'debug_sql', self.debug_view)
+
+    # -- SQLAlchemy events -------------------------------------------------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiling_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info['profiling_start'].pop()) * 1000
+        route = request.endpoint if has_request_context() else None
+
+        stats = g.get('sql_stats') if has_request_context() else None
+        if stats is not None:
+            stats['count'] += 1
+            stats['time_ms'] += elapsed_ms
+            stats['statements'].append((elapsed_ms, statement))
+
+        if self.slow_query_ms and elapsed_ms >= self.slow_query_ms:
+            slow_query_logger.warning(json.dumps({
+                'event': 'slow_query',
+                'route': route,
+                'method': request.method if has_request_context() else None,
+                'duration_ms': round(elapsed_ms, 2),
+                'executemany': executemany,
+                'statement': ' '.join(statement.split()),
+            }))
+
+    # -- Flask request hooks -----------------------------------------------
+
+    def _start_request(self):
+        g.sql_stats = {'count': 0, 'time_ms': 0.0, 'statements': []}
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+
+        response.headers['X-DB-Query-Count'] = str(stats['count'])
+        response.headers['X-DB-Time-Ms'] = f"{stats['time_ms']:.2f}"
+
+        slowest = sorted(stats['statements'], key=lambda s: s[0], reverse=True)[:self.top_n]
+        route = request.endpoint or request.path
+        self.history.append({
+            'route': route,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'query_count': stats['count'],
+            'db_time_ms': round(stats['time_ms'], 2),
+            'slowest': [
+                {'duration_ms': round(ms, 2), 'statement': ' '.join(sql.split())}
+                for ms, sql in slowest
+            ],
+        })
+        with self._lock:
+            totals = self.route_totals.setdefault(
+                route, {'requests': 0, 'queries': 0, 'db_time_ms': 0.0}
+            )
+            totals['requests'] += 1
+            totals['queries'] += stats['count']
+            totals['db_time_ms'] += stats['time_ms']
+        return response
+
+    # -- Reporting ---------------------------------------------------------
+
+    def summary(self):
+        """Per-route averages and the most recent requests"""
+        with self._lock:
+            routes = {
+                route: {
+                    'requests': t['requests'],
+                    'avg_queries': round(t['queries'] / t['requests'], 2),
+                    'avg_db_time_ms': round(t['db_time_ms'] / t['requests'], 2),
+                }
+                for route, t in self.route_totals.items()
+            }
+        return {'routes': routes, 'recent': list(self.history)}
+
+    def debug_view(self):
+        """JSON view of the collected statistics (/_debug/sql)"""
+        return jsonify(self.summary())
+
+    def reset(self):
+        with self._lock:
+            self.history.clear()
+            self.route_totals.clear()
+
+
+sql_profiler = SQLProfiler()
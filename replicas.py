@@ -0,0 +1,220 @@
+"""
+Read replica routing
+
+With read replicas configured (DB_REPLICAS, see db_config.py), views marked
+with replicas.read_only send their plain SELECTs to a replica instead of the
+primary. Everything else goes to the primary:
+
+    - writes (flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE), and any
+      read in a transaction that has already written;
+    - every query outside read-only views (reserve, cancel, the CLI, tasks);
+    - read-after-write: a request that commits a write pins the user's
+      session to the primary for REPLICA_LAG_SECONDS, so the pages shown right
+      after a booking or cancellation include it.
+
+Each user reads from the same replica (chosen by user id), so their pages do
+not go back in time between replicas that lag by different amounts. Shared
+caches refilled from a replica right after an invalidation would keep the
+replica's stale rows for their whole TTL, so the search cache refills from the
+primary for REPLICA_LAG_SECONDS after one (replicas.primary_reads(), see
+search_cache.py).
+
+    @user_bp.route('/results')
+    @login_required
+    @replicas.read_only
+    def results(): ...
+
+Configuration (app.config, defaults read from the environment):
+    REPLICA_READS        route reads to the replicas (default on when DB_REPLICAS is set)
+    REPLICA_LAG_SECONDS  replication lag tolerated; also how long a user stays on the
+                         primary after writing (default 5)
+
+The replicas are registered as SQLALCHEMY_BINDS (replica0, replica1, ...), so
+their pools are created, disposed and forked like the primary's.
+
+    flask --app app replicas status   # rows and latest booking per database
+    flask --app app replicas sync     # copy the SQLite primary to the replicas (local testing)
+"""
+import os
+import random
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+
+import click
+import sqlalchemy as sa
+from flask import g, has_request_context, session
+from flask.cli import AppGroup
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+
+PIN_KEY = 'db_primary_until'
+
+
+class Replicas:
+    """Chooses the engine for reads in read-only views; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.keys = []
+        self.lag_seconds = 5.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Not at the top: models imports this module, and db_config reads the environment on import
+        from db_config import env_bool, env_float
+
+        self.keys = sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith('replica'))
+        app.config.setdefault('REPLICA_READS', env_bool('REPLICA_READS', bool(self.keys)))
+        app.config.setdefault('REPLICA_LAG_SECONDS', env_float('REPLICA_LAG_SECONDS', 5.0))
+        self.lag_seconds = app.config['REPLICA_LAG_SECONDS']
+        if not app.config['REPLICA_READS']:
+            self.keys = []
+
+    def read_only(self, view):
+        """Mark a view whose reads may be served by a replica"""
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            g.db_reads = 'replica'
+            return view(*args, **kwargs)
+        return wrapped
+
+    def pinned(self):
+        return session.get(PIN_KEY, 0) > time.time()
+
+    def replica_key(self):
+        """Replica for this request, or None when it must read from the primary"""
+        if not self.keys or not has_request_context() or g.get('db_reads') != 'replica' or self.pinned():
+            return None
+        if 'db_replica' not in g:
+            user = current_user.get_id() if current_user.is_authenticated else None
+            index = zlib.crc32(user.encode()) if user else random.randrange(len(self.keys))
+            g.db_replica = self.keys[index % len(self.keys)]
+        return g.db_replica
+
+    @contextmanager
+    def primary_reads(self):
+        """Send the reads of a read-only view to the primary inside the block"""
+        if not has_request_context():
+            yield
+            return
+        previous = g.get('db_reads')
+        g.db_reads = 'primary'
+        try:
+            yield
+        finally:
+            g.db_reads = previous
+
+    def read_engine(self):
+        """Engine for reads outside the ORM session (e.g. a streamed search)"""
+        from models import db
+        key = self.replica_key()
+        return db.engines[key] if key else db.engine
+
+    def engine_for(self, db_session, clause):
+        """Replica engine for this statement of the session, or None for the primary"""
+        # 'wrote' is set before a flush starts, so statements of the flush go to the primary too
+        if not self.keys or db_session.info.get('wrote'):
+            return None
+        if not isinstance(clause, sa.Select) or clause._for_update_arg is not None:
+            return None
+        key = self.replica_key()
+        if key is None or db_session.new or db_session.dirty or db_session.deleted:
+            return None
+        return db_session._db.engines[key]
+
+    def wrote(self, db_session):
+        """After a commit that wrote: keep this user's reads on the primary for a while"""
+        if not db_session.info.pop('wrote', False) or not has_request_context():
+            return
+        g.db_reads = 'primary'
+        if self.keys and self.lag_seconds > 0:
+            session[PIN_KEY] = time.time() + self.lag_seconds
+
+    def engines(self):
+        """(name, engine) of the primary and each replica"""
+        from models import db
+        return [('primary', db.engine)] + [(key, db.engines[key]) for key in self.keys]
+
+
+class RoutingSession(Session):
+    """db.session class: replicas.engine_for() decides where each statement goes"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = replicas.engine_for(self, clause)
+            if engine is not None:
+                return engine
+            if isinstance(clause, sa.sql.dml.UpdateBase):
+                # Reads later in this transaction must see the write
+                self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, 'before_flush')
+def _flushing(db_session, flush_context, instances):
+    db_session.info['wrote'] = True
+
+
+@sa.event.listens_for(RoutingSession, 'after_commit')
+def _committed(db_session):
+    replicas.wrote(db_session)
+
+
+@sa.event.listens_for(RoutingSession, 'after_rollback')
+def _rolled_back(db_session):
+    db_session.info.pop('wrote', None)
+
+
+replicas = Replicas()
+
+
+replicas_cli = AppGroup('replicas', help='Inspect and sync the read replicas.')
+
+
+@replicas_cli.command('status')
+def status_command():
+    """Show tickets and the latest booking/change on each database."""
+    from models import Ticket, TicketChange
+
+    statement = sa.select(
+        sa.func.count(Ticket.ticket_number), sa.func.max(Ticket.booking_date),
+        sa.select(sa.func.max(TicketChange.change_date)).scalar_subquery()
+    )
+    primary = None
+    for name, engine in replicas.engines():
+        try:
+            with engine.connect() as conn:
+                tickets, last_booking, last_change = conn.execute(statement).one()
+        except Exception as e:
+            click.echo(f'{name:<10} error: {e}')
+            continue
+        primary = tickets if primary is None else primary
+        behind = '' if name == 'primary' else f'  ({primary - tickets} tickets behind)'
+        click.echo(f'{name:<10} {tickets} tickets, last booking {last_booking}, '
+                   f'last change {last_change}{behind}')
+
+
+@replicas_cli.command('sync')
+def sync_command():
+    """Copy the SQLite primary to each SQLite replica file."""
+    engines = replicas.engines()
+    if engines[0][1].dialect.name != 'sqlite':
+        raise click.ClickException('sync only copies SQLite databases; replicate Oracle with Data Guard.')
+    source = sqlite3.connect(engines[0][1].url.database)
+    try:
+        for name, engine in engines[1:]:
+            path = engine.url.database.removeprefix('file:')
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            engine.dispose()
+            click.echo(f'{name}: copied to {os.path.relpath(path)}')
+    finally:
+        source.close()
+    if len(engines) == 1:
+        click.echo('No replicas configured (DB_REPLICAS).')
@@ -0,0 +1,307 @@
+"""
+In-memory route graph for connecting itineraries
+
+Every upcoming flight is a time-dependent edge origin -> destination, kept per
+departure airport in departure-time order. A connection search walks the graph
+from the origin's departures, following only legs that leave within the
+allowed connection window after the previous arrival (a binary search in the
+next airport's list), and keeps the best itineraries found so far to prune any
+path that can no longer beat them. No self-joins of FLIGHT are needed.
+
+Flights inserted, updated or deleted through the ORM are reloaded into the
+graph after their transaction commits; code that changes FLIGHT with bulk
+statements calls route_graph.flights_changed(). The whole graph is also
+reloaded every ROUTE_GRAPH_REFRESH_SECONDS.
+
+Configuration (app.config, defaults read from the environment):
+    ROUTE_GRAPH_REFRESH_SECONDS   full reload interval (default 900)
+    ROUTE_GRAPH_MAX_LEGS          default and upper bound of legs (default 3)
+    ROUTE_GRAPH_MIN_CONNECTION    minutes between arrival and next departure (default 45)
+    ROUTE_GRAPH_MAX_CONNECTION    longest layover in minutes (default 360)
+    ROUTE_GRAPH_MAX_EXPANSIONS    legs examined per search before giving up (default 200000)
+"""
+import bisect
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db_config import env_int
+
+logger = logging.getLogger(__name__)
+
+Leg = namedtuple('Leg', 'flight_number airline_id origin destination departure arrival')
+
+RANKINGS = ('arrival', 'duration')
+
+# Flights that departed more than this long ago are not loaded
+PAST_WINDOW = timedelta(days=1)
+
+EPOCH = datetime(1970, 1, 1)
+NO_DEPARTURES = ((), ())
+
+
+class RouteGraph:
+    """Departures per airport, sorted by time; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.refresh_seconds = 900
+        self.max_legs = 3
+        self.min_connection = 45
+        self.max_connection = 360
+        self.max_expansions = 200000
+        self.loaded_at = None
+        self._departures = {}     # airport -> (departure times, legs), both sorted by time
+        self._by_number = {}      # flight_number -> Leg
+        self._dirty = set()       # flight numbers committed since they were loaded
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ROUTE_GRAPH_REFRESH_SECONDS', env_int('ROUTE_GRAPH_REFRESH_SECONDS', 900))
+        app.config.setdefault('ROUTE_GRAPH_MAX_LEGS', env_int('ROUTE_GRAPH_MAX_LEGS', 3))
+        app.config.setdefault('ROUTE_GRAPH_MIN_CONNECTION', env_int('ROUTE_GRAPH_MIN_CONNECTION', 45))
+        app.config.setdefault('ROUTE_GRAPH_MAX_CONNECTION', env_int('ROUTE_GRAPH_MAX_CONNECTION', 360))
+        app.config.setdefault('ROUTE_GRAPH_MAX_EXPANSIONS', env_int('ROUTE_GRAPH_MAX_EXPANSIONS', 200000))
+        self.app = app
+        self.refresh_seconds = app.config['ROUTE_GRAPH_REFRESH_SECONDS']
+        self.max_legs = app.config['ROUTE_GRAPH_MAX_LEGS']
+        self.min_connection = app.config['ROUTE_GRAPH_MIN_CONNECTION']
+        self.max_connection = app.config['ROUTE_GRAPH_MAX_CONNECTION']
+        self.max_expansions = app.config['ROUTE_GRAPH_MAX_EXPANSIONS']
+
+        from models import Flight
+        if not event.contains(Flight, 'after_update', self._flight_flushed):
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(Flight, name, self._flight_flushed)
+            event.listen(Session, 'after_commit', self._session_committed)
+            event.listen(Session, 'after_rollback', self._session_rolled_back)
+
+    # -- Loading -----------------------------------------------------------
+
+    @staticmethod
+    def _select(flight_numbers=None):
+        from models import db, Flight
+        statement = db.select(
+            Flight.flight_number, Flight.airline_id, Flight.departure_airport,
+            Flight.arrival_airport, Flight.departure_time, Flight.arrival_time
+        ).where(Flight.departure_time >= datetime.now() - PAST_WINDOW)
+        if flight_numbers is not None:
+            statement = statement.where(Flight.flight_number.in_(flight_numbers))
+        return statement
+
+    def load(self, legs):
+        """Build the graph from Leg tuples"""
+        by_airport = {}
+        by_number = {}
+        for leg in legs:
+            by_airport.setdefault(leg.origin, []).append(leg)
+            by_number[leg.flight_number] = leg
+        departures = {}
+        for airport, airport_legs in by_airport.items():
+            airport_legs.sort(key=lambda leg: (leg.departure, leg.flight_number))
+            departures[airport] = ([leg.departure for leg in airport_legs], airport_legs)
+
+        with self._lock:
+            self._departures = departures
+            self._by_number = by_number
+            self.loaded_at = time.monotonic()
+        logger.info('Route graph loaded: %d flights from %d airports', len(by_number), len(departures))
+
+    def refresh(self):
+        """Reload the whole graph from the FLIGHT table"""
+        from models import db
+        with self.app.app_context():
+            rows = db.session.execute(self._select()).all()
+        with self._lock:
+            self._dirty.clear()
+        self.load(Leg(*row) for row in rows)
+
+    def update(self, flight_numbers):
+        """Reload just these flights (changed, added or deleted) into the graph"""
+        from models import db
+        numbers = set(flight_numbers)
+        chunks = [sorted(numbers)[i:i + 1000] for i in range(0, len(numbers), 1000)]
+        with self.app.app_context():
+            fresh = [Leg(*row) for chunk in chunks for row in db.session.execute(self._select(chunk))]
+
+        with self._lock:
+            # Copy-on-write: searches running now keep the lists they already hold
+            departures = dict(self._departures)
+            by_number = dict(self._by_number)
+            airports = {by_number[n].origin for n in numbers if n in by_number}
+            airports.update(leg.origin for leg in fresh)
+            for number in numbers:
+                by_number.pop(number, None)
+            for leg in fresh:
+                by_number[leg.flight_number] = leg
+            for airport in airports:
+                legs = [leg for leg in departures.get(airport, NO_DEPARTURES)[1] if leg.flight_number not in numbers]
+                legs += [leg for leg in fresh if leg.origin == airport]
+                legs.sort(key=lambda leg: (leg.departure, leg.flight_number))
+                if legs:
+                    departures[airport] = ([leg.departure for leg in legs], legs)
+                else:
+                    departures.pop(airport, None)
+            self._departures = departures
+            self._by_number = by_number
+
+    def flights_changed(self, flight_numbers):
+        """Mark flights changed by bulk statements; reloaded before the next search"""
+        with self._lock:
+            self._dirty.update(flight_numbers)
+
+    def ensure_fresh(self):
+        """Load on first use, apply committed flight changes, reload when the interval has passed"""
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds:
+            # One thread reloads; the others keep using the current graph meanwhile
+            if self._refresh_lock.acquire(blocking=self.loaded_at is None):
+                try:
+                    if self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds:
+                        self.refresh()
+                finally:
+                    self._refresh_lock.release()
+        if self._dirty:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            self.update(dirty)
+
+    def warm_up(self):
+        """Load at startup; a database that is not reachable yet is retried on first use"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning('Route graph not loaded at startup: %s', e)
+
+    # -- Change tracking ---------------------------------------------------
+
+    def _flight_flushed(self, mapper, connection, flight):
+        # Applied only once the transaction commits, so searches never see uncommitted rows
+        from sqlalchemy.orm import object_session
+        session = object_session(flight)
+        if session is not None:
+            session.info.setdefault('route_graph_changed', set()).add(flight.flight_number)
+
+    def _session_committed(self, session):
+        changed = session.info.pop('route_graph_changed', None)
+        if changed:
+            self.flights_changed(changed)
+
+    def _session_rolled_back(self, session):
+        session.info.pop('route_graph_changed', None)
+
+    # -- Search ------------------------------------------------------------
+
+    def search(self, origins, destinations, start, end, max_legs=None, min_connection=None,
+               max_connection=None, rank='arrival', limit=10):
+        """
+        Best itineraries (lists of Leg) from any of `origins` to any of
+        `destinations` whose first leg departs in [start, end). rank is
+        'arrival' (earliest arrival first) or 'duration' (shortest total
+        travel time first); ties go to fewer legs.
+        """
+        self.ensure_fresh()
+        departures = self._departures
+        max_legs = min(max_legs or self.max_legs, self.max_legs)
+        min_gap = timedelta(minutes=self.min_connection if min_connection is None else min_connection)
+        max_gap = timedelta(minutes=self.max_connection if max_connection is None else max_connection)
+        origins = set(origins)
+        destinations = set(destinations) - origins
+        by_duration = rank == 'duration'
+
+        def score(first, last):
+            if by_duration:
+                return (last.arrival - first.departure).total_seconds()
+            return (last.arrival - EPOCH).total_seconds()
+
+        best = []  # max-heap of the `limit` best: (-score, -legs, tiebreak, legs)
+        counter = itertools.count()
+        expansions = 0
+
+        def worst():
+            return -best[0][0] if len(best) >= limit else None
+
+        def extend(path, visited):
+            nonlocal expansions
+            last = path[-1]
+            if last.destination in destinations:
+                entry = (-score(path[0], last), -len(path), -next(counter), list(path))
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+                return
+            if len(path) >= max_legs:
+                return
+            times, legs = departures.get(last.destination, NO_DEPARTURES)
+            lo = bisect.bisect_left(times, last.arrival + min_gap)
+            hi = bisect.bisect_right(times, last.arrival + max_gap)
+            for leg in legs[lo:hi]:
+                expansions += 1
+                if expansions > self.max_expansions:
+                    return
+                if leg.destination in visited:
+                    continue
+                bound = worst()
+                # Arrival only moves later along a path, so this path cannot win any more
+                if bound is not None and score(path[0], leg) > bound:
+                    continue
+                path.append(leg)
+                extend(path, visited | {leg.destination})
+                path.pop()
+
+        for origin in origins:
+            times, legs = departures.get(origin, NO_DEPARTURES)
+            for leg in legs[bisect.bisect_left(times, start):bisect.bisect_left(times, end)]:
+                if leg.destination in origins:
+                    continue
+                bound = worst()
+                if bound is not None and score(leg, leg) > bound:
+                    continue
+                extend([leg], {origin, leg.destination})
+
+        return [entry[3] for entry in sorted(best, reverse=True)]
+
+    def stats(self):
+        return {
+            'flights': len(self._by_number),
+            'airports': len(self._departures),
+            'pending_changes': len(self._dirty),
+        }
+
+
+def itinerary_json(legs, seats=None):
+    """JSON-ready description of an itinerary; seats maps flight_number -> available seats"""
+    connections = [
+        int((nxt.departure - prev.arrival).total_seconds() // 60)
+        for prev, nxt in zip(legs, legs[1:])
+    ]
+    return {
+        'departure_airport': legs[0].origin,
+        'arrival_airport': legs[-1].destination,
+        'departure_time': legs[0].departure.isoformat(),
+        'arrival_time': legs[-1].arrival.isoformat(),
+        'duration_minutes': int((legs[-1].arrival - legs[0].departure).total_seconds() // 60),
+        'stops': len(legs) - 1,
+        'connection_minutes': connections,
+        'legs': [{
+            'flight_number': leg.flight_number,
+            'departure_airport': leg.origin,
+            'arrival_airport': leg.destination,
+            'departure_time': leg.departure.isoformat(),
+            'arrival_time': leg.arrival.isoformat(),
+            'available_seats': seats.get(leg.flight_number) if seats is not None else None,
+        } for leg in legs],
+    }
+
+
+route_graph = RouteGraph()
@@ -0,0 +1,254 @@
+"""
+Indexes for the hot queries, and commands to manage them
+
+The indexes are declared on the model tables, so db.create_all() (the SQLite
+stand-in) creates them with the schema. On Oracle, where the tables already
+exist, apply them with:
+
+    flask --app app schema create-tables    # tables and columns added by this app (SEAT_INVENTORY, ...)
+    flask --app app schema create-indexes
+    flask --app app schema explain          # check the hot queries use them
+
+An index is not created again when an existing one on the same table already
+leads with its columns; a unique index only when an existing unique index has
+exactly its columns (e.g. the one behind a UNIQUE constraint on PASSENGER.EMAIL).
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, select, func
+from sqlalchemy.schema import CreateColumn
+
+from models import db, Flight, Passenger, Ticket, TicketChange
+
+INDEXES = [
+    # Route search: origin + destination + departure window
+    db.Index('IX_FLIGHT_ROUTE_DEP', Flight.departure_airport, Flight.arrival_airport,
+             Flight.departure_time),
+    # Destination-only search
+    db.Index('IX_FLIGHT_ARR_DEP', Flight.arrival_airport, Flight.departure_time),
+    # Date-only search and the keyset-paginated listing order
+    db.Index('IX_FLIGHT_DEP_TIME', Flight.departure_time, Flight.flight_number),
+    # Seats booked per flight (COUNT of ACTIVE tickets)
+    db.Index('IX_TICKET_FLIGHT_STATUS', Ticket.flight_number, Ticket.status),
+    # A passenger's reservations, newest first
+    db.Index('IX_TICKET_PASSENGER_BOOKED', Ticket.passenger_id, Ticket.booking_date,
+             Ticket.ticket_number),
+    # Latest change of a passenger's tickets (reservations page ETag)
+    db.Index('IX_TICKETCHANGE_TICKET_DATE', TicketChange.ticket_number, TicketChange.change_date),
+    # Login and registration look passengers up by email (also keeps emails unique)
+    db.Index('IX_PASSENGER_EMAIL', Passenger.email, unique=True),
+]
+
+# Columns this app added to tables that already exist on Oracle
+COLUMNS = [
+    Passenger.__table__.c.PASSWORD_HASH,
+]
+
+
+def day_range(day):
+    """Half-open [start, end) datetime range covering one calendar day"""
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def existing_indexes(engine):
+    """{index name: (table, column names, unique)} on the INDEXES tables, upper case"""
+    inspector = inspect(engine)
+    # SQLite's indexes behind UNIQUE constraints are only listed on request
+    options = {'include_auto_indexes': True} if engine.dialect.name == 'sqlite' else {}
+    existing = {}
+    for table in {index.table.name for index in INDEXES}:
+        for ix in inspector.get_indexes(table, **options):
+            if ix['name']:
+                existing[ix['name'].upper()] = (table.upper(), tuple(str(name).upper() for name in ix['column_names']),
+                                                bool(ix.get('unique')))
+        # Oracle does not list the index behind a UNIQUE constraint with the indexes
+        for constraint in inspector.get_unique_constraints(table):
+            if constraint['name'] and constraint['name'].upper() not in existing:
+                existing[constraint['name'].upper()] = (
+                    table.upper(), tuple(str(name).upper() for name in constraint['column_names']), True)
+    return existing
+
+
+def existing_index_names(engine):
+    return set(existing_indexes(engine))
+
+
+def covering_index(index, existing):
+    """
+    Name of the existing index that serves `index`, or None: itself, or one on
+    the same table leading with its columns. A unique index is only served by
+    a unique index on exactly its columns, so the uniqueness still holds.
+    """
+    if index.name.upper() in existing:
+        return index.name.upper()
+    table = index.table.name.upper()
+    columns = tuple(column.name.upper() for column in index.columns)
+    for name, (existing_table, existing_columns, unique) in existing.items():
+        if existing_table != table:
+            continue
+        if index.unique:
+            if unique and existing_columns == columns:
+                return name
+        elif existing_columns[:len(columns)] == columns:
+            return name
+    return None
+
+
+def create_indexes(engine):
+    """Create any missing INDEXES; returns the names created"""
+    existing = existing_indexes(engine)
+    created = []
+    for index in INDEXES:
+        if covering_index(index, existing) is None:
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+
+def add_columns(engine):
+    """ALTER TABLE ... ADD the COLUMNS missing from existing tables; returns 'TABLE.COLUMN' names added"""
+    inspector = inspect(engine)
+    added = []
+    for column in COLUMNS:
+        table = column.table.name
+        if not inspector.has_table(table):
+            continue  # create_all() creates it whole
+        if column.name.upper() in {c['name'].upper() for c in inspector.get_columns(table)}:
+            continue
+        definition = CreateColumn(column).compile(dialect=engine.dialect)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f'ALTER TABLE {engine.dialect.identifier_preparer.format_table(column.table)} '
+                                 f'ADD {definition}')
+        added.append(f'{table}.{column.name}')
+    return added
+
+
+def drop_indexes(engine):
+    """Drop the INDEXES that exist; returns the names dropped"""
+    existing = existing_index_names(engine)
+    dropped = []
+    for index in INDEXES:
+        if index.name.upper() in existing:
+            index.drop(bind=engine)
+            dropped.append(index.name)
+    return dropped
+
+
+def hot_queries():
+    """(name, expected index, statement) for the queries the routes run most"""
+    start, end = day_range(datetime.now().date())
+    return [
+        ('route search', 'IX_FLIGHT_ROUTE_DEP',
+         select(Flight.flight_number).where(
+             Flight.departure_airport.in_(['EWR']),
+             Flight.arrival_airport.in_(['LAX']),
+             Flight.departure_time >= start,
+             Flight.departure_time < end,
+         )),
+        ('destination search', 'IX_FLIGHT_ARR_DEP',
+         select(Flight.flight_number).where(
+             Flight.arrival_airport.in_(['LAX']),
+             Flight.departure_time >= start,
+             Flight.departure_time < end,
+         )),
+        ('flight listing page', 'IX_FLIGHT_DEP_TIME',
+         select(Flight.flight_number).where(
+             Flight.departure_time >= start
+         ).order_by(Flight.departure_time, Flight.flight_number).limit(26)),
+        ('seats booked', 'IX_TICKET_FLIGHT_STATUS',
+         select(func.count(Ticket.ticket_number)).where(
+             Ticket.flight_number == 'AA100',
+             Ticket.status == 'ACTIVE',
+         )),
+        ('my reservations page', 'IX_TICKET_PASSENGER_BOOKED',
+         select(Ticket.ticket_number).where(
+             Ticket.passenger_id == 1
+         ).order_by(Ticket.booking_date.desc(), Ticket.ticket_number.desc()).limit(26)),
+        ('reservations change stamp', 'IX_TICKETCHANGE_TICKET_DATE',
+         select(func.max(TicketChange.change_date)).join(
+             Ticket, Ticket.ticket_number == TicketChange.ticket_number
+         ).where(Ticket.passenger_id == 1)),
+        ('passenger login', 'IX_PASSENGER_EMAIL',
+         select(Passenger.passenger_id, Passenger.password_hash).where(
+             Passenger.email == 'passenger1@example.com'
+         )),
+    ]
+
+
+def explain(engine, statement):
+    """Execution plan lines for a statement (SQLite or Oracle)"""
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            return [row[-1] for row in conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+        if engine.dialect.name == 'oracle':
+            statement_id = f'HOTQ{datetime.now():%H%M%S%f}'
+            conn.exec_driver_sql(f"EXPLAIN PLAN SET STATEMENT_ID = '{statement_id}' FOR {sql}")
+            rows = conn.exec_driver_sql(
+                "SELECT operation, options, object_name FROM plan_table "
+                f"WHERE statement_id = '{statement_id}' ORDER BY id"
+            ).fetchall()
+            conn.exec_driver_sql(f"DELETE FROM plan_table WHERE statement_id = '{statement_id}'")
+            conn.commit()
+            return [' '.join(part for part in row if part) for row in rows]
+    raise click.ClickException(f'EXPLAIN is not supported for {engine.dialect.name}')
+
+
+def check_index_usage(engine):
+    """[(name, expected index, used?, plan lines)] for every hot query"""
+    existing = existing_indexes(engine)
+    indexes = {index.name: index for index in INDEXES}
+    results = []
+    for name, index_name, statement in hot_queries():
+        # The index may exist under another name (e.g. behind a UNIQUE constraint)
+        serving = covering_index(indexes[index_name], existing) or index_name
+        plan = explain(engine, statement)
+        used = any(serving.upper() in line.upper() for line in plan)
+        results.append((name, index_name, used, plan))
+    return results
+
+
+schema_cli = AppGroup('schema', help='Manage app tables and hot-query indexes.')
+
+
+@schema_cli.command('create-tables')
+def create_tables_command():
+    """Create tables and columns that do not exist yet (e.g. SEAT_INVENTORY, PASSENGER.PASSWORD_HASH)."""
+    before = set(inspect(db.engine).get_table_names())
+    db.create_all(bind_key=None)
+    created = sorted(set(inspect(db.engine).get_table_names()) - before)
+    click.echo(f"Created: {', '.join(created)}" if created else 'All tables already exist.')
+    added = add_columns(db.engine)
+    click.echo(f"Added columns: {', '.join(added)}" if added else 'All columns already exist.')
+
+
+@schema_cli.command('create-indexes')
+def create_indexes_command():
+    """Create the missing hot-query indexes."""
+    created = create_indexes(db.engine)
+    click.echo(f"Created: {', '.join(created)}" if created else 'All indexes already exist.')
+
+
+@schema_cli.command('drop-indexes')
+def drop_indexes_command():
+    """Drop the hot-query indexes."""
+    dropped = drop_indexes(db.engine)
+    click.echo(f"Dropped: {', '.join(dropped)}" if dropped else 'No indexes to drop.')
+
+
+@schema_cli.command('explain')
+@click.option('--verbose', '-v', is_flag=True, help='Print the full plans.')
+def explain_command(verbose):
+    """Check that the hot queries use their indexes (exit status 1 if not)."""
+    missing = 0
+    for name, index_name, used, plan in check_index_usage(db.engine):
+        click.echo(f"{'OK  ' if used else 'MISS'} {name:<22} {index_name}")
+        if verbose or not used:
+            for line in plan:
+                click.echo(f'       {line}')
+        missing += not used
+    if missing:
+        raise SystemExit(1)
@@ -0,0 +1,122 @@
+"""
+Flight search result cache
+
+Pages of search results are cached by their normalized criteria (resolved
+airport codes, date, cursor, page size) as plain FlightSummary snapshots, so a
+repeated search renders without touching the database. Bookings and
+cancellations only move seat counts, so they invalidate just the entries that
+can change:
+    - every page showing the flight (tag "flight:<number>")
+    - after a cancellation, pages for the flight's origin and unfiltered pages
+      (tags "dep:<code>" / "dep:*"), where a full flight may reappear
+
+Configuration (app.config, defaults read from the environment):
+    SEARCH_CACHE_BACKEND      memory (default), redis or none
+    SEARCH_CACHE_TTL          seconds an entry stays valid (default 60)
+    SEARCH_CACHE_MAX_ENTRIES  bound for the memory backend (default 1024)
+    SEARCH_CACHE_REDIS_URL    Redis URL for the redis backend
+
+With the memory backend each worker process has its own cache and only sees
+its own invalidations; use the redis backend when running several workers.
+
+With read replicas, a page refilled from a lagging replica right after an
+invalidation would put the old seat counts and fares back for the whole TTL.
+An invalidation therefore leaves a marker in the cache for
+REPLICA_LAG_SECONDS, and misses while it is there load the page from the
+primary.
+"""
+import json
+import os
+
+from cache import TTLCache, make_backend
+from db_config import env_int
+from replicas import replicas
+
+# Set by an invalidation for REPLICA_LAG_SECONDS (not a JSON list, so no page key collides)
+INVALIDATED_KEY = 'invalidated'
+
+
+class SearchCache:
+    """Tagged TTL cache of search result pages; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_CACHE_BACKEND',
+                              os.getenv('SEARCH_CACHE_BACKEND', 'memory'))
+        app.config.setdefault('SEARCH_CACHE_TTL', env_int('SEARCH_CACHE_TTL', 60))
+        app.config.setdefault('SEARCH_CACHE_MAX_ENTRIES', env_int('SEARCH_CACHE_MAX_ENTRIES', 1024))
+        app.config.setdefault('SEARCH_CACHE_REDIS_URL',
+                              os.getenv('SEARCH_CACHE_REDIS_URL'))
+
+        backend = app.config['SEARCH_CACHE_BACKEND']
+        if backend == 'none':
+            self.cache = None
+        else:
+            self.cache = TTLCache(
+                make_backend(backend, app.config['SEARCH_CACHE_MAX_ENTRIES'],
+                             app.config['SEARCH_CACHE_REDIS_URL'], prefix='flightapp:search:v2:'),
+                app.config['SEARCH_CACHE_TTL'],
+            )
+
+    @staticmethod
+    def make_key(origin_codes=None, destination_codes=None, date=None, cursor=None, page_size=None):
+        """Normalized key: the same airports/date/page give the same key whatever the user typed"""
+        return json.dumps([
+            sorted(origin_codes) if origin_codes is not None else None,
+            sorted(destination_codes) if destination_codes is not None else None,
+            date, cursor, page_size,
+        ], separators=(',', ':'))
+
+    @staticmethod
+    def tags_for(origin_codes, page):
+        tags = {f'flight:{flight.flight_number}' for flight in page.items}
+        if origin_codes is None:
+            tags.add('dep:*')
+        else:
+            tags.update(f'dep:{code}' for code in origin_codes)
+        return tags
+
+    def get_page(self, loader, origin_codes=None, destination_codes=None, date=None,
+                 cursor=None, page_size=None):
+        """Cached result page for the criteria, calling loader() on a miss"""
+        if self.cache is None:
+            return loader()
+        key = self.make_key(origin_codes, destination_codes, date, cursor, page_size)
+        return self.cache.get_or_load(key, lambda: self.load(loader),
+                                      tags=lambda page: self.tags_for(origin_codes, page))
+
+    def load(self, loader):
+        """Run loader() for a miss, on the primary if a replica may not have the latest change yet"""
+        if replicas.keys and self.cache.backend.get(INVALIDATED_KEY)[0]:
+            with replicas.primary_reads():
+                return loader()
+        return loader()
+
+    def flight_changed(self, flight_number, departure_airport=None, seats_freed=False):
+        """Call after a booking/cancellation on a flight has been committed"""
+        if self.cache is None:
+            return
+        tags = [f'flight:{flight_number}']
+        if seats_freed:
+            tags += [f'dep:{departure_airport}', 'dep:*']
+        self.cache.invalidate_tags(tags)
+        self.mark_invalidated()
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+            self.mark_invalidated()
+
+    def mark_invalidated(self):
+        if replicas.keys and replicas.lag_seconds > 0:
+            self.cache.set(INVALIDATED_KEY, True, ttl=replicas.lag_seconds)
+
+    def stats(self):
+        return self.cache.stats() if self.cache is not None else {'enabled': False}
+
+
+search_cache = SearchCache()
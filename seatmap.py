@@ -0,0 +1,202 @@
+"""
+Seat maps and seat assignment
+
+Every aircraft is laid out in rows of six seats (A-F): first class rows at the
+front, then business, then economy, with the number of seats per cabin derived
+from Aircraft.capacity. SEAT_MAP stores, per flight and cabin, which seats are
+taken as a bitmap, so assigning seats reads and updates one small row instead
+of every ticket of the flight:
+
+    - the next free seat is the lowest clear bit (one big-int operation)
+    - a group gets adjacent seats in one row when such a block is free
+    - cancelling clears the seat's bit, so the seat is handed out again
+
+The booking transaction has already locked the flight's SEAT_INVENTORY row
+(see inventory.py), and the map row is additionally read FOR UPDATE.
+"""
+import re
+
+from models import SeatMap
+
+SEAT_CLASSES = ('FIRST', 'BUSINESS', 'ECONOMY')
+
+# Share of an aircraft's capacity in each premium cabin; economy gets the rest
+CABIN_SHARES = {'FIRST': 0.05, 'BUSINESS': 0.15}
+
+SEAT_LETTERS = 'ABCDEF'
+SEATS_PER_ROW = len(SEAT_LETTERS)
+
+SEAT_PATTERN = re.compile(r'^(\d+)([A-F])$')
+
+
+class SeatMapFull(Exception):
+    """No (more) free seats in the cabin's seat map"""
+
+
+def cabin_capacities(capacity):
+    """Seats per cabin class for an aircraft capacity, e.g. 180 -> 9 / 27 / 144"""
+    seats = {cls: int(capacity * share) for cls, share in CABIN_SHARES.items()}
+    seats['ECONOMY'] = capacity - sum(seats.values())
+    return seats
+
+
+def cabin_layout(capacity):
+    """{seat_class: (first_row, seats)}; each cabin starts on a new row"""
+    layout = {}
+    row = 1
+    for cls, seats in cabin_capacities(capacity).items():
+        layout[cls] = (row, seats)
+        row += -(-seats // SEATS_PER_ROW)
+    return layout
+
+
+def seat_label(first_row, index):
+    """Seat number of the index-th seat of a cabin, e.g. (3, 7) -> '04B'"""
+    row, column = divmod(index, SEATS_PER_ROW)
+    return f'{first_row + row:02d}{SEAT_LETTERS[column]}'
+
+
+def seat_index(first_row, seats, label):
+    """Inverse of seat_label; None if the label is not a seat of this cabin"""
+    match = SEAT_PATTERN.match(label or '')
+    if not match:
+        return None
+    index = (int(match.group(1)) - first_row) * SEATS_PER_ROW + SEAT_LETTERS.index(match.group(2))
+    return index if 0 <= index < seats else None
+
+
+class SeatBitmap:
+    """Occupied seats of one cabin; bit i set = seat i taken"""
+
+    def __init__(self, seats, bits=0):
+        self.seats = seats
+        self.bits = bits
+
+    @classmethod
+    def from_hex(cls, seats, text):
+        return cls(seats, int(text or '0', 16))
+
+    def to_hex(self):
+        return format(self.bits, 'x')
+
+    def take(self, index):
+        self.bits |= 1 << index
+
+    def free(self, index):
+        self.bits &= ~(1 << index)
+
+    def next_free(self):
+        """Lowest free seat index, or None when the cabin is full"""
+        lowest_clear = ~self.bits & (self.bits + 1)
+        index = lowest_clear.bit_length() - 1
+        return index if index < self.seats else None
+
+    def adjacent_block(self, count):
+        """
+        Start index of `count` free seats side by side in one row, or None.
+        Works on the whole bitmap at once, `count` big-int operations: bit i
+        of `runs` is set when seats i .. i+count-1 are all free, and `starts`
+        keeps only the runs that begin and end in the same row.
+        """
+        if count > SEATS_PER_ROW:
+            return None
+        free = ~self.bits & ((1 << self.seats) - 1)
+        runs = free
+        for shift in range(1, count):
+            runs &= free >> shift
+        rows = -(-self.seats // SEATS_PER_ROW)
+        every_row = ((1 << SEATS_PER_ROW * rows) - 1) // ((1 << SEATS_PER_ROW) - 1)
+        starts = runs & every_row * ((1 << SEATS_PER_ROW - count + 1) - 1)
+        if not starts:
+            return None
+        return (starts & -starts).bit_length() - 1
+
+    def allocate(self, count, adjacent=True):
+        """Take `count` seats (side by side when possible); returns their indexes"""
+        start = self.adjacent_block(count) if adjacent and count > 1 else None
+        if start is not None:
+            indexes = list(range(start, start + count))
+            for index in indexes:
+                self.take(index)
+            return indexes
+
+        indexes = []
+        for _ in range(count):
+            index = self.next_free()
+            if index is None:
+                raise SeatMapFull()
+            self.take(index)
+            indexes.append(index)
+        return indexes
+
+
+def build_seat_maps(flight_number, capacity, taken_seats):
+    """
+    SeatMap rows for a flight whose ACTIVE tickets hold taken_seats,
+    (ticket_number, seat_number, seat_class) tuples. Returns (rows, moved).
+
+    A ticket keeps its seat when the seat lies in the ticket's own cabin and no
+    earlier ticket holds it. Legacy seat numbers that do not (e.g. an economy
+    ticket in an old low row, or two tickets on one seat) get the next free
+    seat of their cabin instead; moved maps those ticket numbers to their new
+    seat numbers, which the caller writes to TICKET in the same transaction so
+    that cancelling the ticket frees the seat the map gave it.
+    """
+    taken_by_class = {}
+    for ticket_number, seat_number, seat_class in sorted(taken_seats):
+        taken_by_class.setdefault(seat_class, []).append((ticket_number, seat_number))
+
+    rows = []
+    moved = {}
+    for cls, (first_row, seats) in cabin_layout(capacity).items():
+        bitmap = SeatBitmap(seats)
+        unplaced = []
+        for ticket_number, label in taken_by_class.get(cls, []):
+            index = seat_index(first_row, seats, label)
+            if index is None or bitmap.bits >> index & 1:
+                unplaced.append(ticket_number)
+            else:
+                bitmap.take(index)
+        for ticket_number in unplaced:
+            index = bitmap.next_free()
+            if index is None:
+                break  # More tickets than the cabin has seats: they keep their numbers
+            bitmap.take(index)
+            moved[ticket_number] = seat_label(first_row, index)
+        rows.append(SeatMap(flight_number=flight_number, seat_class=cls, first_row=first_row,
+                            seats=seats, occupied=bitmap.to_hex()))
+    return rows, moved
+
+
+def allocate_seats(flight_number, seat_class, count, adjacent=True):
+    """
+    Assign `count` seats in the cabin and return their seat numbers.
+    Runs in the caller's transaction; raises SeatMapFull if the map has no room.
+    """
+    seat_map = SeatMap.query.filter_by(
+        flight_number=flight_number, seat_class=seat_class
+    ).with_for_update().one()
+    bitmap = SeatBitmap.from_hex(seat_map.seats, seat_map.occupied)
+    indexes = bitmap.allocate(count, adjacent)
+    seat_map.occupied = bitmap.to_hex()
+    return [seat_label(seat_map.first_row, index) for index in indexes]
+
+
+def free_seat(flight_number, seat_class, seat_number):
+    """Clear a cancelled ticket's seat so it can be assigned again"""
+    free_seats(flight_number, seat_class, [seat_number])
+
+
+def free_seats(flight_number, seat_class, seat_numbers):
+    """Clear several seats of one cabin with a single read and write of its map"""
+    seat_map = SeatMap.query.filter_by(
+        flight_number=flight_number, seat_class=seat_class
+    ).with_for_update().first()
+    if seat_map is None:
+        return
+    bitmap = SeatBitmap.from_hex(seat_map.seats, seat_map.occupied)
+    for seat_number in seat_numbers:
+        index = seat_index(seat_map.first_row, seat_map.seats, seat_number)
+        if index is not None:
+            bitmap.free(index)
+    seat_map.occupied = bitmap.to_hex()
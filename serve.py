@@ -0,0 +1,168 @@
+"""
+Production entry point: preforked worker processes with a thread pool each
+
+The master process builds the app once with create_app(), which also warms it
+up (airport index, route graph, compiled templates), then closes its database
+connections, opens the listening socket and forks the workers. Each worker
+inherits the warmed-up app, opens its own pool connections (db_config and
+app.after_fork make sure nothing is shared across the fork), starts its
+background task threads and serves requests on a fixed pool of threads.
+Workers that die are replaced; SIGTERM or Ctrl-C stops them gracefully,
+letting requests in flight finish.
+
+    DB_BACKEND=sqlite SQLITE_PATH=bench/data/small.db python serve.py --workers 4 --threads 8
+
+Settings come from the environment as for app.py. --threads should not exceed
+DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW, or requests wait for connections. The
+in-memory SQLite database cannot be shared between workers; use a file.
+
+gunicorn does the same job where it is installed:
+
+    gunicorn --preload --workers 4 --threads 8 'app:create_app()'
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from db_config import POOL_SIZE, env_bool, env_int, describe_database
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Werkzeug's handler with keep-alive, an idle timeout and optional access log"""
+    protocol_version = 'HTTP/1.1'
+    timeout = env_int('SERVE_KEEPALIVE_SECONDS', 5)  # Idle keep-alive connections are closed after this
+    access_log = env_bool('SERVE_ACCESS_LOG')
+
+    def log_request(self, *args, **kwargs):
+        if self.access_log:
+            super().log_request(*args, **kwargs)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server on an inherited socket, handling connections on a fixed thread pool"""
+    multithread = True
+
+    def __init__(self, app, sock, threads):
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=RequestHandler, fd=sock.fileno())
+        # All workers wake up for each connection; the ones that lose the accept() must not block in it
+        self.socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if hasattr(self, 'executor'):
+            self.executor.shutdown(wait=True)
+
+
+def run_worker(app, sock, threads):
+    """Serve in a forked worker until SIGTERM/SIGINT"""
+    from app import warm_pool
+    from tasks import task_queue
+
+    server = PooledWSGIServer(app, sock, threads)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so not from this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    warm_pool(app, min(threads, POOL_SIZE))
+    task_queue.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        task_queue.stop()
+
+
+def spawn(app, sock, threads):
+    pid = os.fork()
+    if pid:
+        return pid
+    status = 0
+    try:
+        run_worker(app, sock, threads)
+    except Exception as e:
+        print(f"Worker {os.getpid()} error: {e}", file=sys.stderr)
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def serve(host, port, workers, threads):
+    started = time.perf_counter()
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    with app.app_context():
+        # Workers open their own connections
+        for engine in db.engines.values():
+            engine.dispose()
+
+    sock = socket.create_server((host, port), backlog=2048)
+    children = {spawn(app, sock, threads) for _ in range(workers)}
+    timings = dict(app.config['STARTUP_TIMINGS'], total_ms=round((time.perf_counter() - started) * 1000, 1))
+    print(f"🔗 Database: {describe_database()}")
+    print(f"🚀 Serving on http://{host}:{sock.getsockname()[1]} with {workers} workers x {threads} threads")
+    print(f"   Startup: {', '.join(f'{name} {ms}' for name, ms in timings.items())}", flush=True)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited ({os.waitstatus_to_exitcode(status)}), starting another", file=sys.stderr)
+            time.sleep(0.5)  # Do not spin when workers fail at startup
+            children.add(spawn(app, sock, threads))
+    sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the app with preforked workers.')
+    parser.add_argument('--host', default=os.getenv('SERVE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=env_int('SERVE_PORT', 8000))
+    parser.add_argument('--workers', type=int, default=env_int('SERVE_WORKERS', os.cpu_count() or 1))
+    parser.add_argument('--threads', type=int, default=env_int('SERVE_THREADS', 8))
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""
+Background tasks for post-booking work
+
+reserve() and cancel_ticket() commit the ticket change, then queue what can
+happen later: the PAYMENT row (and FLIGHT_STATS paid revenue), the
+TICKETCHANGE audit row of a booking, and the confirmation email. The queue is
+a local SQLite file, so queued work survives a restart; worker threads in each
+web process (or `flask tasks work` processes) claim tasks from it.
+
+    - Every task has an idempotency key; queuing the same key again is a no-op.
+    - Handlers check what is already written, so a task that runs twice (a
+      retry, or a worker that died mid-task and lost its lease) does nothing
+      the second time. Email is at-least-once: the outbox mailer overwrites
+      its message file, SMTP may send a duplicate.
+    - A failing task is retried with exponential backoff, TASK_MAX_ATTEMPTS
+      times, then kept as failed (`flask tasks retry-failed` queues it again).
+
+    flask --app app tasks status        # tasks per status
+    flask --app app tasks work          # run a worker in the foreground
+    flask --app app tasks reconcile     # queue payments missing for ACTIVE tickets
+
+Configuration (app.config, defaults read from the environment):
+    TASK_QUEUE_PATH      SQLite file of the queue (default instance/tasks.db)
+    TASK_WORKERS         worker threads per web process (default 2, 0 = none)
+    TASK_AUTOSTART       start them on the first request of each process (default on), so
+                         `flask run` and gunicorn workers process the queue too; serve.py
+                         and `python app.py` start them before serving either way
+    TASK_MAX_ATTEMPTS    attempts before a task is marked failed (default 5)
+    TASK_RETRY_SECONDS   delay before the first retry, doubled each time (default 5)
+    TASK_LEASE_SECONDS   a running task is handed to another worker after this (default 300)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.exc import IntegrityError
+
+from db_config import env_bool, env_int
+from mailer import mailer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    claimed_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_tasks_ready ON tasks (status, run_after);
+"""
+
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+
+class TaskQueue:
+    """Durable local task queue with worker threads; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.path = None
+        self.workers = 2
+        self.max_attempts = 5
+        self.retry_seconds = 5
+        self.lease_seconds = 300
+        self.poll_seconds = 1.0
+        self.handlers = {}
+        self.processed = self.retried = self.failed = 0
+        self._pid = None          # process whose worker threads are running
+        self._threads = []
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TASK_QUEUE_PATH', os.getenv(
+            'TASK_QUEUE_PATH', os.path.join(app.instance_path, 'tasks.db')
+        ))
+        app.config.setdefault('TASK_WORKERS', env_int('TASK_WORKERS', 2))
+        app.config.setdefault('TASK_MAX_ATTEMPTS', env_int('TASK_MAX_ATTEMPTS', 5))
+        app.config.setdefault('TASK_RETRY_SECONDS', env_int('TASK_RETRY_SECONDS', 5))
+        app.config.setdefault('TASK_LEASE_SECONDS', env_int('TASK_LEASE_SECONDS', 300))
+        app.config.setdefault('TASK_AUTOSTART', env_bool('TASK_AUTOSTART', True))
+        self.app = app
+        self.path = app.config['TASK_QUEUE_PATH']
+        self.workers = app.config['TASK_WORKERS']
+        self.max_attempts = app.config['TASK_MAX_ATTEMPTS']
+        self.retry_seconds = app.config['TASK_RETRY_SECONDS']
+        self.lease_seconds = app.config['TASK_LEASE_SECONDS']
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+        if app.config['TASK_AUTOSTART']:
+            # On the first request, not now: a preforking server would start them in its master
+            app.before_request(self.start)
+
+    def _connect(self):
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE so claims never race
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA synchronous=FULL')
+        return conn
+
+    def task(self, name):
+        """Decorator registering a handler, called as handler(key=..., **payload)"""
+        def register(func):
+            self.handlers[name] = func
+            return func
+        return register
+
+    # -- Queuing -----------------------------------------------------------
+
+    def enqueue(self, tasks):
+        """
+        Durably queue (name, payload, idempotency_key) tuples in one transaction;
+        keys that were queued before are skipped. Returns the number queued.
+        """
+        now = time.time()
+        rows = [(name, json.dumps(payload), key, now, now) for name, payload, key in tasks]
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO tasks (name, payload, idempotency_key, run_after, created_at) '
+                'VALUES (?, ?, ?, ?, ?)', rows
+            )
+            queued = conn.total_changes - before
+            conn.execute('COMMIT')
+        if queued and self.workers:
+            self.start()
+            self._wake.set()
+        return queued
+
+    # -- Running -----------------------------------------------------------
+
+    def claim(self):
+        """Mark the next ready task (or one whose lease ran out) as running and return it"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT id, name, payload, idempotency_key, attempts FROM tasks "
+                "WHERE (status = 'pending' AND run_after <= ?) OR (status = 'running' AND claimed_at < ?) "
+                "ORDER BY id LIMIT 1", (now, now - self.lease_seconds)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE tasks SET status = 'running', claimed_at = ?, attempts = attempts + 1 "
+                             "WHERE id = ?", (now, row[0]))
+            conn.execute('COMMIT')
+        return row
+
+    def run_one(self):
+        """Run the next ready task; returns False when there is none"""
+        row = self.claim()
+        if row is None:
+            return False
+        task_id, name, payload, key, attempts = row
+        attempts += 1
+        try:
+            handler = self.handlers[name]
+            with self.app.app_context():
+                handler(key=key, **json.loads(payload))
+        except Exception as e:
+            self._task_failed(task_id, name, attempts, e)
+        else:
+            with closing(self._connect()) as conn:
+                conn.execute("UPDATE tasks SET status = 'done', finished_at = ?, last_error = NULL WHERE id = ?",
+                             (time.time(), task_id))
+            self.processed += 1
+        return True
+
+    def _task_failed(self, task_id, name, attempts, error):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            if attempts >= self.max_attempts:
+                conn.execute("UPDATE tasks SET status = 'failed', finished_at = ?, last_error = ? WHERE id = ?",
+                             (now, str(error), task_id))
+                self.failed += 1
+                logger.error('Task %s %s failed after %d attempts: %s', task_id, name, attempts, error)
+            else:
+                delay = self.retry_seconds * 2 ** (attempts - 1)
+                conn.execute("UPDATE tasks SET status = 'pending', run_after = ?, last_error = ? WHERE id = ?",
+                             (now + delay, str(error), task_id))
+                self.retried += 1
+                logger.warning('Task %s %s failed (attempt %d), retrying in %ds: %s',
+                               task_id, name, attempts, delay, error)
+
+    def run_pending(self):
+        """Run tasks until none is ready; returns how many ran"""
+        count = 0
+        while self.run_one():
+            count += 1
+        return count
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_one()
+            except Exception as e:
+                # Queue file busy or unreadable: back off and try again
+                logger.warning('Task worker error: %s', e)
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def start(self):
+        """Start this process's worker threads (threads do not survive a fork, so once per process)"""
+        if not self.workers or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f'task-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the worker threads after their current task"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    # -- Maintenance -------------------------------------------------------
+
+    def counts(self):
+        with closing(self._connect()) as conn:
+            found = dict(conn.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status'))
+        return {status: found.get(status, 0) for status in STATUSES}
+
+    def retry_failed(self):
+        with closing(self._connect()) as conn:
+            return conn.execute("UPDATE tasks SET status = 'pending', attempts = 0, run_after = ? "
+                                "WHERE status = 'failed'", (time.time(),)).rowcount
+
+    def purge(self, older_than):
+        """Delete done tasks finished more than older_than seconds ago"""
+        with closing(self._connect()) as conn:
+            return conn.execute("DELETE FROM tasks WHERE status = 'done' AND finished_at < ?",
+                                (time.time() - older_than,)).rowcount
+
+    def stats(self):
+        stats = self.counts()
+        stats.update(processed=self.processed, retried=self.retried, failed_here=self.failed,
+                     workers=len(self._threads))
+        return stats
+
+
+task_queue = TaskQueue()
+
+
+# -- Post-booking tasks ------------------------------------------------------
+
+@task_queue.task('record_payment')
+def record_payment_task(key, ticket_numbers, method='CARD'):
+    """
+    PAYMENT row (and FLIGHT_STATS paid revenue) for each ticket not paid yet;
+    tickets cancelled before the task runs are not paid
+    """
+    from models import db, Payment, Ticket
+    from analytics import record_payment
+
+    paid = {number for (number,) in db.session.query(Payment.ticket_number).filter(
+        Payment.ticket_number.in_(ticket_numbers))}
+    now = datetime.now()
+    by_flight = {}
+    for ticket in Ticket.query.filter(Ticket.ticket_number.in_(ticket_numbers), Ticket.status == 'ACTIVE'):
+        if ticket.ticket_number in paid:
+            continue
+        db.session.add(Payment(ticket_number=ticket.ticket_number, payment_date=now,
+                               amount=ticket.price, method=method))
+        by_flight[ticket.flight_number] = by_flight.get(ticket.flight_number, 0) + ticket.price
+    for flight_number, amount in by_flight.items():
+        record_payment(flight_number, amount)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker paid them first (PAYMENT.TICKET_NUMBER is unique); the retry finds them paid
+        db.session.rollback()
+        raise
+
+
+@task_queue.task('ticket_change')
+def ticket_change_task(key, ticket_numbers, new_status, change_date):
+    """TICKETCHANGE audit row per ticket, unless it was written already"""
+    from models import db, TicketChange
+
+    changed_at = datetime.fromisoformat(change_date)
+    written = {number for (number,) in db.session.query(TicketChange.ticket_number).filter(
+        TicketChange.ticket_number.in_(ticket_numbers),
+        TicketChange.new_status == new_status,
+        TicketChange.change_date == changed_at,
+    )}
+    db.session.add_all(
+        TicketChange(ticket_number=number, change_date=changed_at, new_status=new_status)
+        for number in ticket_numbers if number not in written
+    )
+    db.session.commit()
+
+
+@task_queue.task('notify')
+def notify_task(key, to, subject, body):
+    """Send an email; the idempotency key doubles as its Message-ID"""
+    mailer.send(to, subject, body, message_id=key)
+
+
+def queue_booking(ticket_numbers, flight, email, seat_class, seat_numbers, total_cost, booked_at):
+    """Queue the payment, audit rows and confirmation of a committed booking"""
+    first = ticket_numbers[0]
+    body = (
+        f'Your booking on flight {flight.flight_number} is confirmed.\n\n'
+        f'{flight.departure_airport} -> {flight.arrival_airport}, departing {flight.departure_time:%B %d, %Y at %I:%M %p}\n'
+        f'{seat_class.title()} seats: {", ".join(seat_numbers)}\n'
+        f'Tickets: {", ".join(str(n) for n in ticket_numbers)}\n'
+        f'Total: ${total_cost:.2f}\n'
+    )
+    return queue_safely([
+        ('record_payment', {'ticket_numbers': ticket_numbers}, f'payment:{first}'),
+        ('ticket_change', {'ticket_numbers': ticket_numbers, 'new_status': 'ACTIVE',
+                           'change_date': booked_at.isoformat()}, f'change:{first}:ACTIVE'),
+        ('notify', {'to': email, 'subject': f'Booking confirmation - flight {flight.flight_number}',
+                    'body': body}, f'mail:booking:{first}'),
+    ])
+
+
+def queue_cancellation(ticket, email):
+    """Queue the notice of a committed cancellation (its TICKETCHANGE row is written inline)"""
+    body = (
+        f'Ticket {ticket.ticket_number} on flight {ticket.flight_number} (seat {ticket.seat_number}) '
+        f'has been cancelled.\n'
+    )
+    return queue_safely([
+        ('notify', {'to': email, 'subject': f'Ticket {ticket.ticket_number} cancelled', 'body': body},
+         f'mail:cancel:{ticket.ticket_number}'),
+    ])
+
+
+def queue_safely(tasks):
+    # The ticket change is already committed, so a queue error must not fail the request;
+    # `flask tasks reconcile` queues missing payments again
+    try:
+        return task_queue.enqueue(tasks)
+    except Exception as e:
+        print(f"Task queue error: {e}")
+        return 0
+
+
+tasks_cli = AppGroup('tasks', help='Run and inspect the background task queue.')
+
+
+@tasks_cli.command('work')
+@click.option('--once', is_flag=True, help='Run the ready tasks, then exit.')
+def work_command(once):
+    """Run queued tasks in the foreground."""
+    if once:
+        click.echo(f'Ran {task_queue.run_pending()} task(s).')
+        return
+    click.echo(f'Working on {task_queue.path} (Ctrl+C to stop)')
+    try:
+        while True:
+            if not task_queue.run_one():
+                time.sleep(task_queue.poll_seconds)
+    except KeyboardInterrupt:
+        pass
+
+
+@tasks_cli.command('status')
+def status_command():
+    """Show tasks per status."""
+    for status, count in task_queue.counts().items():
+        click.echo(f'{status:<8} {count}')
+
+
+@tasks_cli.command('retry-failed')
+def retry_failed_command():
+    """Queue failed tasks again."""
+    click.echo(f'Requeued {task_queue.retry_failed()} task(s).')
+
+
+@tasks_cli.command('purge')
+@click.option('--days', default=7, show_default=True, help='Keep done tasks this recent.')
+def purge_command(days):
+    """Delete old finished tasks."""
+    click.echo(f'Deleted {task_queue.purge(days * 86400)} task(s).')
+
+
+@tasks_cli.command('reconcile')
+@click.option('--hours', default=24, show_default=True, help='Look at tickets booked this recently.')
+def reconcile_command(hours):
+    """Queue payments for recent ACTIVE tickets that have none."""
+    from models import db, Payment, Ticket
+
+    numbers = [number for (number,) in db.session.query(Ticket.ticket_number).outerjoin(
+        Payment, Payment.ticket_number == Ticket.ticket_number
+    ).filter(
+        Ticket.status == 'ACTIVE',
+        Ticket.booking_date >= datetime.now() - timedelta(hours=hours),
+        Payment.payment_id.is_(None),
+    ).order_by(Ticket.ticket_number)]
+    # Own keys: a booking's payment task is keyed payment:<first ticket>, and if it failed the
+    # same key here would be ignored and leave that ticket unpaid
+    queued = task_queue.enqueue(
+        ('record_payment', {'ticket_numbers': [number]}, f'reconcile-payment:{number}') for number in numbers
+    )
+    click.echo(f'{len(numbers)} unpaid ticket(s), {queued} payment task(s) queued.')
@@ -0,0 +1,107 @@
+"""
+Test fixtures: the app on a file-backed SQLite database filled with a small
+synthetic dataset (bulk_loader.generate), and a statement counter.
+
+db_config reads the environment when it is imported, so the database settings
+are made here, before any app module is imported.
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATA_DIR = tempfile.mkdtemp(prefix='flightapp-tests-')
+os.environ.update({
+    'DB_BACKEND': 'sqlite',
+    'SQLITE_PATH': os.path.join(DATA_DIR, 'flights.db'),
+    'TASK_QUEUE_PATH': os.path.join(DATA_DIR, 'tasks.db'),
+    'MAILER': 'none',
+    'WARM_UP': '0',
+    'PASSWORD_HASH_COST': '1000',
+})
+
+from sqlalchemy import event  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    from bulk_loader import generate
+    from models import db
+
+    # Caches would hide the queries the tests count; queued tasks run when a test calls
+    # task_queue.run_pending(), not on worker threads behind its back
+    app = create_app({
+        'TESTING': True,
+        'SEARCH_CACHE_BACKEND': 'none',
+        'USER_CACHE_BACKEND': 'none',
+        'FRAGMENT_CACHE': 'none',
+        'HTTP_CONDITIONAL': False,
+        'TASK_WORKERS': 0,
+    })
+    with app.app_context():
+        with db.engine.begin() as conn:
+            generate(conn, airports=8, airlines=2, aircraft_per_airline=2, staff_per_airline=4,
+                     passengers=40, flights=60, tickets=600, seed=7)
+    return app
+
+
+@pytest.fixture
+def login(app):
+    """login(passenger_id) -> a test client logged in as that passenger"""
+    from bulk_loader import SYNTHETIC_PASSWORD, passenger_email
+
+    def login(passenger_id):
+        client = app.test_client()
+        response = client.post('/auth/login', data={
+            'email': passenger_email(passenger_id), 'password': SYNTHETIC_PASSWORD,
+        })
+        assert response.status_code == 302
+        return client
+    return login
+
+
+@pytest.fixture
+def future_flight(app):
+    """future_flight(number, days) -> capacity of a new copy of the first generated flight,
+    departing in `days` days with no tickets, so tests do not share seats"""
+    from datetime import datetime, timedelta
+    from models import db, Flight
+
+    def future_flight(number, days):
+        with app.app_context():
+            template = db.session.execute(db.select(Flight).order_by(Flight.flight_number)).scalars().first()
+            departure = datetime.now().replace(microsecond=0) + timedelta(days=days)
+            db.session.add(Flight(
+                flight_number=number, airline_id=template.airline_id, aircraft_id=template.aircraft_id,
+                departure_airport=template.departure_airport, arrival_airport=template.arrival_airport,
+                departure_time=departure,
+                arrival_time=departure + (template.arrival_time - template.departure_time),
+                duration_minutes=template.duration_minutes,
+            ))
+            db.session.commit()
+            return db.session.get(Flight, number).aircraft_rel.capacity
+    return future_flight
+
+
+@contextmanager
+def count_statements(app):
+    """Count the statements sent to the database inside the block: `with ... as executed: executed[0]`"""
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+    executed = [0]
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield executed
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
@@ -0,0 +1,53 @@
+"""
+TTLCache (cache.py): a value loaded while its tags or key are invalidated is
+not stored, so a booking's invalidation cannot be undone by a slow reader.
+"""
+from cache import MemoryBackend, TTLCache
+
+
+def cache():
+    return TTLCache(MemoryBackend(), ttl=60)
+
+
+def test_miss_stores_loaded_value():
+    c = cache()
+    assert c.get_or_load('page', lambda: 'rows', tags=lambda value: {'flight:A'}) == 'rows'
+    assert c.get('page') == (True, 'rows')
+
+
+def test_tag_invalidated_during_load_is_not_stored():
+    c = cache()
+
+    def loader():
+        # A booking commits and invalidates the flight while the page is being read
+        c.invalidate_tags(['flight:A'])
+        return 'rows before the booking'
+
+    assert c.get_or_load('page', loader, tags=lambda value: {'flight:A'}) == 'rows before the booking'
+    assert c.get('page') == (False, None)
+    # The next miss stores again
+    c.get_or_load('page', lambda: 'rows after the booking', tags=lambda value: {'flight:A'})
+    assert c.get('page') == (True, 'rows after the booking')
+
+
+def test_other_tag_invalidated_during_load_is_stored():
+    c = cache()
+
+    def loader():
+        c.invalidate_tags(['flight:B'])
+        return 'rows'
+
+    c.get_or_load('page', loader, tags=lambda value: {'flight:A'})
+    assert c.get('page') == (True, 'rows')
+
+
+def test_key_deleted_or_cache_cleared_during_load_is_not_stored():
+    c = cache()
+    since = c.generation()
+    c.delete('user:1')
+    assert not c.set('user:1', 'old snapshot', since=since)
+
+    since = c.generation()
+    c.clear()
+    assert not c.set('user:2', 'old snapshot', since=since)
+    assert c.set('user:2', 'new snapshot', since=c.generation())
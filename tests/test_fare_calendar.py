@@ -0,0 +1,74 @@
+"""
+Fare calendar (fare_calendar.py): flights fall in the day of their departure
+right up to midnight, nothing outside the range or without seats is counted,
+and each day's cheapest fare and earliest departure are those of a per-day
+search priced in Python.
+"""
+from datetime import datetime, time, timedelta
+
+from models import db, Flight, Passenger, Ticket
+from fare_calendar import fare_calendar
+from pricing import pricing
+
+SPREAD = 2
+
+
+def place(number, departure, booked=0):
+    """Move the flight to `departure` and give it `booked` ACTIVE tickets"""
+    flight = db.session.get(Flight, number)
+    length = flight.arrival_time - flight.departure_time
+    flight.departure_time, flight.arrival_time = departure, departure + length
+    first = db.session.execute(db.select(db.func.max(Ticket.ticket_number))).scalar() + 1
+    passengers = db.session.execute(db.select(db.func.max(Passenger.passenger_id))).scalar()
+    # Spread over every passenger, so no one's reservations outgrow a page in other tests
+    db.session.add_all(
+        Ticket(ticket_number=first + i, passenger_id=1 + i % passengers, flight_number=number, seat_number=f'{i + 1:03d}',
+               seat_class='ECONOMY', price=100, booking_date=datetime(2025, 1, 1), status='ACTIVE')
+        for i in range(booked)
+    )
+    db.session.commit()
+
+
+def test_days_are_bucketed_at_midnight(app, login, future_flight):
+    day = (datetime.now() + timedelta(days=400)).date()
+    first = datetime.combine(day - timedelta(days=SPREAD), time())
+    midnight = datetime.combine(day, time())
+    # Copies of one flight: same route and aircraft, placed below
+    capacity = [future_flight(f'TSTCAL{i}', days=400) for i in range(8)][0]
+    with app.app_context():
+        place('TSTCAL0', first - timedelta(seconds=1))               # Before the range
+        place('TSTCAL1', first)                                      # Day 0
+        place('TSTCAL2', midnight - timedelta(seconds=1))            # Day 1, its last second
+        place('TSTCAL3', midnight, booked=capacity // 2)             # Day 2, earliest but dearer
+        place('TSTCAL4', midnight + timedelta(hours=15))             # Day 2, cheapest
+        place('TSTCAL5', midnight + timedelta(days=1, hours=10), booked=capacity)  # Day 3, full
+        place('TSTCAL6', midnight + timedelta(days=3) - timedelta(seconds=1))      # Day 4
+        place('TSTCAL7', midnight + timedelta(days=3))               # After the range
+
+        origin, destination = db.session.execute(db.select(
+            Flight.departure_airport, Flight.arrival_airport
+        ).where(Flight.flight_number == 'TSTCAL1')).one()
+        calendar = fare_calendar([origin], [destination], day, SPREAD)
+
+        assert [entry['date'] for entry in calendar] == [day + timedelta(days=i) for i in range(-SPREAD, SPREAD + 1)]
+        assert [entry['flights'] for entry in calendar] == [1, 1, 2, 0, 1]
+        assert calendar[3]['cheapest_fare'] is None and calendar[3]['earliest_departure'] is None
+
+        # The same days searched one at a time and priced in Python
+        for entry in calendar:
+            start = datetime.combine(entry['date'], time())
+            flights = Flight.with_available_seats(Flight.query.filter(
+                Flight.departure_airport == origin, Flight.arrival_airport == destination,
+                Flight.departure_time >= start, Flight.departure_time < start + timedelta(days=1),
+            ))
+            assert entry['flights'] == len(flights)
+            if flights:
+                assert entry['earliest_departure'] == min(flight.departure_time for flight in flights)
+                assert entry['cheapest_fare'] == min(flight.price for flight in pricing.price_flights(flights))
+        assert calendar[2]['earliest_departure'] == midnight
+        assert calendar[2]['cheapest_fare'] < pricing.quote(db.session.get(Flight, 'TSTCAL3'), fresh=True)['ECONOMY']
+
+    response = login(1).get('/api/fare-calendar', query_string={
+        'origin': origin, 'destination': destination, 'date': day.isoformat(), 'days': SPREAD,
+    })
+    assert [entry['flights'] for entry in response.get_json()['days']] == [1, 1, 2, 0, 1]
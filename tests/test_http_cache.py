@@ -0,0 +1,62 @@
+"""
+Conditional GET and gzip (http_cache.py): an unchanged page is a 304 without a
+body, a booking change gives it a new ETag, and HTML is gzipped for clients
+that accept it while the streamed API is not.
+"""
+import gzip
+
+import pytest
+
+from models import db, Ticket
+
+
+@pytest.fixture
+def conditional(app, monkeypatch):
+    """ETag/304 handling on for the test (the app fixture runs without it)"""
+    monkeypatch.setitem(app.config, 'HTTP_CONDITIONAL', True)
+
+
+def logged_in(login, passenger_id):
+    client = login(passenger_id)
+    # Pages with a pending flash message (here the login's) are always rendered
+    client.get('/user/my-reservations')
+    return client
+
+
+def test_unchanged_reservations_are_not_modified(app, login, conditional):
+    client = logged_in(login, 8)
+    page = client.get('/user/my-reservations')
+    assert page.status_code == 200
+    etag = page.headers['ETag']
+    assert etag.startswith('W/')
+    assert {'private', 'no-cache'} <= set(page.headers['Cache-Control'].replace(' ', '').split(','))
+
+    again = client.get('/user/my-reservations', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+    with app.app_context():
+        ticket_number = db.session.execute(db.select(Ticket.ticket_number).where(
+            Ticket.passenger_id == 8, Ticket.status == 'ACTIVE'
+        )).scalars().first()
+    assert client.post(f'/user/cancel-ticket/{ticket_number}').status_code == 302
+    # The page showing the cancellation's message, then the next load
+    assert 'ETag' not in client.get('/user/my-reservations', headers={'If-None-Match': etag}).headers
+    changed = client.get('/user/my-reservations', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_pages_are_gzipped_for_clients_that_accept_it(login):
+    client = logged_in(login, 9)
+    plain = client.get('/user/my-reservations')
+    packed = client.get('/user/my-reservations', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert gzip.decompress(packed.data) == plain.data
+
+    streamed = client.get('/api/flights/search', headers={'Accept-Encoding': 'gzip'})
+    assert streamed.status_code == 200
+    assert 'Content-Encoding' not in streamed.headers
@@ -0,0 +1,173 @@
+"""
+Seat inventory under concurrent bookings (inventory.py) on the file-backed
+SQLite database of the fixtures: threads take and give back seats of one cabin
+at once, and the inventory must never oversell or go below zero. Legacy
+tickets must not push a cabin below zero or fill another cabin's seat map, and
+a legacy ticket moved to another seat must give that seat back when cancelled.
+"""
+import random
+import threading
+from datetime import datetime
+
+from models import db, Flight, SeatInventory, SeatMap, Ticket
+from inventory import ensure_inventory, release_seats, take_seats
+from seatmap import SeatBitmap, build_seat_maps, cabin_capacities, cabin_layout, seat_index, seat_label
+
+
+def new_flight(app, number):
+    """A copy of the first generated flight with no tickets, so tests do not share seats"""
+    with app.app_context():
+        template = db.session.execute(db.select(Flight).order_by(Flight.flight_number)).scalars().first()
+        db.session.add(Flight(
+            flight_number=number, airline_id=template.airline_id, aircraft_id=template.aircraft_id,
+            departure_airport=template.departure_airport, arrival_airport=template.arrival_airport,
+            departure_time=template.departure_time, arrival_time=template.arrival_time,
+            duration_minutes=template.duration_minutes,
+        ))
+        db.session.commit()
+        flight = db.session.get(Flight, number)
+        return flight.aircraft_rel.capacity
+
+
+def inventory(app, number):
+    with app.app_context():
+        rows = db.session.execute(
+            db.select(SeatInventory).where(SeatInventory.flight_number == number)
+        ).scalars().all()
+        return {row.seat_class: (row.capacity, row.remaining) for row in rows}
+
+
+def test_concurrent_bookings_never_oversell(app):
+    number = 'TSTLOCK1'
+    new_flight(app, number)
+    with app.app_context():
+        ensure_inventory(db.session.get(Flight, number))
+    seats, _ = inventory(app, number)['BUSINESS']
+
+    booked, refused, errors = [], [], []
+    start = threading.Barrier(8)
+
+    def book(index):
+        rng = random.Random(index)
+        with app.app_context():
+            start.wait()
+            for _ in range(40):
+                count = rng.randint(1, 3)
+                try:
+                    if take_seats(number, 'BUSINESS', count):
+                        db.session.commit()
+                        booked.append(count)
+                        if rng.random() < 0.2:
+                            # A cancellation gives one seat back
+                            release_seats(number, 'BUSINESS', 1)
+                            db.session.commit()
+                            booked.append(-1)
+                    else:
+                        db.session.rollback()
+                        refused.append(count)
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(e)
+
+    threads = [threading.Thread(target=book, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    capacity, remaining = inventory(app, number)['BUSINESS']
+    assert errors == []
+    assert refused, 'the cabin never filled up; the test did not contend for the last seats'
+    assert capacity == seats
+    assert 0 <= remaining <= capacity
+    assert sum(booked) == capacity - remaining
+
+
+def test_legacy_cabin_over_its_share_is_full_not_negative(app):
+    number = 'TSTLEGACY'
+    capacity = new_flight(app, number)
+    first = cabin_capacities(capacity)['FIRST']
+    with app.app_context():
+        # Loaded before the cabin split existed: more FIRST tickets than the FIRST cabin has seats
+        next_number = db.session.execute(db.select(db.func.max(Ticket.ticket_number))).scalar() + 1
+        db.session.add_all(
+            Ticket(ticket_number=next_number + i, passenger_id=1, flight_number=number,
+                   seat_number=f'{30 + i // 6:02d}{"ABCDEF"[i % 6]}', seat_class='FIRST', price=100,
+                   booking_date=datetime(2025, 1, 1), status='ACTIVE')
+            for i in range(first + 3)
+        )
+        db.session.commit()
+        ensure_inventory(db.session.get(Flight, number))
+        assert not take_seats(number, 'FIRST', 1)
+        db.session.rollback()
+
+    assert inventory(app, number)['FIRST'] == (first, 0)
+
+
+def test_legacy_seat_in_another_cabin_does_not_fill_it():
+    layout = cabin_layout(180)
+    first_row, first_seats = layout['FIRST']
+    economy_row, _ = layout['ECONOMY']
+    # Old-style numbering: economy tickets in the front rows, plus one FIRST ticket in its own cabin
+    taken = [(i + 1, seat_label(first_row, i), 'ECONOMY') for i in range(first_seats)]
+    taken.append((first_seats + 1, seat_label(first_row, 0), 'FIRST'))
+    rows, moved = build_seat_maps('TSTMAP', 180, taken)
+    maps = {row.seat_class: row for row in rows}
+
+    first = SeatBitmap.from_hex(maps['FIRST'].seats, maps['FIRST'].occupied)
+    economy = SeatBitmap.from_hex(maps['ECONOMY'].seats, maps['ECONOMY'].occupied)
+    assert first.bits == 1
+    assert economy.bits == (1 << first_seats) - 1
+    assert seat_label(economy_row, economy.next_free()) == seat_label(economy_row, first_seats)
+    assert moved == {i + 1: seat_label(economy_row, i) for i in range(first_seats)}
+
+
+def add_tickets(number, seats):
+    """ACTIVE tickets of passenger 1 on the flight, (seat_number, seat_class) each; returns their numbers"""
+    first = db.session.execute(db.select(db.func.max(Ticket.ticket_number))).scalar() + 1
+    db.session.add_all(
+        Ticket(ticket_number=first + i, passenger_id=1, flight_number=number, seat_number=seat_number,
+               seat_class=seat_class, price=100, booking_date=datetime(2025, 1, 1), status='ACTIVE')
+        for i, (seat_number, seat_class) in enumerate(seats)
+    )
+    db.session.commit()
+    return list(range(first, first + len(seats)))
+
+
+def active_seats(number):
+    return db.session.execute(
+        db.select(Ticket.seat_number).where(Ticket.flight_number == number, Ticket.status == 'ACTIVE')
+    ).scalars().all()
+
+
+def test_moved_legacy_seats_are_freed_on_cancel(app, login):
+    number = 'TSTMOVED'
+    capacity = new_flight(app, number)
+    layout = cabin_layout(capacity)
+    economy_row, economy_seats = layout['ECONOMY']
+    shared = seat_label(economy_row, 0)
+    with app.app_context():
+        # Two tickets on one seat, and one economy ticket numbered in the first class rows
+        tickets = add_tickets(number, [(shared, 'ECONOMY'), (shared, 'ECONOMY'),
+                                       (seat_label(layout['FIRST'][0], 0), 'ECONOMY')])
+        ensure_inventory(db.session.get(Flight, number))
+        seats = active_seats(number)
+        assert len(set(seats)) == 3
+        assert all(seat_index(economy_row, economy_seats, seat) is not None for seat in seats)
+
+    client = login(1)
+    assert client.post(f'/user/cancel-ticket/{tickets[0]}').status_code == 302
+    assert client.post(f'/user/reserve/{number}', data={'num_passengers': 1, 'seat_class': 'ECONOMY'}).status_code == 302
+    with app.app_context():
+        seats = active_seats(number)
+        assert len(seats) == 3 and len(set(seats)) == 3
+        booked = db.session.execute(
+            db.select(Ticket.ticket_number).where(Ticket.flight_number == number, Ticket.ticket_number.not_in(tickets))
+        ).scalar_one()
+
+    for ticket_number in tickets[1:] + [booked]:
+        assert client.post(f'/user/cancel-ticket/{ticket_number}').status_code == 302
+    with app.app_context():
+        assert active_seats(number) == []
+        seat_map = db.session.get(SeatMap, (number, 'ECONOMY'))
+        assert SeatBitmap.from_hex(seat_map.seats, seat_map.occupied).bits == 0
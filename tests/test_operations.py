@@ -0,0 +1,90 @@
+"""
+Flight disruptions (operations.py) on the fixtures' database: after bookings,
+payments and a passenger's own cancellation, cancelling a flight and rebooking
+it onto a replacement must leave SEAT_INVENTORY, SEAT_MAP and FLIGHT_STATS
+exactly as rebuilding them from TICKET would, with no seat given twice.
+"""
+from collections import Counter
+
+from models import db, FlightStats, SeatInventory, SeatMap, Ticket
+from analytics import rebuild_flight_stats
+from inventory import rebuild_inventory
+from operations import cancel_flights
+from seatmap import cabin_capacities
+from tasks import task_queue
+
+
+def book(client, number, seats, seat_class):
+    response = client.post(f'/user/reserve/{number}', data={'num_passengers': seats, 'seat_class': seat_class})
+    assert response.status_code == 302
+
+
+def summary(numbers):
+    """Inventory, seat maps and sales rows of the flights, as plain values"""
+    inventory = db.session.execute(db.select(
+        SeatInventory.flight_number, SeatInventory.seat_class, SeatInventory.capacity, SeatInventory.remaining
+    ).where(SeatInventory.flight_number.in_(numbers))).all()
+    seat_maps = db.session.execute(db.select(
+        SeatMap.flight_number, SeatMap.seat_class, SeatMap.first_row, SeatMap.seats, SeatMap.occupied
+    ).where(SeatMap.flight_number.in_(numbers))).all()
+    stats = db.session.execute(db.select(
+        FlightStats.flight_number, FlightStats.seats_sold, FlightStats.seats_canceled,
+        FlightStats.revenue, FlightStats.paid_revenue
+    ).where(FlightStats.flight_number.in_(numbers))).all()
+    return sorted(inventory), sorted(seat_maps), sorted(stats)
+
+
+def assert_in_step(numbers):
+    """The flights' summary rows match a rebuild from TICKET, and no seat is held twice"""
+    seats = db.session.execute(db.select(Ticket.flight_number, Ticket.seat_number).where(
+        Ticket.flight_number.in_(numbers), Ticket.status == 'ACTIVE'
+    )).all()
+    assert [seat for seat, count in Counter(seats).items() if count > 1] == []
+
+    kept = summary(numbers)
+    rebuild_inventory(numbers)
+    rebuild_flight_stats()
+    assert kept == summary(numbers)
+
+
+def test_cancel_with_rebooking_keeps_summaries_in_step(app, login, future_flight):
+    capacity = future_flight('TSTOPSA', days=20)
+    future_flight('TSTOPSB', days=21)
+    first = cabin_capacities(capacity)['FIRST']
+    alice, bob = login(1), login(2)
+    # The replacement has room for one of the two FIRST passengers
+    book(bob, 'TSTOPSB', first - 1, 'FIRST')
+    book(bob, 'TSTOPSB', 2, 'ECONOMY')
+    book(alice, 'TSTOPSA', 2, 'FIRST')
+    book(alice, 'TSTOPSA', 3, 'ECONOMY')
+    book(bob, 'TSTOPSA', 1, 'BUSINESS')
+    task_queue.run_pending()
+    with app.app_context():
+        mine = db.session.execute(db.select(Ticket.ticket_number).where(
+            Ticket.flight_number == 'TSTOPSA', Ticket.passenger_id == 1, Ticket.seat_class == 'ECONOMY'
+        ).order_by(Ticket.ticket_number)).scalars().first()
+    assert alice.post(f'/user/cancel-ticket/{mine}').status_code == 302
+
+    with app.app_context():
+        result = cancel_flights(['TSTOPSA'], rebook_to='TSTOPSB', batch_size=2)
+        assert (result['tickets_rebooked'], result['tickets_canceled']) == (4, 1)
+        assert db.session.execute(db.select(db.func.count(Ticket.ticket_number)).where(
+            Ticket.flight_number == 'TSTOPSA', Ticket.status == 'ACTIVE'
+        )).scalar() == 0
+        assert_in_step(['TSTOPSA', 'TSTOPSB'])
+
+
+def test_cancel_frees_every_seat(app, login, future_flight):
+    future_flight('TSTOPSC', days=22)
+    client = login(3)
+    book(client, 'TSTOPSC', 2, 'BUSINESS')
+    book(client, 'TSTOPSC', 1, 'ECONOMY')
+    task_queue.run_pending()
+
+    with app.app_context():
+        assert cancel_flights(['TSTOPSC'], batch_size=2)['tickets_canceled'] == 3
+        stats = db.session.get(FlightStats, 'TSTOPSC')
+        assert (stats.seats_sold, stats.seats_canceled, stats.revenue) == (0, 3, 0)
+        assert all(inv.remaining == inv.capacity for inv in db.session.execute(
+            db.select(SeatInventory).where(SeatInventory.flight_number == 'TSTOPSC')).scalars())
+        assert_in_step(['TSTOPSC'])
@@ -0,0 +1,60 @@
+"""
+Keyset pagination (pagination.py): walking the pages returns every row once
+and in order, also when many rows share the leading sort column and when the
+row count is a multiple of the page size; bad cursors are a 400.
+"""
+from datetime import datetime
+
+from models import db, Ticket
+from pagination import decode_cursor, encode_cursor, keyset_page
+
+
+def walk(query, columns, key, page_size, descending=False):
+    """Every page of the query; returns (rows, number of pages)"""
+    rows, pages, cursor = [], 0, None
+    while True:
+        page = keyset_page(query, columns, key, cursor=cursor, page_size=page_size, descending=descending)
+        rows += page.items
+        pages += 1
+        assert len(page) <= page_size
+        if not page.has_next:
+            return rows, pages
+        cursor = page.next_cursor
+
+
+def test_pages_cover_every_row_once_across_ties(app):
+    with app.app_context():
+        # About ten tickets per flight, so most page boundaries fall inside a flight
+        columns = [Ticket.flight_number, Ticket.ticket_number]
+        key = lambda ticket: (ticket.flight_number, ticket.ticket_number)  # noqa: E731
+        expected = [key(t) for t in Ticket.query.order_by(*columns).all()]
+        for descending in (False, True):
+            rows, _ = walk(Ticket.query, columns, key, page_size=7, descending=descending)
+            assert [key(t) for t in rows] == (expected[::-1] if descending else expected)
+
+
+def test_exact_multiple_of_page_size_has_no_empty_last_page(app):
+    with app.app_context():
+        query = Ticket.query.filter(Ticket.passenger_id == 7)
+        columns = [Ticket.booking_date, Ticket.ticket_number]
+        key = lambda ticket: (ticket.booking_date, ticket.ticket_number)  # noqa: E731
+        count = query.count()
+        assert count > 2
+
+        rows, pages = walk(query, columns, key, page_size=count, descending=True)
+        assert (len(rows), pages) == (count, 1)
+        rows, pages = walk(query, columns, key, page_size=count - 1, descending=True)
+        assert (len(rows), pages) == (count, 2)
+
+
+def test_cursor_round_trips_datetimes():
+    values = (datetime(2025, 12, 1, 8, 30, 15), 'AA100', 42)
+    cursor = encode_cursor(values)
+    assert '=' not in cursor and '/' not in cursor and '+' not in cursor
+    assert decode_cursor(cursor) == values
+
+
+def test_malformed_cursor_is_a_bad_request(app, login):
+    client = login(1)
+    for cursor in ('not a cursor', encode_cursor([1])[:-2], 'NQ'):
+        assert client.get('/user/my-reservations', query_string={'cursor': cursor}).status_code == 400
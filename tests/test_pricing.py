@@ -0,0 +1,58 @@
+"""
+Fares (pricing.py) computed in SQL for the fare calendar (route x demand in the
+query, finished by day_fare()) must equal the Python fare of listings and quotes
+for every flight, class and distance to departure, including the minimum fare.
+"""
+from datetime import datetime, timedelta
+
+from models import db, Aircraft, Flight
+from pricing import CLASS_MULTIPLIERS, pricing
+
+
+def priced_flights():
+    """(flight, available seats, route x demand computed in SQL) of every flight with seats"""
+    booked = Flight.booked_seats_subquery()
+    booked_seats = db.func.coalesce(booked.c.booked, 0)
+    rows = db.session.query(
+        Flight, Aircraft.capacity - booked_seats,
+        pricing.route_demand_expression(Aircraft.capacity, booked_seats, Flight.duration_minutes),
+    ).join(
+        Aircraft, Flight.aircraft_id == Aircraft.aircraft_id
+    ).outerjoin(
+        booked, booked.c.flight_number == Flight.flight_number
+    ).filter(Aircraft.capacity - booked_seats > 0).all()
+    assert len(rows) > 10
+    return rows
+
+
+def test_sql_and_python_fares_agree(app):
+    with app.app_context():
+        for flight, available, route_demand in priced_flights():
+            departure = flight.departure_time
+            # Departed, on the day, inside and outside the urgency window
+            for days_before in (-3, 0, 5, 20, 21, 60):
+                now = departure - timedelta(days=days_before)
+                for seat_class in CLASS_MULTIPLIERS:
+                    python = pricing.fare_column([flight.aircraft_rel.capacity], [available], [departure],
+                                                 [flight.duration_minutes], now=now, seat_class=seat_class)[0]
+                    sql = pricing.day_fare(route_demand, departure.date(), today=now.date(), seat_class=seat_class)
+                    assert abs(python - sql) < 0.005, (flight.flight_number, days_before, seat_class)
+
+
+def test_minimum_fare_applies_on_both_paths(app, monkeypatch):
+    monkeypatch.setattr(pricing, 'min_fare', 10000.0)
+    with app.app_context():
+        flight, available, route_demand = priced_flights()[0]
+        now = datetime.now()
+        python = pricing.fare_column([flight.aircraft_rel.capacity], [available], [flight.departure_time],
+                                     [flight.duration_minutes], now=now, seat_class='BUSINESS')[0]
+        assert python == pricing.day_fare(route_demand, flight.departure_time.date(), today=now.date(),
+                                          seat_class='BUSINESS') == 25000.0
+
+
+def test_listing_price_matches_quote(app):
+    with app.app_context():
+        now = datetime.now()
+        flights = pricing.price_flights(Flight.with_available_seats(), now=now)
+        for flight in flights:
+            assert flight.price == pricing.compute_quote(flight, now=now)['ECONOMY']
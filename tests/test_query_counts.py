@@ -0,0 +1,46 @@
+"""
+Listing pages eager-load what they render (user_routes.flight_list_options,
+reservation_list_options), so they run the same number of statements however
+many rows they show.
+"""
+from conftest import count_statements
+from models import db, Ticket
+
+
+def statements_for(app, client, path):
+    """(statements run, HTML) of one GET"""
+    with count_statements(app) as executed:
+        response = client.get(path)
+    assert response.status_code == 200
+    return executed[0], response.get_data(as_text=True)
+
+
+def test_results_statement_count_does_not_grow_with_rows(app, login):
+    client = login(1)
+    client.get('/user/results')  # Leaves the per-client first-request work out of the counts
+
+    counts = {}
+    for rows in (1, 5, 25):
+        counts[rows], html = statements_for(app, client, f'/user/results?per_page={rows}')
+        assert html.count('class="card flight-card') == rows
+
+    assert len(set(counts.values())) == 1, counts
+
+
+def test_my_reservations_statement_count_does_not_grow_with_rows(app, login):
+    with app.app_context():
+        tickets = dict(db.session.query(
+            Ticket.passenger_id, db.func.count(Ticket.ticket_number)
+        ).group_by(Ticket.passenger_id).all())
+    fewest = min(tickets, key=tickets.get)
+    most = max(tickets, key=tickets.get)
+    assert tickets[most] > tickets[fewest]
+
+    counts = {}
+    for passenger_id in (fewest, most):
+        client = login(passenger_id)
+        client.get('/user/my-reservations')
+        counts[tickets[passenger_id]], html = statements_for(app, client, '/user/my-reservations?per_page=100')
+        assert html.count('<strong>Route:</strong>') == tickets[passenger_id]
+
+    assert len(set(counts.values())) == 1, counts
@@ -0,0 +1,33 @@
+"""Which existing index counts as serving one of schema.INDEXES (covering_index)"""
+from models import db
+from schema import INDEXES, covering_index, existing_indexes
+
+INDEX = {index.name: index for index in INDEXES}
+
+
+def test_non_unique_index_does_not_serve_a_unique_one():
+    existing = {'IX_OLD_EMAIL': ('PASSENGER', ('EMAIL', 'PASSENGER_ID'), False)}
+    assert covering_index(INDEX['IX_PASSENGER_EMAIL'], existing) is None
+
+    existing['SYS_C001'] = ('PASSENGER', ('EMAIL',), True)
+    assert covering_index(INDEX['IX_PASSENGER_EMAIL'], existing) == 'SYS_C001'
+
+
+def test_unique_index_on_more_columns_does_not_serve_a_unique_one():
+    existing = {'UQ_EMAIL_NAME': ('PASSENGER', ('EMAIL', 'NAME'), True)}
+    assert covering_index(INDEX['IX_PASSENGER_EMAIL'], existing) is None
+
+
+def test_index_on_another_table_does_not_serve():
+    existing = {'IX_PAYMENT_FLIGHT': ('PAYMENT', ('FLIGHT_NUMBER', 'STATUS'), False)}
+    assert covering_index(INDEX['IX_TICKET_FLIGHT_STATUS'], existing) is None
+
+    existing['IX_TICKET_FLIGHT'] = ('TICKET', ('FLIGHT_NUMBER', 'STATUS', 'SEAT_CLASS'), False)
+    assert covering_index(INDEX['IX_TICKET_FLIGHT_STATUS'], existing) == 'IX_TICKET_FLIGHT'
+
+
+def test_created_indexes_serve_themselves(app):
+    with app.app_context():
+        existing = existing_indexes(db.engine)
+    assert existing['IX_PASSENGER_EMAIL'] == ('PASSENGER', ('EMAIL',), True)
+    assert all(covering_index(index, existing) == index.name for index in INDEXES)
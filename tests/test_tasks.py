@@ -0,0 +1,72 @@
+"""
+Post-booking tasks (tasks.py): queuing an idempotency key twice is a no-op, a
+payment task that runs again pays nothing twice, a ticket cancelled before its
+payment runs is not paid, and `tasks reconcile` pays a booking whose own
+payment task failed.
+"""
+from contextlib import closing
+
+from models import db, FlightStats, Payment, Ticket
+from tasks import record_payment_task, task_queue
+
+
+def book(app, client, number, seats):
+    """Book economy seats on the flight; returns the new ticket numbers"""
+    with app.app_context():
+        before = db.session.execute(db.select(db.func.max(Ticket.ticket_number))).scalar()
+    response = client.post(f'/user/reserve/{number}', data={'num_passengers': seats, 'seat_class': 'ECONOMY'})
+    assert response.status_code == 302
+    with app.app_context():
+        return db.session.execute(db.select(Ticket.ticket_number).where(
+            Ticket.flight_number == number, Ticket.ticket_number > before
+        ).order_by(Ticket.ticket_number)).scalars().all()
+
+
+def payments(numbers):
+    return db.session.execute(db.select(Payment.ticket_number, Payment.amount).where(
+        Payment.ticket_number.in_(numbers)
+    ).order_by(Payment.ticket_number)).all()
+
+
+def test_payment_runs_once(app, login, future_flight):
+    future_flight('TSTTASKA', days=30)
+    tickets = book(app, login(10), 'TSTTASKA', 2)
+    # The booking queued it already
+    assert task_queue.enqueue([('record_payment', {'ticket_numbers': tickets}, f'payment:{tickets[0]}')]) == 0
+    task_queue.run_pending()
+
+    with app.app_context():
+        paid = payments(tickets)
+        assert [number for number, _ in paid] == tickets
+        # A retry, or a worker that lost its lease, running the task again
+        record_payment_task(key=f'payment:{tickets[0]}', ticket_numbers=tickets)
+        assert payments(tickets) == paid
+        assert db.session.get(FlightStats, 'TSTTASKA').paid_revenue == sum(amount for _, amount in paid)
+
+
+def test_ticket_cancelled_before_payment_is_not_paid(app, login, future_flight):
+    future_flight('TSTTASKB', days=31)
+    client = login(11)
+    tickets = book(app, client, 'TSTTASKB', 1)
+    assert client.post(f'/user/cancel-ticket/{tickets[0]}').status_code == 302
+    task_queue.run_pending()
+
+    with app.app_context():
+        assert payments(tickets) == []
+        assert db.session.get(FlightStats, 'TSTTASKB').paid_revenue == 0
+
+
+def test_reconcile_pays_booking_whose_payment_failed(app, login, future_flight):
+    future_flight('TSTTASKC', days=32)
+    tickets = book(app, login(12), 'TSTTASKC', 1)
+    with closing(task_queue._connect()) as conn:
+        conn.execute("UPDATE tasks SET status = 'failed' WHERE idempotency_key = ?", (f'payment:{tickets[0]}',))
+
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['tasks', 'reconcile']).exit_code == 0
+    task_queue.run_pending()
+    with app.app_context():
+        assert [number for number, _ in payments(tickets)] == tickets
+    # Queued under reconcile's own key, not the failed booking task's
+    assert task_queue.enqueue([('record_payment', {'ticket_numbers': tickets},
+                                f'reconcile-payment:{tickets[0]}')]) == 0
@@ -0,0 +1,79 @@
+"""
+Passenger snapshots in user_cache.py are dropped when the change commits: not
+at flush time, not after a rollback, and also for bulk UPDATE statements. A
+snapshot read while a change commits is not cached.
+"""
+import pytest
+from flask import Flask
+
+from models import db, Passenger
+from user_cache import user_cache
+
+
+@pytest.fixture
+def cached(app):
+    """user_cache on a memory backend for the test (the app fixture runs without it)"""
+    config = Flask(__name__)
+    config.config['USER_CACHE_BACKEND'] = 'memory'
+    user_cache.init_app(config)
+    try:
+        with app.app_context():
+            yield
+    finally:
+        user_cache.cache = None
+
+
+def cached_name(passenger_id):
+    found, snapshot = user_cache.cache.get(str(passenger_id))
+    return snapshot.full_name if found else None
+
+
+def test_change_drops_snapshot_at_commit_not_at_flush(cached):
+    name = user_cache.load('2').full_name
+    passenger = db.session.get(Passenger, 2)
+    passenger.full_name = 'Renamed Passenger'
+    db.session.flush()
+    # A request loading the passenger now still reads the committed row
+    assert cached_name(2) == name
+
+    db.session.commit()
+    assert cached_name(2) is None
+    assert user_cache.load('2').full_name == 'Renamed Passenger'
+
+
+def test_rolled_back_change_keeps_snapshot(cached):
+    name = user_cache.load('3').full_name
+    db.session.get(Passenger, 3).full_name = 'Never Saved'
+    db.session.flush()
+    db.session.rollback()
+    assert cached_name(3) == name
+
+
+def test_bulk_update_drops_snapshots(cached):
+    user_cache.load('4')
+    user_cache.load('5')
+    db.session.execute(
+        db.update(Passenger).where(Passenger.passenger_id == 4).values(phone='555-0100')
+    )
+    assert cached_name(4) is not None
+    db.session.commit()
+    assert cached_name(4) is None
+    assert cached_name(5) is None
+    assert user_cache.load('4').phone == '555-0100'
+
+
+def test_snapshot_read_during_a_change_is_not_cached(cached, monkeypatch):
+    real_get = db.session.get
+
+    def get_then_change(model, ident):
+        # The row is read, then another request commits a change before the snapshot is stored
+        passenger = real_get(model, ident)
+        name = passenger.full_name
+        user_cache.invalidate(ident)
+        db.session.expunge(passenger)
+        return Passenger(passenger_id=ident, full_name=name)
+
+    monkeypatch.setattr(db.session, 'get', get_then_change)
+    user_cache.load('6')
+    monkeypatch.undo()
+    assert cached_name(6) is None
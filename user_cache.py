@@ -0,0 +1,135 @@
+"""
+Cached user loader for Flask-Login
+
+Flask-Login reloads the logged-in passenger on every request. The loader here
+keeps a PassengerSnapshot (plain data, no session) per passenger for
+USER_CACHE_TTL seconds, so an authenticated page view does not need a
+PASSENGER query first.
+
+Any update or delete of a Passenger row drops its entry once the transaction
+commits: the ids are collected while flushing and dropped in after_commit, so
+no request can cache the old row again between the flush and the commit.
+Bulk UPDATE/DELETE statements on PASSENGER name no rows, so committing one
+drops every snapshot.
+
+Configuration (app.config, defaults read from the environment):
+    USER_CACHE_BACKEND      memory (default), redis or none
+    USER_CACHE_TTL          seconds a snapshot stays valid (default 300)
+    USER_CACHE_MAX_ENTRIES  bound for the memory backend (default 10000)
+    USER_CACHE_REDIS_URL    Redis URL for the redis backend
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+
+from cache import TTLCache, make_backend
+from db_config import env_int
+from models import db, Passenger, PassengerSnapshot
+from replicas import RoutingSession
+
+# session.info key: passenger ids changed in the transaction, or ALL after a bulk statement
+CHANGED_KEY = 'user_cache_changed'
+ALL = 'all'
+
+
+class UserCache:
+    """TTL cache of PassengerSnapshot by passenger id; install with init_app(app)"""
+
+    def __init__(self, app=None):
+        self.cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_BACKEND', os.getenv('USER_CACHE_BACKEND', 'memory'))
+        app.config.setdefault('USER_CACHE_TTL', env_int('USER_CACHE_TTL', 300))
+        app.config.setdefault('USER_CACHE_MAX_ENTRIES', env_int('USER_CACHE_MAX_ENTRIES', 10000))
+        app.config.setdefault('USER_CACHE_REDIS_URL', os.getenv('USER_CACHE_REDIS_URL'))
+
+        backend = app.config['USER_CACHE_BACKEND']
+        if backend == 'none':
+            self.cache = None
+            return
+        self.cache = TTLCache(
+            make_backend(backend, app.config['USER_CACHE_MAX_ENTRIES'],
+                         app.config['USER_CACHE_REDIS_URL'], prefix='flightapp:user:'),
+            app.config['USER_CACHE_TTL'],
+        )
+        if not event.contains(Passenger, 'after_update', self._passenger_changed):
+            event.listen(Passenger, 'after_update', self._passenger_changed)
+            event.listen(Passenger, 'after_delete', self._passenger_changed)
+            event.listen(RoutingSession, 'do_orm_execute', self._statement_executed)
+            event.listen(RoutingSession, 'after_commit', self._committed)
+            event.listen(RoutingSession, 'after_rollback', self._rolled_back)
+
+    def load(self, user_id):
+        """Flask-Login user_loader: snapshot of the passenger, or None"""
+        passenger_id = int(user_id)
+        if self.cache is None:
+            passenger = db.session.get(Passenger, passenger_id)
+            return PassengerSnapshot.from_passenger(passenger) if passenger else None
+
+        found, snapshot = self.cache.get(str(passenger_id))
+        if found:
+            return snapshot
+        # A change committed while the row is read must not be cached over (see cache.py)
+        since = self.cache.generation()
+        passenger = db.session.get(Passenger, passenger_id)
+        if passenger is None:
+            return None
+        snapshot = PassengerSnapshot.from_passenger(passenger)
+        self.cache.set(str(passenger_id), snapshot, since=since)
+        return snapshot
+
+    def invalidate(self, passenger_id):
+        """Drop a passenger's snapshot (call after changing profile data)"""
+        if self.cache is not None:
+            self.cache.delete(str(passenger_id))
+
+    def clear(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    # -- Invalidation at commit ----------------------------------------------
+
+    @staticmethod
+    def _changed(db_session, passenger_id):
+        changed = db_session.info.get(CHANGED_KEY)
+        if changed == ALL:
+            return
+        if passenger_id == ALL:
+            db_session.info[CHANGED_KEY] = ALL
+        else:
+            db_session.info.setdefault(CHANGED_KEY, set()).add(passenger_id)
+
+    def _passenger_changed(self, mapper, connection, passenger):
+        db_session = object_session(passenger)
+        if db_session is None:
+            self.invalidate(passenger.passenger_id)
+        else:
+            self._changed(db_session, passenger.passenger_id)
+
+    def _statement_executed(self, orm_execute_state):
+        # Bulk statements skip the mapper events and may touch any passenger
+        if orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, 'table', None)
+            if table is not None and table.name == Passenger.__tablename__:
+                self._changed(orm_execute_state.session, ALL)
+
+    def _committed(self, db_session):
+        changed = db_session.info.pop(CHANGED_KEY, None)
+        if changed == ALL:
+            self.clear()
+        elif changed:
+            for passenger_id in changed:
+                self.invalidate(passenger_id)
+
+    def _rolled_back(self, db_session):
+        db_session.info.pop(CHANGED_KEY, None)
+
+    def stats(self):
+        return self.cache.stats() if self.cache is not None else {'enabled': False}
+
+
+user_cache = UserCache()
@@ -1,12 +1,118 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-from models import db, Flight, Ticket, Passenger, Airport, Airline, Aircraft, Payment
+from models import db, Flight, FlightSummary, Ticket, TicketChange, Passenger, Airport, Airline, Aircraft, Payment
 from datetime import datetime
-from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload
+from pagination import keyset_page, page_size_from_request
+from airport_index import airport_index, codes_filter
+from schema import day_range
+from search_cache import search_cache
+from inventory import ensure_inventory, take_seats, release_seats, remaining_seats
+from seatmap import SEAT_CLASSES, SeatMapFull, allocate_seats, free_seat
+from analytics import ensure_flight_stats, record_booking, record_cancellation
+from http_cache import http_cache
+from tasks import queue_booking, queue_cancellation
+from replicas import replicas
+from pricing import pricing
+from fare_calendar import CALENDAR_MAX_DAYS, fare_calendar
 
 # Create blueprint for user routes
 user_bp = Blueprint('user', __name__)
 
+# Listing pages run to tens of kilobytes of HTML; gzip them (and JSON) for clients that accept it
+http_cache.compress(user_bp, mimetypes=('text/html', 'application/json'))
+
+
+# Relationships each view renders, loaded up front so a page costs the
+# same number of queries no matter how many rows it shows.
+# (Functions because backrefs like Flight.airline exist only once mappers are configured.)
+def flight_list_options():
+    return (joinedload(Flight.airline),)
+
+
+def flight_detail_options():
+    return (joinedload(Flight.airline), joinedload(Flight.aircraft_rel))
+
+
+def reservation_list_options():
+    return (joinedload(Ticket.flight).joinedload(Flight.airline),)
+
+
+def flight_page(query, cursor=None, page_size=None):
+    """
+    One keyset page of flights with seats, ordered by (departure_time, flight_number),
+    as FlightSummary snapshots.
+    """
+    page = keyset_page(
+        Flight.available_seats_query(query),
+        [Flight.departure_time, Flight.flight_number],
+        key=lambda row: (row[0].departure_time, row[0].flight_number),
+        cursor=cursor,
+        page_size=page_size
+    )
+    # Fares for the whole page in one pass, from the seat counts the query returned
+    flights = pricing.price_flights(Flight.attach_available_seats(page.items))
+    page.items = [FlightSummary.from_flight(f) for f in flights]
+    return page
+
+
+def flight_search_filters(origin_codes=None, destination_codes=None, day=None):
+    """WHERE criteria on FLIGHT for a search (None = no filter)"""
+    criteria = []
+    # Airport codes were resolved in memory, so FLIGHT is filtered with an
+    # indexable IN (...) instead of LIKE scans
+    if origin_codes is not None:
+        criteria.append(codes_filter(Flight.departure_airport, origin_codes))
+    if destination_codes is not None:
+        criteria.append(codes_filter(Flight.arrival_airport, destination_codes))
+    if day is not None:
+        # Half-open range so an index on DEPARTURE_TIME can be used (TRUNC() would defeat it)
+        day_start, day_end = day_range(day)
+        criteria += [Flight.departure_time >= day_start, Flight.departure_time < day_end]
+    return criteria
+
+
+def search_flights(origin_codes=None, destination_codes=None, day=None):
+    """
+    Page of flights with seats matching the criteria (None = no filter), served
+    from the search cache when the same page was asked for recently.
+    """
+    cursor = request.args.get('cursor')
+    page_size = page_size_from_request()
+    
+    def load():
+        query = Flight.query.options(*flight_list_options()).filter(
+            *flight_search_filters(origin_codes, destination_codes, day)
+        )
+        return flight_page(query, cursor, page_size)
+    
+    return search_cache.get_page(
+        load, origin_codes, destination_codes,
+        day.isoformat() if day else None, cursor, page_size
+    )
+
+
+def flight_page_stamp(page):
+    """Version stamp of a page of flights: what each card shows, seat counts included"""
+    return tuple(
+        (f.flight_number, f.available_seats, f.departure_time, f.arrival_time, f.price, f.airline_name)
+        for f in page.items
+    ) + (page.next_cursor,)
+
+
+def reservations_stamp(passenger_id):
+    """
+    (ticket count, latest booking, latest ticket change) of a passenger, in one
+    indexed query; bookings, cancellations and reschedules all move it.
+    """
+    last_change = db.session.query(db.func.max(TicketChange.change_date)).join(
+        Ticket, Ticket.ticket_number == TicketChange.ticket_number
+    ).filter(Ticket.passenger_id == passenger_id).scalar_subquery()
+    return db.session.query(
+        db.func.count(Ticket.ticket_number), db.func.max(Ticket.booking_date), last_change
+    ).filter(Ticket.passenger_id == passenger_id).one()
+
+
 @user_bp.route('/profile')
 @login_required
 def profile():
@@ -14,79 +120,115 @@ def profile():
     User Profile Page
     Displays passenger account information
     """
-    return render_template('profile.html', user=current_user)
+    ticket_count = db.session.query(db.func.count(Ticket.ticket_number)).filter(
+        Ticket.passenger_id == current_user.passenger_id
+    ).scalar()
+    return render_template('profile.html', user=current_user, ticket_count=ticket_count)
 
 
 @user_bp.route('/search', methods=['GET', 'POST'])
 @login_required
+@replicas.read_only
 def search():
     """
     Flight Search Page
     Search for flights in Oracle database
+    The form posts the first page; further pages are GET requests carrying the
+    same criteria plus a cursor.
     """
-    flights = []
-    search_performed = False
+    page = None
+    search_performed = request.method == 'POST' or any(
+        request.args.get(field) for field in ('origin', 'destination', 'date', 'cursor')
+    )
+    criteria = {}
     
-    if request.method == 'POST':
-        search_performed = True
-        origin = request.form.get('origin', '').strip().upper()  # Oracle stores airport codes in uppercase
-        destination = request.form.get('destination', '').strip().upper()
-        date_str = request.form.get('date')
+    if search_performed:
+        origin = request.values.get('origin', '').strip().upper()  # Oracle stores airport codes in uppercase
+        destination = request.values.get('destination', '').strip().upper()
+        date_str = request.values.get('date')
+        criteria = {'origin': origin, 'destination': destination, 'date': date_str or ''}
         
-        # Build query
-        query = Flight.query
-        
-        # Search by departure airport code or city
-        if origin:
-            query = query.join(
-                Airport, Flight.departure_airport == Airport.airport_code
-            ).filter(
-                or_(
-                    Flight.departure_airport.ilike(f'%{origin}%'),
-                    Airport.city.ilike(f'%{origin}%')
-                )
-            )
-        
-        # Search by arrival airport code or city
-        if destination:
-            query = query.join(
-                Airport, Flight.arrival_airport == Airport.airport_code,
-                isouter=False
-            ).filter(
-                or_(
-                    Flight.arrival_airport.ilike(f'%{destination}%'),
-                    Airport.city.ilike(f'%{destination}%')
-                )
-            )
+        # Resolve origin/destination text to airport codes in memory
+        origin_codes = airport_index.match(origin) if origin else None
+        destination_codes = airport_index.match(destination) if destination else None
         
         # Search by date
+        search_date = None
         if date_str:
             try:
                 search_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                query = query.filter(db.func.trunc(Flight.departure_time) == search_date)
             except ValueError:
                 flash('Invalid date format.', 'danger')
         
-        # Filter flights that have available seats
-        flights = [f for f in query.all() if f.available_seats > 0]
+        # One page of flights that have available seats (filtered in the database)
+        page = search_flights(origin_codes, destination_codes, search_date)
         
-        if not flights and search_performed:
+        if not page.items and page.is_first:
             flash('No flights found matching your criteria.', 'info')
     
-    return render_template('search.html', flights=flights, search_performed=search_performed)
+    flights = page.items if page else []
+    return render_template('search.html', flights=flights, page=page,
+                           criteria=criteria, search_performed=search_performed)
+
+
+@user_bp.route('/calendar')
+@login_required
+@replicas.read_only
+def calendar():
+    """
+    Fare Calendar Page
+    Flights with seats, cheapest fare and earliest departure for each day around
+    a date, for one origin/destination pair (one grouped query for all days)
+    """
+    origin = request.args.get('origin', '').strip().upper()
+    destination = request.args.get('destination', '').strip().upper()
+    date_str = request.args.get('date', '')
+    spread = max(0, min(request.args.get('days', 3, type=int), CALENDAR_MAX_DAYS))
+    criteria = {'origin': origin, 'destination': destination, 'date': date_str}
+    
+    days = []
+    if origin and destination and date_str:
+        try:
+            day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            flash('Invalid date format.', 'danger')
+        else:
+            days = fare_calendar(airport_index.match(origin), airport_index.match(destination), day, spread)
+            if not any(entry['flights'] for entry in days):
+                flash('No flights found around this date.', 'info')
+    elif request.args:
+        flash('Enter an origin, a destination and a date.', 'warning')
+    
+    return render_template('calendar.html', days=days, criteria=criteria, spread=spread,
+                           max_days=CALENDAR_MAX_DAYS)
+
+
+@user_bp.route('/airports/autocomplete')
+@login_required
+def airport_autocomplete():
+    """
+    Airport Autocomplete
+    JSON suggestions (code, city, country) for the search form, served from memory
+    """
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify(airport_index.suggest(request.args.get('q', ''), limit=limit))
 
 
 @user_bp.route('/results')
 @login_required
+@replicas.read_only
 def results():
     """
     Flight Results Page
-    Shows all available flights from Oracle database
+    Shows available flights from Oracle database, one page at a time
     """
-    all_flights = Flight.query.all()
-    # Filter to show only flights with available seats
-    flights = [f for f in all_flights if f.available_seats > 0]
-    return render_template('results.html', flights=flights)
+    # Only flights with available seats, counted in a single grouped query
+    page = search_flights()
+    # The page usually comes from the search cache, so a revalidation costs no query
+    unchanged = http_cache.not_modified('results', flight_page_stamp(page))
+    if unchanged is not None:
+        return unchanged
+    return render_template('results.html', flights=page.items, page=page)
 
 
 @user_bp.route('/reserve/<string:flight_number>', methods=['GET', 'POST'])
@@ -96,7 +238,7 @@ def reserve(flight_number):
     Flight Reservation Page
     Books a ticket on the selected flight
     """
-    flight = Flight.query.get_or_404(flight_number)
+    flight = Flight.query.options(*flight_detail_options()).get_or_404(flight_number)
     
     if request.method == 'POST':
         num_passengers = int(request.form.get('num_passengers', 1))
@@ -107,43 +249,67 @@ def reserve(flight_number):
             flash('Number of passengers must be at least 1.', 'danger')
             return render_template('reserve.html', flight=flight)
         
-        if num_passengers > flight.available_seats:
-            flash(f'Only {flight.available_seats} seats available.', 'danger')
+        if seat_class not in SEAT_CLASSES:
+            flash('Invalid seat class.', 'danger')
             return render_template('reserve.html', flight=flight)
         
-        # Calculate price based on class
-        base_price = 200.0  # You can adjust this or get from aircraft/flight
-        if seat_class == 'BUSINESS':
-            base_price *= 2.5
-        elif seat_class == 'FIRST':
-            base_price *= 4.0
+        # Seat inventory and sales summary rows are created from TICKET on the first booking of a flight
+        ensure_inventory(flight)
+        ensure_flight_stats(flight)
         
-        total_cost = base_price * num_passengers
+        # Book at the current fare; if it moved since the page was shown, confirm it first
+        fare = pricing.quote(flight, fresh=True)[seat_class]
+        quoted = request.form.get('quoted_price', type=float)
+        if quoted is not None and seat_class == 'ECONOMY' and abs(quoted - fare) >= 0.005:
+            flight._price = fare
+            flash(f'The fare changed to ${fare:.2f} since the page was loaded. Please confirm the new price.', 'info')
+            return render_template('reserve.html', flight=flight)
+        
+        total_cost = round(fare * num_passengers, 2)
         
         # Create tickets for each passenger
         try:
-            for i in range(num_passengers):
-                # Generate seat number (simplified - you might want more complex logic)
-                row = (len(flight.tickets) + i + 1)
-                seat_letter = chr(65 + (i % 6))  # A, B, C, D, E, F
-                seat_number = f"{row:02d}{seat_letter}"
-                
+            # Atomic conditional decrement: concurrent bookings cannot oversell
+            if not take_seats(flight.flight_number, seat_class, num_passengers):
+                db.session.rollback()
+                remaining = remaining_seats(flight.flight_number).get(seat_class, 0)
+                flash(f'Only {max(remaining, 0)} {seat_class.lower()} seats available.', 'danger')
+                return render_template('reserve.html', flight=flight)
+            
+            # Next free seats from the flight's seat map, side by side for groups
+            seat_numbers = allocate_seats(flight.flight_number, seat_class, num_passengers)
+            
+            booked_at = datetime.now()
+            tickets = []
+            for seat_number in seat_numbers:
                 # Create ticket
                 ticket = Ticket(
                     passenger_id=current_user.passenger_id,
                     flight_number=flight.flight_number,
                     seat_number=seat_number,
                     seat_class=seat_class,
-                    price=base_price,
-                    booking_date=datetime.now(),
+                    price=fare,
+                    booking_date=booked_at,
                     status='ACTIVE'
                 )
                 db.session.add(ticket)
+                tickets.append(ticket)
             
+            record_booking(flight.flight_number, num_passengers, total_cost)
+            db.session.flush()
+            ticket_numbers = [ticket.ticket_number for ticket in tickets]
             db.session.commit()
+            search_cache.flight_changed(flight.flight_number)
+            pricing.flight_changed(flight.flight_number)
+            # Payment, audit rows and the confirmation email run in the background (tasks.py)
+            queue_booking(ticket_numbers, flight, current_user.email, seat_class, seat_numbers,
+                          total_cost, booked_at)
             flash(f'Flight booked successfully! {num_passengers} ticket(s) created. Total: ${total_cost:.2f}', 'success')
             return redirect(url_for('user.my_reservations'))
             
+        except SeatMapFull:
+            db.session.rollback()
+            flash(f'No more {seat_class.lower()} seats can be assigned on this flight.', 'danger')
         except Exception as e:
             db.session.rollback()
             flash('An error occurred while booking the flight. Please try again.', 'danger')
@@ -154,13 +320,36 @@ def reserve(flight_number):
 
 @user_bp.route('/my-reservations')
 @login_required
+@replicas.read_only
 def my_reservations():
     """
     My Tickets/Reservations Page
     Displays all tickets for the current passenger
     """
-    reservations = Ticket.query.filter_by(passenger_id=current_user.passenger_id).order_by(Ticket.booking_date.desc()).all()
-    return render_template('my_reservations.html', reservations=reservations)
+    # Nothing is loaded or rendered when the browser's copy is still current
+    count, last_booking, last_change = reservations_stamp(current_user.passenger_id)
+    unchanged = http_cache.not_modified(
+        'reservations', count, last_booking, last_change,
+        last_modified=max((t for t in (last_booking, last_change) if t is not None), default=None)
+    )
+    if unchanged is not None:
+        return unchanged
+    
+    query = Ticket.query.options(
+        *reservation_list_options()
+    ).filter_by(
+        passenger_id=current_user.passenger_id
+    )
+    # Newest first, one keyset page at a time
+    page = keyset_page(
+        query,
+        [Ticket.booking_date, Ticket.ticket_number],
+        key=lambda ticket: (ticket.booking_date, ticket.ticket_number),
+        cursor=request.args.get('cursor'),
+        page_size=page_size_from_request(),
+        descending=True
+    )
+    return render_template('my_reservations.html', reservations=page.items, page=page)
 
 
 @user_bp.route('/cancel-ticket/<int:ticket_number>', methods=['POST'])
@@ -182,11 +371,30 @@ def cancel_ticket(ticket_number):
         flash('This ticket is already cancelled.', 'info')
         return redirect(url_for('user.my_reservations'))
     
-    # Update ticket status
-    ticket.status = 'CANCELED'
+    # Update ticket status, only if nobody changed it meanwhile
+    previous_status = ticket.status
     
     try:
+        updated = Ticket.query.filter_by(
+            ticket_number=ticket.ticket_number, status=previous_status
+        ).update({'status': 'CANCELED'}, synchronize_session=False)
+        if not updated:
+            db.session.rollback()
+            flash('This ticket was changed in the meantime. Please try again.', 'info')
+            return redirect(url_for('user.my_reservations'))
+        
+        # Only ACTIVE tickets hold a seat in the inventory
+        if previous_status == 'ACTIVE':
+            release_seats(ticket.flight_number, ticket.seat_class)
+            free_seat(ticket.flight_number, ticket.seat_class, ticket.seat_number)
+        record_cancellation(ticket.flight_number, ticket.price, was_active=previous_status == 'ACTIVE')
+        # Dated history row; also what moves the passenger's reservations stamp
+        db.session.add(TicketChange(ticket_number=ticket.ticket_number, change_date=datetime.now(),
+                                    new_status='CANCELED'))
         db.session.commit()
+        search_cache.flight_changed(ticket.flight_number, ticket.flight.departure_airport, seats_freed=True)
+        pricing.flight_changed(ticket.flight_number)
+        queue_cancellation(ticket, current_user.email)
         flash('Ticket cancelled successfully.', 'success')
     except Exception as e:
         db.session.rollback()